@@ -0,0 +1,110 @@
+"""导出峰值内存基准：对比旧版整本加载 + 拼接与新版游标流式导出。
+
+章节文档由惰性生成的模拟游标提供（与 MongoDB 游标一样逐条产出），
+峰值内存用 tracemalloc 统计，只计入导出过程本身的分配。
+
+用法（在 backend 目录下）::
+
+    python benchmarks/bench_export_memory.py --chapters 50 200 800 --chars 6000
+"""
+
+import argparse
+import time
+import tracemalloc
+
+from official_proj.services.novel_export_service import (
+    iter_encoded,
+    iter_novel_text
+)
+
+_WORLD = {
+    "tone": "冷峻",
+    "technology_level": "近未来",
+    "world_rules": ["规则一", "规则二", "规则三"],
+}
+
+
+class _SyntheticChapters:
+    """模拟 chapters 集合：find 返回惰性游标，支持投影。"""
+
+    def __init__(self, count: int, chars: int):
+        self.count = count
+        self.chars = chars
+
+    def _doc(self, number: int) -> dict:
+        body = ("夜色压在城市上空，她听见远处的钟声。" * (self.chars // 18 + 1))
+        body = f"{number}:" + body[: self.chars]
+        return {
+            "_id": f"chapter-{number}",
+            "novel_id": "bench",
+            "chapter_number": number,
+            "title": f"第{number}章标题",
+            "content": body,
+            # 发生过重写的章节会额外保存一份原文。
+            "rewrite_meta": {
+                "reasons": ["节奏拖沓"],
+                "original_title": "原标题",
+                "original_content": body[::-1],
+            },
+        }
+
+    def find(self, projection: dict | None = None):
+        for number in range(1, self.count + 1):
+            doc = self._doc(number)
+            if projection:
+                doc = {k: v for k, v in doc.items() if projection.get(k)}
+            yield doc
+
+
+def _legacy_export(col: _SyntheticChapters) -> int:
+    """旧实现：list_by_novel 全量加载，再拼接为一个大字符串。"""
+    chapters = list(col.find())
+    lines: list[str] = ["小说ID: bench", "主题: bench", "", "世界观设定"]
+    for ch in chapters:
+        lines.append(f"第 {ch.get('chapter_number')} 章 · {ch.get('title')}")
+        lines.append(ch.get("content") or "")
+        lines.append("")
+    content = "\n".join(lines)
+    return len(content.encode("utf-8"))
+
+
+def _streaming_export(col: _SyntheticChapters, gzip: bool) -> int:
+    """新实现：投影游标 + 逐章编码，模拟逐块写出到 socket。"""
+    cursor = col.find({"chapter_number": 1, "title": 1, "content": 1})
+    pieces = iter_novel_text("bench", "bench", _WORLD, cursor)
+    total = 0
+    for block in iter_encoded(pieces, gzip=gzip):
+        total += len(block)
+    return total
+
+
+def _measure(fn, *args) -> tuple[float, float, int]:
+    tracemalloc.start()
+    started = time.perf_counter()
+    size = fn(*args)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024 / 1024, elapsed, size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chapters", type=int, nargs="+", default=[50, 200, 800])
+    parser.add_argument("--chars", type=int, default=6000, help="每章正文字数")
+    args = parser.parse_args()
+
+    print(f"{'chapters':>8} {'variant':>10} {'peak MiB':>10} {'seconds':>8} {'bytes':>12}")
+    for count in args.chapters:
+        col = _SyntheticChapters(count, args.chars)
+        for name, fn, extra in (
+            ("legacy", _legacy_export, ()),
+            ("stream", _streaming_export, (False,)),
+            ("stream+gz", _streaming_export, (True,)),
+        ):
+            peak, elapsed, size = _measure(fn, col, *extra)
+            print(f"{count:>8} {name:>10} {peak:>10.2f} {elapsed:>8.3f} {size:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""每次请求的准备耗时基准：LLM 客户端 + crew 构建。
+
+对比旧方式（每次新建 LLM，即新建 OpenAI 客户端与连接池）与进程级 LLM 模板浅拷贝。
+只统计本地对象构建，不发起网络请求；连接复用带来的 TLS 握手节省另计。
+
+用法（在 backend 目录下）::
+
+    OPENAI_API_KEY=x python benchmarks/bench_request_setup.py --repeat 50
+"""
+
+import argparse
+import os
+import statistics
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault(
+    "OPENAI_API_BASE", "https://dashscope.aliyuncs.com/compatible-mode/v1"
+)
+os.environ.setdefault("MODEL", "qwen-plus")
+
+from official_proj.crews import chapter_crew, compete_crew  # noqa: E402
+from official_proj.services import llm_factory  # noqa: E402
+
+
+def _fresh_llm(tenant=None, usage_tags=None):
+    """旧行为：每次调用都新建 LLM。"""
+    return llm_factory._build_llm(*llm_factory._llm_config())
+
+
+def _chapter_setup():
+    factory = chapter_crew.ChapterCrew()
+    factory.crew()
+    factory.post_writing_crews()
+
+
+def _init_setup():
+    factory = compete_crew.OfficialProj()
+    factory.task_graph()
+    factory.post_writing_crews()
+
+
+def _measure(fn, repeat: int) -> tuple[float, float]:
+    fn()  # 预热（导入、模板创建）
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), max(samples)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    pooled_llm = llm_factory.get_default_llm
+    print(f"{'scenario':<16} {'variant':<10} {'median ms':>10} {'max ms':>8}")
+    for name, setup in (("next_chapter", _chapter_setup), ("init", _init_setup)):
+        for variant, llm_fn in (
+            ("fresh", _fresh_llm),
+            ("pooled", pooled_llm),
+        ):
+            # crew 经 TaskLLMs 按名字引用 llm_factory.get_default_llm，替换后即可切换实现。
+            llm_factory.get_default_llm = llm_fn
+            median, worst = _measure(setup, args.repeat)
+            print(f"{name:<16} {variant:<10} {median:>10.2f} {worst:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
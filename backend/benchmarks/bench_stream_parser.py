@@ -0,0 +1,239 @@
+"""ChapterJsonStreamParser 微基准：对比旧版逐字符实现与新版切片实现。
+
+用法（在 backend 目录下）::
+
+    python benchmarks/bench_stream_parser.py --chars 5000 --chunk 2 --repeat 20
+"""
+
+import argparse
+import json
+import random
+import time
+from typing import Tuple
+
+from official_proj.services.streaming_helpers import ChapterJsonStreamParser
+
+
+class LegacyChapterJsonStreamParser:
+    """旧版逐字符解析器（仅用于对照）。"""
+
+    def __init__(self) -> None:
+        self._buffer = ""
+        self._state = "search"
+        self._pending_key: str | None = None
+        self._current_key: str | None = None
+        self._escape = False
+        self._unicode_buffer: str | None = None
+        self._title = ""
+        self._title_emitted = False
+        self._max_key_len = max(len('"chapter_title"'), len('"content"'))
+
+    def reset(self) -> None:
+        self._buffer = ""
+        self._state = "search"
+        self._pending_key = None
+        self._current_key = None
+        self._escape = False
+        self._unicode_buffer = None
+        self._title = ""
+        self._title_emitted = False
+
+    def feed(self, text: str) -> Tuple[str | None, str]:
+        self._buffer += text
+        title_out: str | None = None
+        content_delta = ""
+        i = 0
+
+        while i < len(self._buffer):
+            ch = self._buffer[i]
+
+            if self._state == "capture":
+                if self._unicode_buffer is not None:
+                    if ch.lower() in "0123456789abcdef":
+                        self._unicode_buffer += ch
+                        if len(self._unicode_buffer) == 4:
+                            try:
+                                decoded = chr(int(self._unicode_buffer, 16))
+                            except ValueError:
+                                decoded = "\\u" + self._unicode_buffer
+                            content_delta, title_out = self._append_char(
+                                decoded, content_delta, title_out
+                            )
+                            self._unicode_buffer = None
+                        i += 1
+                        continue
+                    else:
+                        fallback = "\\u" + self._unicode_buffer + ch
+                        content_delta, title_out = self._append_char(
+                            fallback, content_delta, title_out
+                        )
+                        self._unicode_buffer = None
+                        i += 1
+                        continue
+
+                if self._escape:
+                    if ch == "u":
+                        self._unicode_buffer = ""
+                    else:
+                        decoded = {
+                            "n": "\n",
+                            "r": "\r",
+                            "t": "\t",
+                            "b": "\b",
+                            "f": "\f",
+                            '"': '"',
+                            "\\": "\\",
+                            "/": "/",
+                        }.get(ch, ch)
+                        content_delta, title_out = self._append_char(
+                            decoded, content_delta, title_out
+                        )
+                    self._escape = False
+                    i += 1
+                    continue
+
+                if ch == "\\":
+                    self._escape = True
+                    i += 1
+                    continue
+
+                if ch == '"':
+                    if self._current_key == "chapter_title" and not self._title_emitted:
+                        title_out = self._title
+                        self._title_emitted = True
+                    self._state = "search"
+                    self._current_key = None
+                    i += 1
+                    continue
+
+                content_delta, title_out = self._append_char(
+                    ch, content_delta, title_out
+                )
+                i += 1
+                continue
+
+            if self._state == "wait_value":
+                if ch == '"':
+                    self._state = "capture"
+                    self._current_key = self._pending_key
+                    self._pending_key = None
+                i += 1
+                continue
+
+            if self._buffer.startswith('"chapter_title"', i):
+                self._pending_key = "chapter_title"
+                self._state = "wait_value"
+                i += len('"chapter_title"')
+                continue
+
+            if self._buffer.startswith('"content"', i):
+                self._pending_key = "content"
+                self._state = "wait_value"
+                i += len('"content"')
+                continue
+
+            i += 1
+
+        if self._state == "search":
+            if len(self._buffer) > self._max_key_len:
+                self._buffer = self._buffer[-self._max_key_len :]
+        else:
+            self._buffer = ""
+
+        return title_out, content_delta
+
+    def _append_char(
+        self,
+        ch: str,
+        content_delta: str,
+        title_out: str | None
+    ) -> Tuple[str, str | None]:
+        if self._current_key == "chapter_title":
+            self._title += ch
+        elif self._current_key == "content":
+            content_delta += ch
+        return content_delta, title_out
+
+
+def _build_payload(chars: int, seed: int) -> str:
+    """构造一份接近真实输出的写作 JSON（含换行、引号与 \\u 转义）。"""
+    rng = random.Random(seed)
+    alphabet = "夜色沉沉他推开门走进雨里她轻声说道我们还会再见吗，。！？"
+    pieces: list[str] = []
+    total = 0
+    while total < chars:
+        run = "".join(rng.choice(alphabet) for _ in range(rng.randint(20, 120)))
+        # 对正文片段单独转义，再按需插入原样的 \uXXXX 序列。
+        pieces.append(json.dumps(run, ensure_ascii=False)[1:-1])
+        total += len(run)
+        roll = rng.random()
+        if roll < 0.3:
+            pieces.append("\\n\\n")
+        elif roll < 0.4:
+            pieces.append('\\"对白\\"')
+        elif roll < 0.45:
+            pieces.append("\\u4e2d\\u6587")
+    body = '"' + "".join(pieces) + '"'
+    return '{\n  "chapter_title": "第一章 血夜萤火",\n  "content": ' + body + "\n}"
+
+
+def _chunks(text: str, size: int, rng: random.Random) -> list[str]:
+    """按近似 token 大小切分文本（1~size 个字符随机浮动）。"""
+    out: list[str] = []
+    idx = 0
+    while idx < len(text):
+        step = rng.randint(1, size)
+        out.append(text[idx : idx + step])
+        idx += step
+    return out
+
+
+def _run(parser_cls, chunks: list[str]) -> Tuple[str | None, str, float]:
+    parser = parser_cls()
+    title: str | None = None
+    deltas: list[str] = []
+    start = time.perf_counter()
+    for chunk in chunks:
+        t, delta = parser.feed(chunk)
+        if t:
+            title = t
+        if delta:
+            deltas.append(delta)
+    elapsed = time.perf_counter() - start
+    return title, "".join(deltas), elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chars", type=int, default=5000, help="正文字数")
+    parser.add_argument("--chunk", type=int, default=3, help="单个 chunk 的最大字符数")
+    parser.add_argument("--repeat", type=int, default=20, help="重复次数")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    payload = _build_payload(args.chars, args.seed)
+    expected = json.loads(payload)
+    rng = random.Random(args.seed)
+
+    legacy_total = 0.0
+    new_total = 0.0
+    for _ in range(args.repeat):
+        chunks = _chunks(payload, args.chunk, rng)
+        legacy_title, legacy_content, legacy_time = _run(
+            LegacyChapterJsonStreamParser, chunks
+        )
+        new_title, new_content, new_time = _run(ChapterJsonStreamParser, chunks)
+        # 两种实现的输出必须一致，且与标准 JSON 解析结果相同。
+        assert new_title == legacy_title == expected["chapter_title"]
+        assert new_content == legacy_content == expected["content"]
+        legacy_total += legacy_time
+        new_total += new_time
+
+    print(f"payload: {len(payload)} chars, chunk<= {args.chunk}, repeat={args.repeat}")
+    print(f"legacy : {legacy_total / args.repeat * 1000:8.3f} ms/chapter")
+    print(f"new    : {new_total / args.repeat * 1000:8.3f} ms/chapter")
+    print(f"speedup: {legacy_total / new_total:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+"""生成链路端到端压测：N 个并发用户依次初始化小说并连续续写。
+
+每个虚拟用户注册 / 登录后调用 /novel/init_stream，再调用 --chapters 次
+/novel/next_chapter_stream。统计每个接口的 TTFB（首字节）、首段正文时间与完成时间的
+p50/p95/p99，吞吐量（请求/分钟、章/小时），以及服务进程的 RSS（起始 / 峰值 / 结束）。
+
+需要本地 MongoDB 与 MySQL（连接配置同应用）。LLM 使用 mock_llm_server.py，不消耗 token。
+--spawn 时自动启动模拟 LLM 与应用（uvicorn 单进程）并在结束后关闭；否则压测 --app-url
+上已运行的服务，RSS 需通过 --server-pid 指定。
+
+用法（在 backend 目录下）::
+
+    python benchmarks/load_test.py --spawn --users 20 --chapters 3 --tokens-per-second 60
+    python benchmarks/load_test.py --app-url http://127.0.0.1:8000 --server-pid 12345 --users 50
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+# 路径带上 dashscope.aliyuncs.com，应用会选用 DashScopeOpenAICompletion。
+MOCK_API_PATH = "/dashscope.aliyuncs.com/compatible-mode/v1"
+
+
+@dataclass
+class RequestSample:
+    endpoint: str
+    ok: bool
+    ttfb: float | None = None
+    first_content: float | None = None
+    completed: float = 0.0
+    events: int = 0
+    error: str | None = None
+
+
+@dataclass
+class RssSampler:
+    pid: int | None
+    interval: float = 0.5
+    samples: list[int] = field(default_factory=list)
+
+    def read(self) -> int | None:
+        """读取 /proc/<pid>/status 中的 VmRSS（KB）；非 Linux 或进程不存在时返回 None。"""
+        if self.pid is None:
+            return None
+        try:
+            with open(f"/proc/{self.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1])
+        except OSError:
+            return None
+        return None
+
+    async def run(self) -> None:
+        while True:
+            rss = self.read()
+            if rss is not None:
+                self.samples.append(rss)
+            await asyncio.sleep(self.interval)
+
+    def summary(self) -> dict | None:
+        if not self.samples:
+            return None
+        return {
+            "start_mb": round(self.samples[0] / 1024, 1),
+            "peak_mb": round(max(self.samples) / 1024, 1),
+            "end_mb": round(self.samples[-1] / 1024, 1),
+        }
+
+
+def percentile(values: list[float], pct: float) -> float | None:
+    """最近秩百分位。"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+async def _stream(client: httpx.AsyncClient, endpoint: str, token: str, body: dict) -> RequestSample:
+    """调用一个 NDJSON 流式接口，直到 final / error 或连接结束。"""
+    sample = RequestSample(endpoint=endpoint, ok=False)
+    started = time.perf_counter()
+    try:
+        async with client.stream(
+            "POST",
+            endpoint,
+            json=body,
+            headers={"Authorization": f"Bearer {token}"},
+        ) as response:
+            if response.status_code != 200:
+                await response.aread()
+                sample.error = f"HTTP {response.status_code}: {response.text[:200]}"
+                return sample
+            async for line in response.aiter_lines():
+                now = time.perf_counter() - started
+                if sample.ttfb is None:
+                    sample.ttfb = now
+                if not line.strip():
+                    continue
+                event = json.loads(line)
+                sample.events += 1
+                if event.get("type") == "content_delta" and sample.first_content is None:
+                    sample.first_content = now
+                if event.get("type") == "final":
+                    sample.ok = True
+                elif event.get("type") == "error":
+                    sample.error = event.get("message")
+    except httpx.HTTPError as e:
+        sample.error = f"{type(e).__name__}: {e}"
+    finally:
+        sample.completed = time.perf_counter() - started
+    return sample
+
+
+async def _login(client: httpx.AsyncClient, username: str) -> str:
+    auth = {"username": username, "password": "load-test"}
+    # 用户已存在时注册返回 400，直接登录即可。
+    await client.post("/auth/register", json=auth)
+    response = await client.post("/auth/login", json=auth)
+    response.raise_for_status()
+    return response.json()["data"]["token"]
+
+
+async def _virtual_user(
+    client: httpx.AsyncClient,
+    index: int,
+    run_id: str,
+    chapters: int,
+    samples: list[RequestSample]
+) -> None:
+    try:
+        token = await _login(client, f"load_{run_id}_{index}")
+    except (httpx.HTTPError, KeyError, ValueError) as e:
+        samples.append(RequestSample(endpoint="/auth/login", ok=False, error=str(e)))
+        return
+    novel_id = f"load-{run_id}-{index}"
+    init = await _stream(client, "/novel/init_stream", token, {
+        "novel_id": novel_id,
+        "topic": "末世废土中寻找失落文明的冒险",
+    })
+    samples.append(init)
+    if not init.ok:
+        return
+    for _ in range(chapters):
+        sample = await _stream(client, "/novel/next_chapter_stream", token, {"novel_id": novel_id})
+        samples.append(sample)
+        if not sample.ok:
+            return
+
+
+def _report(samples: list[RequestSample], seconds: float, rss: dict | None) -> dict:
+    report: dict = {"seconds": round(seconds, 1), "endpoints": {}, "rss": rss}
+    for endpoint in sorted({sample.endpoint for sample in samples}):
+        group = [s for s in samples if s.endpoint == endpoint]
+        ok = [s for s in group if s.ok]
+        stats = {
+            "requests": len(group),
+            "ok": len(ok),
+            "errors": len(group) - len(ok),
+            "requests_per_minute": round(len(ok) * 60 / seconds, 2) if seconds else 0.0,
+        }
+        for metric in ("ttfb", "first_content", "completed"):
+            values = [getattr(s, metric) for s in ok if getattr(s, metric) is not None]
+            for pct in (50, 95, 99):
+                value = percentile(values, pct)
+                stats[f"{metric}_p{pct}_s"] = round(value, 3) if value is not None else None
+        errors = [s.error for s in group if s.error]
+        if errors:
+            stats["first_errors"] = errors[:3]
+        report["endpoints"][endpoint] = stats
+    chapters = sum(
+        1 for s in samples
+        if s.ok and s.endpoint in ("/novel/init_stream", "/novel/next_chapter_stream")
+    )
+    report["chapters"] = chapters
+    report["chapters_per_hour"] = round(chapters * 3600 / seconds, 1) if seconds else 0.0
+    return report
+
+
+def _print_report(report: dict) -> None:
+    print(f"\n{report['chapters']} chapters in {report['seconds']}s "
+          f"({report['chapters_per_hour']} chapters/hour)")
+    header = f"{'endpoint':<28} {'ok/req':>8} {'req/min':>8}"
+    for metric in ("ttfb", "first_content", "completed"):
+        header += f" {metric + ' p50/p95/p99 (s)':>30}"
+    print(header)
+    for endpoint, stats in report["endpoints"].items():
+        line = f"{endpoint:<28} {stats['ok']:>3}/{stats['requests']:<4} {stats['requests_per_minute']:>8}"
+        for metric in ("ttfb", "first_content", "completed"):
+            values = [stats[f"{metric}_p{pct}_s"] for pct in (50, 95, 99)]
+            line += f" {'/'.join('-' if v is None else f'{v:.2f}' for v in values):>30}"
+        print(line)
+        for error in stats.get("first_errors", []):
+            print(f"    error: {error}")
+    rss = report["rss"]
+    if rss:
+        print(f"server RSS: start {rss['start_mb']} MB, peak {rss['peak_mb']} MB, end {rss['end_mb']} MB")
+
+
+async def _wait_ready(url: str, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(timeout=2.0) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url)).status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.5)
+    raise RuntimeError(f"{url} not ready after {timeout:.0f}s")
+
+
+def _spawn(args: argparse.Namespace) -> list[subprocess.Popen]:
+    """启动模拟 LLM 与应用进程。"""
+    env = {**os.environ, "PYTHONPATH": str(BACKEND_DIR / "src")}
+    mock = subprocess.Popen([
+        sys.executable, str(BACKEND_DIR / "benchmarks" / "mock_llm_server.py"),
+        "--port", str(args.mock_port),
+        "--tokens-per-second", str(args.tokens_per_second),
+        "--ttft-ms", str(args.ttft_ms),
+        "--chapter-chars", str(args.chapter_chars),
+        "--review-pass-rate", str(args.review_pass_rate),
+    ], env=env)
+    app_env = {
+        **env,
+        "OPENAI_API_BASE": f"http://127.0.0.1:{args.mock_port}{MOCK_API_PATH}",
+        "OPENAI_API_KEY": "mock",
+        "MODEL": os.environ.get("MODEL", "qwen-plus"),
+    }
+    if args.async_streaming:
+        app_env["LLM_ASYNC_STREAMING"] = "1"
+    app = subprocess.Popen([
+        sys.executable, "-m", "uvicorn", "official_proj.api.main:app",
+        "--port", str(args.app_port), "--log-level", "warning",
+    ], env=app_env, cwd=BACKEND_DIR / "src")
+    return [mock, app]
+
+
+def _stop(processes: list[subprocess.Popen], grace: float = 15.0) -> None:
+    for process in reversed(processes):
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=grace)
+        except subprocess.TimeoutExpired:
+            # 关闭阶段可能卡在数据库连接上，超时后强制结束。
+            process.kill()
+            process.wait()
+
+
+async def run(args: argparse.Namespace) -> dict:
+    processes: list[subprocess.Popen] = []
+    app_url = args.app_url
+    server_pid = args.server_pid
+    if args.spawn:
+        processes = _spawn(args)
+        app_url = f"http://127.0.0.1:{args.app_port}"
+        server_pid = processes[1].pid
+        try:
+            await _wait_ready(f"http://127.0.0.1:{args.mock_port}/stats")
+            await _wait_ready(f"{app_url}/openapi.json")
+        except BaseException:
+            _stop(processes)
+            raise
+
+    sampler = RssSampler(server_pid)
+    sampling = asyncio.create_task(sampler.run())
+    samples: list[RequestSample] = []
+    run_id = uuid.uuid4().hex[:8]
+    limits = httpx.Limits(max_connections=args.users * 2)
+    started = time.perf_counter()
+    try:
+        async with httpx.AsyncClient(
+            base_url=app_url,
+            timeout=httpx.Timeout(args.timeout, connect=10.0),
+            limits=limits,
+        ) as client:
+            users = []
+            for index in range(args.users):
+                users.append(asyncio.create_task(
+                    _virtual_user(client, index, run_id, args.chapters, samples)
+                ))
+                if args.ramp_seconds:
+                    await asyncio.sleep(args.ramp_seconds / args.users)
+            await asyncio.gather(*users)
+        seconds = time.perf_counter() - started
+    finally:
+        sampling.cancel()
+        _stop(processes)
+    return _report(samples, seconds, sampler.summary())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10, help="并发虚拟用户数")
+    parser.add_argument("--chapters", type=int, default=2, help="每个用户初始化后续写的章节数")
+    parser.add_argument("--ramp-seconds", type=float, default=0.0, help="在这段时间内逐个启动用户")
+    parser.add_argument("--timeout", type=float, default=1800.0, help="单个流式请求的读超时（秒）")
+    parser.add_argument("--app-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--server-pid", type=int, default=None, help="统计 RSS 的服务进程")
+    parser.add_argument("--json", dest="json_path", default=None, help="另存报告为 JSON")
+    spawn = parser.add_argument_group("--spawn：自动启动模拟 LLM 与应用")
+    spawn.add_argument("--spawn", action="store_true")
+    spawn.add_argument("--app-port", type=int, default=8010)
+    spawn.add_argument("--mock-port", type=int, default=8900)
+    spawn.add_argument("--tokens-per-second", type=float, default=60.0)
+    spawn.add_argument("--ttft-ms", type=float, default=400.0)
+    spawn.add_argument("--chapter-chars", type=int, default=3000)
+    spawn.add_argument("--review-pass-rate", type=float, default=0.7)
+    spawn.add_argument("--async-streaming", action="store_true", help="应用开启 LLM_ASYNC_STREAMING")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    _print_report(report)
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
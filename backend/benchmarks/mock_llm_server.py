@@ -0,0 +1,292 @@
+"""本地 OpenAI 兼容的模拟 LLM 服务：压测生成链路时不消耗真实 token。
+
+按请求中的任务输出结构（json_tasks.py 中的模型）生成中文 JSON，以可配置的首 token
+延迟与 token 速率流式返回：
+
+- 任务结构：crewai 在提示词末尾附带输出模型的 JSON schema，取其 title 即模型名；
+  段落级重写没有 schema，按【原章节段落】识别，edits 的段落区间始终合法；
+  converter 兜底调用则读 response_format；
+- 评审分数按 --review-pass-rate 决定是否达标，以覆盖重写分支；
+- 输出格式为 crewai 无工具 agent 的 ``Thought: … Final Answer: {json}``。
+
+base URL 的路径里带上 dashscope.aliyuncs.com，llm_factory 就会选用
+DashScopeOpenAICompletion，走与线上相同的流式实现（服务端忽略路径前缀）::
+
+    python benchmarks/mock_llm_server.py --port 8900 --tokens-per-second 60 --ttft-ms 400
+    OPENAI_API_BASE=http://127.0.0.1:8900/dashscope.aliyuncs.com/compatible-mode/v1 \\
+        OPENAI_API_KEY=mock uvicorn official_proj.api.main:app
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import typing
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+
+from official_proj.schema import json_tasks
+from official_proj.services.prompt_context import count_tokens
+
+# 名字固定，记忆更新能对应到已设定的角色。
+_NAMES = ["林照", "沈知微", "顾长渊", "苏晚", "陆行舟", "叶青禾"]
+_PLACES = ["旧城码头", "雾隐山", "钟楼废墟", "地下书库", "边境驿站", "雨夜长街"]
+_EMOTIONS = ["警惕", "愤怒", "犹豫", "释然", "不安", "坚定"]
+_SENTENCES = [
+    "夜色像潮水一样漫过{place}，{name}把领口往上拉了拉。",
+    "{name}没有回头，只是把那封信攥得更紧了一些。",
+    "远处传来断断续续的钟声，像是在提醒某个早已失约的人。",
+    "“你早就知道了，对不对？”{name}的声音压得很低。",
+    "风从破碎的窗棂里灌进来，带着铁锈和雨水的气味。",
+    "{name}想起三年前在{place}的那个夜晚，心口又是一阵发紧。",
+    "灯火在水面上碎成一片，谁也说不清下一步会踏进怎样的局。",
+    "脚步声越来越近，{name}屏住呼吸，把手按在了刀柄上。",
+    "那道旧伤在阴雨天里隐隐作痛，提醒着他曾经付出的代价。",
+    "沉默持续了很久，直到烛芯噼啪一声爆开。",
+]
+_TITLE_WORDS = ["血夜萤火", "旧城回声", "雾中来客", "钟楼之约", "无灯之港", "长街夜雨"]
+
+_SCHEMA_MARKER = "following OpenAPI schema:"
+_SPAN_MARKER = "【原章节段落】"
+_PARAGRAPH_RE = re.compile(r"^\[(\d+)\] ", re.M)
+
+_MODELS = {
+    name: value
+    for name, value in vars(json_tasks).items()
+    if isinstance(value, type) and issubclass(value, BaseModel) and value is not BaseModel
+}
+
+
+class MockSettings:
+    def __init__(self, args: argparse.Namespace):
+        self.tokens_per_second = args.tokens_per_second
+        self.ttft = args.ttft_ms / 1000
+        self.chunk_chars = args.chunk_chars
+        self.chapter_chars = args.chapter_chars
+        self.review_pass_rate = args.review_pass_rate
+
+
+class _Generator:
+    """按输出模型生成一份内容合理的随机实例。"""
+
+    def __init__(self, settings: MockSettings, seed: str, prompt: str):
+        self.settings = settings
+        self.random = random.Random(seed)
+        self.prompt = prompt
+
+    def sentence(self) -> str:
+        return self.random.choice(_SENTENCES).format(
+            name=self.random.choice(_NAMES), place=self.random.choice(_PLACES)
+        )
+
+    def paragraph(self, sentences: int = 4) -> str:
+        return "".join(self.sentence() for _ in range(sentences))
+
+    def chapter(self, chars: int) -> str:
+        paragraphs = []
+        while sum(len(p) for p in paragraphs) < chars:
+            paragraphs.append(self.paragraph(self.random.randint(3, 6)))
+        return "\n\n".join(paragraphs)
+
+    def value(self, name: str, annotation):
+        origin = typing.get_origin(annotation)
+        args = typing.get_args(annotation)
+        if origin is typing.Union or type(annotation).__name__ == "UnionType":
+            inner = [arg for arg in args if arg is not type(None)]
+            return self.value(name, inner[0]) if inner else None
+        if origin in (list, typing.List):
+            count = 3 if name != "edits" else 1
+            return [self.value(name, args[0] if args else str) for _ in range(count)]
+        if origin in (dict, typing.Dict) or annotation in (dict, typing.Dict):
+            return {self.random.choice(_NAMES): self.random.choice(["盟友", "宿敌", "旧识"])}
+        if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+            return self.instance(annotation)
+        if annotation is bool:
+            return False
+        if annotation is int:
+            if name.endswith("_score"):
+                passed = self.random.random() < self.settings.review_pass_rate
+                return self.random.randint(7, 9) if passed else self.random.randint(4, 6)
+            return self.random.randint(1, 10)
+        return self.text(name)
+
+    def text(self, name: str) -> str:
+        if name == "content":
+            return self.chapter(self.settings.chapter_chars)
+        if name in ("chapter_title", "title"):
+            return f"第{self.random.randint(1, 99)}章 {self.random.choice(_TITLE_WORDS)}"
+        if name in ("name", "character_name"):
+            return self.random.choice(_NAMES)
+        if name == "location":
+            return self.random.choice(_PLACES)
+        if name == "emotion":
+            return self.random.choice(_EMOTIONS)
+        if name in ("story_overview", "summary"):
+            return self.paragraph(3)
+        return self.sentence()
+
+    def instance(self, model: type[BaseModel]) -> dict:
+        data = {
+            name: self.value(name, field.annotation)
+            for name, field in model.model_fields.items()
+        }
+        if model is json_tasks.ChapterSpanRewriteOutput:
+            data["edits"] = self.edits()
+        return data
+
+    def edits(self) -> list[dict]:
+        # 编号取自提示词中的原文段落，保证区间合法。
+        numbers = [int(n) for n in _PARAGRAPH_RE.findall(self.prompt.split(_SPAN_MARKER)[-1])]
+        total = max(numbers) if numbers else 1
+        start = self.random.randint(1, total)
+        end = min(total, start + self.random.randint(0, 1))
+        return [{
+            "start": start,
+            "end": end,
+            "issue": "节奏拖沓，冲突不够集中",
+            "content": self.paragraph(self.random.randint(3, 5)),
+        }]
+
+
+def _prompt_text(messages: list) -> str:
+    parts = []
+    for message in messages or []:
+        content = message.get("content")
+        if isinstance(content, str):
+            parts.append(content)
+        elif content is not None:
+            parts.append(json.dumps(content, ensure_ascii=False))
+    return "\n".join(parts)
+
+
+def _output_model(body: dict, prompt: str) -> type[BaseModel] | None:
+    """识别本次调用要求的输出模型。"""
+    response_format = body.get("response_format") or {}
+    schema_name = (response_format.get("json_schema") or {}).get("name")
+    if schema_name in _MODELS:
+        return _MODELS[schema_name]
+
+    marker = prompt.rfind(_SCHEMA_MARKER)
+    if marker != -1:
+        rest = prompt[marker + len(_SCHEMA_MARKER):].lstrip()
+        try:
+            schema, _ = json.JSONDecoder().raw_decode(rest)
+            if schema.get("title") in _MODELS:
+                return _MODELS[schema["title"]]
+        except ValueError:
+            pass
+    if _SPAN_MARKER in prompt:
+        return json_tasks.ChapterSpanRewriteOutput
+    return None
+
+
+def _completion_text(settings: MockSettings, body: dict) -> str:
+    """模型输出全文。"""
+    prompt = _prompt_text(body.get("messages"))
+    generator = _Generator(settings, uuid.uuid4().hex, prompt)
+    model = _output_model(body, prompt)
+    if model is None:
+        answer = generator.paragraph(3)
+    else:
+        answer = json.dumps(generator.instance(model), ensure_ascii=False)
+    if body.get("response_format"):
+        # converter 兜底调用只要 JSON 本身。
+        return answer
+    return f"Thought: 我已掌握足够信息，可以给出最终答案。\nFinal Answer: {answer}"
+
+
+def _chunk(completion_id: str, model: str, delta: dict, finish_reason=None, usage=None) -> str:
+    payload = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    if usage is not None:
+        payload["choices"] = []
+        payload["usage"] = usage
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def create_app(settings: MockSettings) -> FastAPI:
+    app = FastAPI(title="mock llm")
+    stats = {"requests": 0, "streams": 0, "completion_tokens": 0}
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    @app.get("/{prefix:path}models")
+    async def list_models(prefix: str):
+        return {"object": "list", "data": [{"id": "mock", "object": "model"}]}
+
+    @app.post("/{prefix:path}chat/completions")
+    async def chat_completions(prefix: str, request: Request):
+        body = await request.json()
+        model = body.get("model") or "mock"
+        text = _completion_text(settings, body)
+        prompt_tokens = count_tokens(_prompt_text(body.get("messages")))
+        completion_tokens = count_tokens(text)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        stats["requests"] += 1
+        stats["completion_tokens"] += completion_tokens
+
+        if not body.get("stream"):
+            await asyncio.sleep(settings.ttft + completion_tokens / settings.tokens_per_second)
+            message = {"role": "assistant", "content": text}
+            return JSONResponse({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+        stats["streams"] += 1
+        include_usage = (body.get("stream_options") or {}).get("include_usage")
+
+        async def stream():
+            await asyncio.sleep(settings.ttft)
+            yield _chunk(completion_id, model, {"role": "assistant", "content": ""})
+            for start in range(0, len(text), settings.chunk_chars):
+                piece = text[start:start + settings.chunk_chars]
+                yield _chunk(completion_id, model, {"content": piece})
+                await asyncio.sleep(count_tokens(piece) / settings.tokens_per_second)
+            yield _chunk(completion_id, model, {}, finish_reason="stop")
+            if include_usage:
+                yield _chunk(completion_id, model, {}, usage=usage)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--tokens-per-second", type=float, default=60.0)
+    parser.add_argument("--ttft-ms", type=float, default=400.0)
+    parser.add_argument("--chunk-chars", type=int, default=8)
+    parser.add_argument("--chapter-chars", type=int, default=3000)
+    parser.add_argument("--review-pass-rate", type=float, default=0.7)
+    args = parser.parse_args()
+    uvicorn.run(create_app(MockSettings(args)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
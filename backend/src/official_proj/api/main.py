@@ -1,13 +1,45 @@
 """FastAPI 应用入口与全局中间件配置。"""
 
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 
 from official_proj.api.routers.auth import router as auth_router
-from official_proj.api.routers.novel import router as novel_router
+from official_proj.api.routers.jobs import router as jobs_router
+from official_proj.api.routers.llm import router as llm_router
+from official_proj.api.routers.novel import job_service, router as novel_router
+from official_proj.services.generation_job_service import JOB_STALE_SECONDS
+from official_proj.services.llm_usage import close_usage_recorder
+
+logger = logging.getLogger(__name__)
+
+
+async def _recover_jobs_periodically():
+    """启动时及之后定期接管中断/无人处理的后台任务。"""
+    while True:
+        try:
+            await run_in_threadpool(job_service.recover)
+        except Exception:
+            logger.exception("generation job recovery failed")
+        await asyncio.sleep(JOB_STALE_SECONDS)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await run_in_threadpool(job_service.job_dao.ensure_indexes)
+    recovery = asyncio.create_task(_recover_jobs_periodically())
+    yield
+    recovery.cancel()
+    # 写出尚在队列中的 LLM 用量记录。
+    await run_in_threadpool(close_usage_recorder)
+
 
 # 创建 FastAPI 应用实例（由 uvicorn 启动）。
-app = FastAPI(title="AI写作平台")
+app = FastAPI(title="AI写作平台", lifespan=lifespan)
 
 # 允许本地 Vite 开发服务器在开发期访问接口。
 app.add_middleware(
@@ -23,3 +55,9 @@ app.include_router(auth_router)
 
 # ✅ 小说 / 写作（需要登录）
 app.include_router(novel_router)
+
+# ✅ 后台生成任务（需要登录）
+app.include_router(jobs_router)
+
+# ✅ LLM 调度、缓存状态与用量统计（需要登录）
+app.include_router(llm_router)
@@ -0,0 +1,92 @@
+"""后台生成任务的查询接口：轮询状态或以 NDJSON 订阅进度事件。"""
+
+import asyncio
+
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+
+from official_proj.api.auth.deps import get_current_user_id
+from official_proj.api.schemas.common import ApiResponse, success
+from official_proj.db.mongo_db.dao.generation_job_dao import (
+    JOB_TERMINAL_STATES,
+    GenerationJobDAO
+)
+from official_proj.db.mongo_db.dao.generation_job_event_dao import GenerationJobEventDAO
+from official_proj.db.mongo_db.mongo import MongoDB
+from official_proj.services.streaming_helpers import ndjson_line
+
+router = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+mongo = MongoDB()
+job_dao = GenerationJobDAO(mongo)
+event_dao = GenerationJobEventDAO(mongo)
+
+# 订阅时轮询 MongoDB 的间隔（秒）。
+_POLL_INTERVAL = 0.5
+
+
+def _get_own_job(job_id: str, user_id: int) -> dict:
+    """读取任务记录并校验归属。"""
+    job = job_dao.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    if job["user_id"] != user_id:
+        raise HTTPException(status_code=403, detail="无权查看该任务")
+    return job
+
+
+def _job_summary(job: dict) -> dict:
+    return {
+        "job_id": job["_id"],
+        "novel_id": job["novel_id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "last_seq": job["last_seq"],
+        "result": job.get("result"),
+        "error": job.get("error"),
+    }
+
+
+@router.get(
+    "/{job_id}",
+    response_model=ApiResponse[dict]
+)
+async def get_job(
+    job_id: str,
+    after_seq: int = 0,
+    user_id: int = Depends(get_current_user_id)
+):
+    """轮询任务状态，并返回 after_seq 之后的进度事件。"""
+    job = await run_in_threadpool(_get_own_job, job_id, user_id)
+    events = await run_in_threadpool(event_dao.list_after, job_id, after_seq)
+    return success(data={**_job_summary(job), "events": events})
+
+
+@router.get("/{job_id}/events")
+async def subscribe_job(
+    job_id: str,
+    after_seq: int = 0,
+    user_id: int = Depends(get_current_user_id)
+):
+    """订阅任务进度（NDJSON），任务结束且事件读完后关闭连接。"""
+    await run_in_threadpool(_get_own_job, job_id, user_id)
+
+    async def stream():
+        cursor = after_seq
+        while True:
+            events = await run_in_threadpool(event_dao.list_after, job_id, cursor)
+            for event in events:
+                cursor = event["seq"]
+                yield ndjson_line(event)
+            if events:
+                continue
+            job = await run_in_threadpool(job_dao.get, job_id)
+            if not job or (
+                job["status"] in JOB_TERMINAL_STATES and cursor >= job["last_seq"]
+            ):
+                return
+            await asyncio.sleep(_POLL_INTERVAL)
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
@@ -0,0 +1,57 @@
+"""LLM 调用的运行状态：调度队列、响应缓存与 token 用量统计。"""
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlmodel import Session
+
+from official_proj.api.auth.deps import get_current_user_id
+from official_proj.api.schemas.common import ApiResponse, success
+from official_proj.db.mongo_db.dao.llm_usage_dao import LLMUsageDAO
+from official_proj.db.mongo_db.mongo import MongoDB
+from official_proj.db.mysql_db.dao.novel_dao import NovelDAO
+from official_proj.db.mysql_db.mysql import get_session
+from official_proj.services.llm_cache import get_llm_cache
+from official_proj.services.llm_scheduler import get_llm_scheduler
+from official_proj.services.llm_usage import get_usage_recorder
+
+router = APIRouter(prefix="/llm", tags=["LLM"])
+
+usage_dao = LLMUsageDAO(MongoDB())
+
+
+@router.get("/scheduler", response_model=ApiResponse[dict])
+def scheduler_stats(user_id: int = Depends(get_current_user_id)):
+    """本进程的调度状态：队列深度、等待时间、在途请求与窗口内 token 数。"""
+    cache = get_llm_cache()
+    return success(data={
+        "scheduler": get_llm_scheduler().stats(),
+        "cache": cache.stats() if cache else None,
+        "usage_writer": get_usage_recorder().stats(),
+    })
+
+
+@router.get("/usage", response_model=ApiResponse[list[dict]])
+def usage_by_novel(user_id: int = Depends(get_current_user_id)):
+    """当前用户各小说的 token 用量与延迟汇总（最近几秒的调用可能尚未写入）。"""
+    return success(data=usage_dao.rollup({"user_id": user_id}, ["novel_id"]))
+
+
+@router.get("/usage/{novel_id}", response_model=ApiResponse[dict])
+def usage_of_novel(
+    novel_id: str,
+    user_id: int = Depends(get_current_user_id),
+    session: Session = Depends(get_session)
+):
+    """单本小说的用量汇总：总计、按任务（agent）、按模型档位与按章节。"""
+    if not NovelDAO(session).get_by_user(novel_id, user_id):
+        raise HTTPException(status_code=403, detail="无权查看该小说")
+    match = {"novel_id": novel_id}
+    total = usage_dao.rollup(match, [])
+    return success(data={
+        "novel_id": novel_id,
+        "total": total[0] if total else None,
+        "by_task": usage_dao.rollup(match, ["task_name", "agent_role"]),
+        "by_profile": usage_dao.rollup(match, ["llm_profile", "model"]),
+        "by_chapter": usage_dao.rollup(
+            match, ["chapter_number"], sort={"_id.chapter_number": 1}
+        ),
+    })
@@ -1,6 +1,11 @@
 """小说相关接口：初始化、续写、流式输出、导出等。"""
 
-from fastapi import APIRouter, HTTPException, Depends, Response
+import os
+import uuid
+from functools import partial
+
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse
 from sqlmodel import Session
 from official_proj.db.mysql_db.mysql import get_session
@@ -8,28 +13,53 @@ from official_proj.api.auth.deps import get_current_user_id
 from official_proj.db.mysql_db.dao.novel_dao import NovelDAO
 from official_proj.db.mongo_db.mongo import MongoDB
 from official_proj.db.mongo_db.dao.chapter_dao import ChapterDAO
+from official_proj.db.mongo_db.dao.chapter_review_dao import ChapterReviewDAO
 from official_proj.db.mongo_db.dao.plot_summary_dao import PlotSummaryDAO
 from official_proj.db.mongo_db.dao.world_setting_dao import WorldSettingDAO
 from official_proj.services.crew_persist_runner import CrewPersistRunner
 from official_proj.services.chapter_loop_runner import ChapterLoopRunner
-from official_proj.services.streaming_helpers import (
-    ChapterJsonStreamParser,
-    ndjson_line
+from official_proj.services.export_cache import EXPORT_FORMATS, NovelExportCache
+from official_proj.services.generation_events import (
+    aiter_next_chapter_events,
+    iter_init_events,
+    iter_next_chapter_events
+)
+from official_proj.services.generation_guard import (
+    GenerationInProgressError,
+    NovelGenerationGuard
+)
+from official_proj.services.generation_job_service import GenerationJobService
+from official_proj.services.generation_pool import iterate_in_pool
+from official_proj.services.generation_sessions import (
+    GenerationSession,
+    generation_registry
 )
+from official_proj.services.novel_export_service import (
+    EXPORT_BATCH_SIZE,
+    iter_encoded,
+    iter_file,
+    iter_novel_text
+)
+from official_proj.services.prompt_context import assemble_chapter_context
+from official_proj.services.streaming_helpers import ndjson_line
 from official_proj.utils.task_outputs import extract_writing, select_review
-from official_proj.services.knowledge_cleanup import cleanup_generated_knowledge
-from official_proj.crews.compete_crew import OfficialProj
-from official_proj.crews.chapter_crew import ChapterCrew
-from official_proj.services.chapter_persist_service import persist_chapter_result
 from official_proj.api.schemas.novel import (
+    ChapterBatchRequest,
     InitNovelRequest,
     NextChapterRequest,
+    ResumeStreamRequest,
     ChapterResponse,
+    ChapterDetail,
+    ChapterIndexItem,
+    ChapterIndexPage,
     InitResponse
 )
 from official_proj.api.schemas.common import ApiResponse, success
 
 
+# 续写流是否走异步 LLM 链路（AsyncOpenAI + crew.akickoff）。
+LLM_ASYNC_STREAMING = os.getenv("LLM_ASYNC_STREAMING", "0").lower() in ("1", "true", "yes")
+
 # 路由注册：统一 /novel 前缀。
 router = APIRouter(prefix="/novel", tags=["Novel"])
 
@@ -40,51 +70,22 @@ chapter_runner = ChapterLoopRunner(mongo)
 chapter_dao = ChapterDAO(mongo)
 world_dao = WorldSettingDAO(mongo)
 plot_dao = PlotSummaryDAO(mongo)
+review_dao = ChapterReviewDAO(mongo)
+job_service = GenerationJobService(mongo)
+generation_guard = NovelGenerationGuard(mongo)
+export_cache = NovelExportCache(mongo)
 
 
-def _chunk_text(chunk) -> str:
-    """从流式 chunk 中尽量提取文本字段。"""
-    for attr in ("content", "delta", "text", "chunk", "raw"):
-        value = getattr(chunk, attr, None)
-        if not value:
-            continue
-        if isinstance(value, bytes):
-            try:
-                return value.decode("utf-8")
-            except Exception:
-                continue
-        if isinstance(value, dict):
-            for key in ("content", "text", "delta"):
-                inner = value.get(key)
-                if isinstance(inner, str) and inner:
-                    return inner
-            continue
-        if isinstance(value, str):
-            return value
-    return ""
-
-
-def _task_outputs_from_result(result, fallback_tasks: list | None = None) -> dict:
-    """从 crew 结果中构建 task_outputs 字典（带回退逻辑）。"""
-    task_outputs: dict = {}
-    if result is not None and getattr(result, "tasks_output", None):
-        for output in result.tasks_output:
-            name = getattr(output, "name", None)
-            if name:
-                task_outputs[name] = output
-    if not task_outputs and fallback_tasks:
-        task_outputs = {
-            task.name: task.output
-            for task in fallback_tasks
-            if task.name and task.output is not None
-        }
-    return task_outputs
+def _in_progress() -> HTTPException:
+    """同一小说已有生成进行中（本进程的其他类型生成，或其他 worker）。"""
+    return HTTPException(status_code=409, detail="该小说正在生成中，请稍后重试")
+
 
+async def _ndjson_subscribe(session: GenerationSession, after_seq: int = 0):
+    """订阅生成会话并编码为 NDJSON（断开连接不影响生成本身）。"""
+    async for event in session.subscribe(after_seq):
+        yield ndjson_line(event)
 
-def _stream_content_chunks(content: str, chunk_size: int = 200):
-    """将完整正文切成小块，用于流式回传。"""
-    for idx in range(0, len(content), chunk_size):
-        yield content[idx : idx + chunk_size]
 
 @router.post("/init", response_model=ApiResponse[InitResponse])
 def init_novel(
@@ -119,7 +120,8 @@ def init_novel(
     # 4️⃣ 真正初始化（只会执行一次）
     task_outputs=init_runner.run({
         "novel_id": req.novel_id,
-        "topic": req.topic
+        "topic": req.topic,
+        "user_id": user_id
     })
     # 提取最终正文、评审与世界观结果。
     writing_pack = extract_writing(task_outputs)
@@ -161,18 +163,18 @@ def generate_next_chapter(
         )
 
     # 业务执行：调用章节生成流程。
-    task_outputs = chapter_runner.run_one_chapter(req.novel_id)
+    try:
+        chapter_number, task_outputs = chapter_runner.run_one_chapter(
+            req.novel_id, user_id=user_id
+        )
+    except GenerationInProgressError:
+        raise _in_progress()
     writing_pack = extract_writing(task_outputs)
     final_review = select_review(task_outputs)
 
-    last_chapter = mongo.db.chapters.find_one(
-        {"novel_id": req.novel_id},
-        sort=[("chapter_number", -1)]
-    )
-
     data = ChapterResponse(
         novel_id=req.novel_id,
-        chapter_number=last_chapter["chapter_number"],
+        chapter_number=chapter_number,
         title=writing_pack.final_title,
         content=writing_pack.final_content,
         review=final_review.dict()
@@ -185,13 +187,12 @@ def generate_next_chapter(
     )
 
 
-@router.post("/init_stream")
-def init_novel_stream(
+def _prepare_init_stream(
     req: InitNovelRequest,
-    user_id: int = Depends(get_current_user_id),
-    session: Session = Depends(get_session)
-):
-    """初始化小说（流式）：边生成边输出标题与正文增量。"""
+    user_id: int,
+    session: Session
+) -> bool:
+    """校验/创建小说记录，返回是否已初始化（阻塞 IO，需在线程池中调用）。"""
     novel_dao = NovelDAO(session)
     novel = novel_dao.get(req.novel_id)
 
@@ -205,11 +206,25 @@ def init_novel_stream(
         if novel.user_id != user_id:
             raise HTTPException(status_code=403, detail="无权初始化该小说")
 
+    return bool(mongo.db.world_settings.find_one({"novel_id": req.novel_id}))
+
+
+@router.post("/init_stream")
+async def init_novel_stream(
+    req: InitNovelRequest,
+    user_id: int = Depends(get_current_user_id),
+    session: Session = Depends(get_session)
+):
+    """初始化小说（流式）：边生成边输出标题与正文增量。"""
+    initialized = await run_in_threadpool(
+        _prepare_init_stream, req, user_id, session
+    )
+
     # 已初始化则直接返回 final。
-    if mongo.db.world_settings.find_one({"novel_id": req.novel_id}):
-        def already_init():
+    if initialized:
+        async def already_init():
             yield ndjson_line(
-                {"type": "final", "data": {"novel_id": req.novel_id}}
+                {"seq": 1, "type": "final", "data": {"novel_id": req.novel_id}}
             )
         return StreamingResponse(
             already_init(),
@@ -218,127 +233,50 @@ def init_novel_stream(
 
     inputs = {
         "novel_id": req.novel_id,
-        "topic": req.topic
+        "topic": req.topic,
+        "user_id": user_id
     }
 
-    def stream():
-        """流式生成器：输出 progress / title / content_delta / final。"""
-        crew = OfficialProj().crew()
-        crew.stream = True
-        parser = ChapterJsonStreamParser()
-        rewrite_parser = ChapterJsonStreamParser()
-        seen_tasks: set[str] = set()
-        draft_started = False
-        rewrite_started = False
-        rewrite_mode = False
-        sent_delta = False
-
-        try:
-            streaming = crew.kickoff(inputs=inputs)
-            for chunk in streaming:
-                # 发送进度：每个任务只发一次。
-                task_name = getattr(chunk, "task_name", "") or ""
-                agent_role = getattr(chunk, "agent_role", "") or ""
-                if task_name and task_name not in seen_tasks:
-                    seen_tasks.add(task_name)
-                    yield ndjson_line({"type": "progress", "task": task_name})
-
-                # 提取文本片段，无法解析则跳过。
-                text = _chunk_text(chunk)
-                if not text:
-                    continue
-
-                # 发现重写任务或 fail_reasons 则进入重写模式。
-                if task_name == "chapter_rewrite_task" or '"fail_reasons"' in text:
-                    rewrite_mode = True
-
-                if not rewrite_mode:
-                    # 普通写作模式：解析标题与正文增量。
-                    is_writing = (
-                        task_name == "writing_task"
-                        or agent_role == "专业小说写手"
-                        or not draft_started
-                    )
-                    if is_writing:
-                        title, delta = parser.feed(text)
-                        if (title or delta) and not draft_started:
-                            draft_started = True
-                            yield ndjson_line({"type": "draft_start"})
-                        if title:
-                            yield ndjson_line({"type": "title", "data": title})
-                        if delta:
-                            sent_delta = True
-                            yield ndjson_line({"type": "content_delta", "data": delta})
-
-                if rewrite_mode:
-                    # 重写模式：解析重写后的标题与正文增量。
-                    title, delta = rewrite_parser.feed(text)
-                    if (title or delta) and not rewrite_started:
-                        rewrite_started = True
-                        yield ndjson_line({"type": "rewrite_start"})
-                    if title:
-                        yield ndjson_line({"type": "title", "data": title})
-                    if delta:
-                        sent_delta = True
-                        yield ndjson_line({"type": "content_delta", "data": delta})
-
-            # 生成完成后，从结果中抽取 task_outputs 并持久化。
-            result = streaming.result
-            task_outputs = _task_outputs_from_result(result, crew.tasks)
-            init_runner.persist_outputs(inputs, task_outputs)
-
-            # 组装最终返回数据。
-            writing_pack = extract_writing(task_outputs)
-            world_settings = task_outputs["world_building_task"].pydantic
-            review_output = select_review(task_outputs)
-
-            if not sent_delta:
-                # 若没有任何增量输出，则补发完整内容。
-                writing_output = writing_pack.writing_output
-                rewrite_output = writing_pack.rewrite_output
-                if not draft_started:
-                    draft_started = True
-                    yield ndjson_line({"type": "draft_start"})
-                if writing_output.chapter_title:
-                    yield ndjson_line({"type": "title", "data": writing_output.chapter_title})
-                for piece in _stream_content_chunks(writing_output.content or ""):
-                    yield ndjson_line({"type": "content_delta", "data": piece})
-                if rewrite_output:
-                    yield ndjson_line({"type": "rewrite_start"})
-                    if rewrite_output.chapter_title:
-                        yield ndjson_line({"type": "title", "data": rewrite_output.chapter_title})
-                    for piece in _stream_content_chunks(rewrite_output.content or ""):
-                        yield ndjson_line({"type": "content_delta", "data": piece})
-
-            # 最终响应：包含标题/正文/评审/重写信息。
-            data = InitResponse(
-                novel_id=req.novel_id,
-                chapter_number=1,
-                title=writing_pack.final_title,
-                content=writing_pack.final_content,
-                world_rules=world_settings.world_rules,
-                review=review_output.dict()
-                if review_output else None,
-                rewrite=writing_pack.rewrite_info
+    async with generation_registry.lock(req.novel_id):
+        # 同一小说的重复请求直接加入进行中的生成，从头回放事件。
+        generation = generation_registry.get_active(req.novel_id)
+        if generation is not None and generation.label != "init":
+            raise _in_progress()
+        if generation is None:
+            generation_id = str(uuid.uuid4())
+            try:
+                await run_in_threadpool(
+                    generation_guard.acquire, req.novel_id, generation_id, "init"
+                )
+            except GenerationInProgressError:
+                raise _in_progress()
+
+            stream = partial(
+                generation_guard.guarded_events,
+                req.novel_id,
+                generation_id,
+                partial(iter_init_events, mongo, inputs)
             )
-            yield ndjson_line({"type": "final", "data": data.dict()})
-        except Exception as e:
-            # 捕获异常并以流式错误返回。
-            yield ndjson_line({"type": "error", "message": str(e)})
-        finally:
-            # 清理由 crew 生成的知识文件。
-            cleanup_generated_knowledge()
 
-    return StreamingResponse(stream(), media_type="application/x-ndjson")
+            # crew 在生成线程池中运行，事件写入会话缓冲；响应端仅以协程订阅。
+            generation = generation_registry.start(
+                req.novel_id,
+                iterate_in_pool(stream),
+                label="init",
+                generation_id=generation_id
+            )
+    return StreamingResponse(
+        _ndjson_subscribe(generation),
+        media_type="application/x-ndjson"
+    )
 
 
-@router.post("/next_chapter_stream")
-def next_chapter_stream(
+def _prepare_next_chapter_stream(
     req: NextChapterRequest,
-    user_id: int = Depends(get_current_user_id),
-    session: Session = Depends(get_session)
-):
-    """生成下一章（流式）：边生成边返回正文增量。"""
+    user_id: int,
+    session: Session
+) -> dict:
+    """权限校验并组装续写输入（阻塞 IO，需在线程池中调用）。"""
     novel_dao = NovelDAO(session)
 
     if not novel_dao.get_by_user(req.novel_id, user_id):
@@ -347,10 +285,6 @@ def next_chapter_stream(
             detail="无权操作该小说"
         )
 
-    # 推算下一章的章节号。
-    last = chapter_dao.get_last_chapter(req.novel_id)
-    chapter_number = 1 if not last else last["chapter_number"] + 1
-
     # 世界观必须存在，否则无法生成续章。
     world = world_dao.get_latest(req.novel_id)
     if not world:
@@ -363,125 +297,300 @@ def next_chapter_stream(
         if last_plot_doc else []
     )
 
-    inputs = {
+    # 章节号在获取生成租约后再分配；世界观与剧情按任务预算裁剪。
+    return {
         "novel_id": req.novel_id,
-        "chapter_number": chapter_number,
-        "world": world,
-        "last_plot": last_plot,
+        "user_id": user_id,
+        **assemble_chapter_context(world, last_plot),
     }
 
-    def stream():
-        """流式生成器：progress / title / content_delta / final。"""
-        crew = ChapterCrew().crew()
-        crew.stream = True
-        parser = ChapterJsonStreamParser()
-        rewrite_parser = ChapterJsonStreamParser()
-        seen_tasks: set[str] = set()
-        draft_started = False
-        rewrite_started = False
-        rewrite_mode = False
-        sent_delta = False
-
-        try:
-            streaming = crew.kickoff(inputs=inputs)
-            for chunk in streaming:
-                # 发送进度：每个任务只发一次。
-                task_name = getattr(chunk, "task_name", "") or ""
-                agent_role = getattr(chunk, "agent_role", "") or ""
-                if task_name and task_name not in seen_tasks:
-                    seen_tasks.add(task_name)
-                    yield ndjson_line({"type": "progress", "task": task_name})
-
-                # 提取可读文本内容。
-                text = _chunk_text(chunk)
-                if not text:
-                    continue
-
-                # 识别是否进入重写阶段。
-                if task_name == "chapter_rewrite_task" or '"fail_reasons"' in text:
-                    rewrite_mode = True
-
-                if not rewrite_mode:
-                    # 普通写作：解析标题与正文增量。
-                    is_writing = (
-                        task_name == "writing_task"
-                        or agent_role == "专业小说写手"
-                        or not draft_started
-                    )
-                    if is_writing:
-                        title, delta = parser.feed(text)
-                        if (title or delta) and not draft_started:
-                            draft_started = True
-                            yield ndjson_line({"type": "draft_start"})
-                        if title:
-                            yield ndjson_line({"type": "title", "data": title})
-                        if delta:
-                            sent_delta = True
-                            yield ndjson_line({"type": "content_delta", "data": delta})
-
-                if rewrite_mode:
-                    # 重写阶段：解析重写后的标题与正文增量。
-                    title, delta = rewrite_parser.feed(text)
-                    if (title or delta) and not rewrite_started:
-                        rewrite_started = True
-                        yield ndjson_line({"type": "rewrite_start"})
-                    if title:
-                        yield ndjson_line({"type": "title", "data": title})
-                    if delta:
-                        sent_delta = True
-                        yield ndjson_line({"type": "content_delta", "data": delta})
-
-            # 生成完成后持久化章节内容与评审。
-            result = streaming.result
-            task_outputs = _task_outputs_from_result(result, crew.tasks)
-            persist_chapter_result(
-                mongo=mongo,
-                novel_id=req.novel_id,
-                chapter_number=chapter_number,
-                task_outputs=task_outputs
-            )
 
-            # 组装最终响应。
-            writing_pack = extract_writing(task_outputs)
-            review_output = select_review(task_outputs)
-
-            if not sent_delta:
-                # 若没有输出增量，则补发完整正文。
-                writing_output = writing_pack.writing_output
-                rewrite_output = writing_pack.rewrite_output
-                if not draft_started:
-                    draft_started = True
-                    yield ndjson_line({"type": "draft_start"})
-                if writing_output.chapter_title:
-                    yield ndjson_line({"type": "title", "data": writing_output.chapter_title})
-                for piece in _stream_content_chunks(writing_output.content or ""):
-                    yield ndjson_line({"type": "content_delta", "data": piece})
-                if rewrite_output:
-                    yield ndjson_line({"type": "rewrite_start"})
-                    if rewrite_output.chapter_title:
-                        yield ndjson_line({"type": "title", "data": rewrite_output.chapter_title})
-                    for piece in _stream_content_chunks(rewrite_output.content or ""):
-                        yield ndjson_line({"type": "content_delta", "data": piece})
-
-            # 发送最终结果（包含评审与重写信息）。
-            data = ChapterResponse(
-                novel_id=req.novel_id,
-                chapter_number=chapter_number,
-                title=writing_pack.final_title,
-                content=writing_pack.final_content,
-                review=review_output.dict()
-                if review_output else None,
-                rewrite=writing_pack.rewrite_info
+def _claim_next_chapter(novel_id: str, generation_id: str) -> int:
+    """获取生成租约并原子分配章节号（阻塞 IO，需在线程池中调用）。"""
+    generation_guard.acquire(novel_id, generation_id, "next_chapter")
+    try:
+        return generation_guard.allocate_chapter_number(novel_id)
+    except Exception:
+        generation_guard.release(novel_id, generation_id)
+        raise
+
+
+@router.post("/next_chapter_stream")
+async def next_chapter_stream(
+    req: NextChapterRequest,
+    user_id: int = Depends(get_current_user_id),
+    session: Session = Depends(get_session)
+):
+    """生成下一章（流式）：边生成边返回正文增量。"""
+    inputs = await run_in_threadpool(
+        _prepare_next_chapter_stream, req, user_id, session
+    )
+
+    async with generation_registry.lock(req.novel_id):
+        # 同一小说的重复请求直接加入进行中的生成，从头回放事件。
+        generation = generation_registry.get_active(req.novel_id)
+        if generation is not None and generation.label != "next_chapter":
+            raise _in_progress()
+        if generation is None:
+            generation_id = str(uuid.uuid4())
+            try:
+                chapter_number = await run_in_threadpool(
+                    _claim_next_chapter, req.novel_id, generation_id
+                )
+            except GenerationInProgressError:
+                raise _in_progress()
+            inputs["chapter_number"] = chapter_number
+
+            if LLM_ASYNC_STREAMING:
+                # crew 以 akickoff 直接在事件循环上运行，不占用生成线程池。
+                events = generation_guard.aguarded_events(
+                    req.novel_id,
+                    generation_id,
+                    partial(aiter_next_chapter_events, mongo, inputs),
+                    chapter_number
+                )
+            else:
+                # crew 在生成线程池中运行，事件写入会话缓冲；响应端仅以协程订阅。
+                events = iterate_in_pool(partial(
+                    generation_guard.guarded_events,
+                    req.novel_id,
+                    generation_id,
+                    partial(iter_next_chapter_events, mongo, inputs),
+                    chapter_number
+                ))
+
+            generation = generation_registry.start(
+                req.novel_id,
+                events,
+                label="next_chapter",
+                generation_id=generation_id
             )
-            yield ndjson_line({"type": "final", "data": data.dict()})
-        except Exception as e:
-            # 异常转为流式错误消息。
-            yield ndjson_line({"type": "error", "message": str(e)})
-        finally:
-            # 清理生成过程中的知识文件。
-            cleanup_generated_knowledge()
-
-    return StreamingResponse(stream(), media_type="application/x-ndjson")
+    return StreamingResponse(
+        _ndjson_subscribe(generation),
+        media_type="application/x-ndjson"
+    )
+
+
+@router.post(
+    "/init_job",
+    response_model=ApiResponse[dict]
+)
+async def submit_init_job(
+    req: InitNovelRequest,
+    user_id: int = Depends(get_current_user_id),
+    session: Session = Depends(get_session)
+):
+    """提交初始化后台任务，立即返回 job id（进度见 /jobs/{job_id}）。"""
+    initialized = await run_in_threadpool(
+        _prepare_init_stream, req, user_id, session
+    )
+    if initialized:
+        raise HTTPException(status_code=400, detail="小说已初始化")
+
+    job = await run_in_threadpool(
+        job_service.submit,
+        "init",
+        req.novel_id,
+        user_id,
+        {"novel_id": req.novel_id, "topic": req.topic, "user_id": user_id}
+    )
+    return success(data={"job_id": job["_id"]}, msg="任务已提交")
+
+
+@router.post(
+    "/next_chapter_job",
+    response_model=ApiResponse[dict]
+)
+async def submit_next_chapter_job(
+    req: NextChapterRequest,
+    user_id: int = Depends(get_current_user_id),
+    session: Session = Depends(get_session)
+):
+    """提交续写后台任务，立即返回 job id（进度见 /jobs/{job_id}）。"""
+    inputs = await run_in_threadpool(
+        _prepare_next_chapter_stream, req, user_id, session
+    )
+    job = await run_in_threadpool(
+        job_service.submit, "next_chapter", req.novel_id, user_id, inputs
+    )
+    return success(data={"job_id": job["_id"]}, msg="任务已提交")
+
+
+def _prepare_chapter_batch(
+    req: ChapterBatchRequest,
+    user_id: int,
+    session: Session
+) -> dict:
+    """权限校验并计算批量续写的目标章节号（阻塞 IO，需在线程池中调用）。"""
+    if not NovelDAO(session).get_by_user(req.novel_id, user_id):
+        raise HTTPException(
+            status_code=403,
+            detail="无权操作该小说"
+        )
+    if not world_dao.get_latest(req.novel_id):
+        raise HTTPException(status_code=400, detail="世界观未初始化")
+    return {
+        "novel_id": req.novel_id,
+        "user_id": user_id,
+        "count": req.count,
+        "until_chapter": chapter_runner.batch_target(req.novel_id, req.count),
+    }
+
+
+@router.post(
+    "/next_chapters_job",
+    response_model=ApiResponse[dict]
+)
+async def submit_chapter_batch_job(
+    req: ChapterBatchRequest,
+    user_id: int = Depends(get_current_user_id),
+    session: Session = Depends(get_session)
+):
+    """提交批量续写后台任务：章节间流水线执行，结果中包含吞吐量（章/小时）。"""
+    inputs = await run_in_threadpool(
+        _prepare_chapter_batch, req, user_id, session
+    )
+    job = await run_in_threadpool(
+        job_service.submit, "chapter_batch", req.novel_id, user_id, inputs
+    )
+    return success(data={"job_id": job["_id"]}, msg="任务已提交")
+
+
+@router.post("/resume_stream")
+async def resume_stream(
+    req: ResumeStreamRequest,
+    user_id: int = Depends(get_current_user_id),
+    session: Session = Depends(get_session)
+):
+    """断线续传：回放 last_seq 之后的事件，然后继续跟随正在进行的生成。"""
+    novel_dao = NovelDAO(session)
+    novel = await run_in_threadpool(novel_dao.get_by_user, req.novel_id, user_id)
+    if not novel:
+        raise HTTPException(
+            status_code=403,
+            detail="无权操作该小说"
+        )
+
+    generation = generation_registry.get(req.novel_id)
+    if not generation:
+        raise await run_in_threadpool(_resume_unavailable, req.novel_id, user_id)
+
+    return StreamingResponse(
+        _ndjson_subscribe(generation, req.last_seq),
+        media_type="application/x-ndjson"
+    )
+
+
+def _resume_unavailable(novel_id: str, user_id: int) -> HTTPException:
+    """本 worker 没有该小说的生成会话：区分“在别处进行中”与“没有可续传的生成”。"""
+    holder = generation_guard.active_holder(novel_id)
+    if holder is None:
+        return HTTPException(status_code=404, detail="没有可续传的生成任务")
+
+    job = job_service.job_dao.get(holder)
+    if job is not None and job["user_id"] == user_id:
+        # 后台任务的事件在 MongoDB 中，任何 worker 都能订阅。
+        return HTTPException(
+            status_code=409,
+            detail=f"该生成是后台任务，请通过 GET /jobs/{holder}/events 订阅进度",
+            headers={"Location": f"/jobs/{holder}/events"}
+        )
+    # 流式会话只在启动它的进程内。
+    return HTTPException(
+        status_code=409,
+        detail=(
+            "该生成在其他 worker 上进行，无法在此续传：流式续传需要按小说粘性路由到同一 worker，"
+            "或改用后台任务接口（POST /novel/next_chapter_job，进度见 GET /jobs/{job_id}/events）"
+        )
+    )
+
+
+def _check_read_permission(novel_id: str, user_id: int, session: Session):
+    if not NovelDAO(session).get_by_user(novel_id, user_id):
+        raise HTTPException(
+            status_code=403,
+            detail="无权查看该小说"
+        )
+
+
+@router.get(
+    "/{novel_id}/chapters",
+    response_model=ApiResponse[ChapterIndexPage]
+)
+def list_chapters(
+    novel_id: str,
+    after: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=200),
+    user_id: int = Depends(get_current_user_id),
+    session: Session = Depends(get_session)
+):
+    """章节目录：章节号、标题、字数、最新评审分，按章节号键集分页。"""
+    _check_read_permission(novel_id, user_id, session)
+
+    chapters = chapter_dao.list_index(novel_id, after_number=after, limit=limit)
+    scores = review_dao.latest_scores([ch["_id"] for ch in chapters])
+
+    items = [
+        ChapterIndexItem(
+            chapter_number=ch["chapter_number"],
+            title=ch.get("title") or "",
+            word_count=ch.get("word_count") or 0,
+            review_score=scores.get(ch["_id"])
+        )
+        for ch in chapters
+    ]
+    # 满页时返回下一页游标（最后一章的章节号）。
+    next_after = items[-1].chapter_number if len(items) == limit else None
+    return success(data=ChapterIndexPage(items=items, next_after=next_after))
+
+
+def _chapter_etag(meta: dict) -> str:
+    version = meta.get("updated_at") or meta.get("created_at")
+    stamp = version.isoformat() if version else ""
+    return f'"{meta["_id"]}-{stamp}"'
+
+
+@router.get(
+    "/{novel_id}/chapters/{chapter_number}",
+    response_model=ApiResponse[ChapterDetail]
+)
+def read_chapter(
+    novel_id: str,
+    chapter_number: int,
+    request: Request,
+    response: Response,
+    user_id: int = Depends(get_current_user_id),
+    session: Session = Depends(get_session)
+):
+    """读取单章正文，支持 ETag / If-None-Match 条件请求。"""
+    _check_read_permission(novel_id, user_id, session)
+
+    # 先只取元数据比对 ETag，命中时不传输正文。
+    meta = chapter_dao.get_meta(novel_id, chapter_number)
+    if not meta:
+        raise HTTPException(status_code=404, detail="章节不存在")
+    etag = _chapter_etag(meta)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    chapter = chapter_dao.get_by_number(novel_id, chapter_number)
+    if not chapter:
+        raise HTTPException(status_code=404, detail="章节不存在")
+    response.headers.update(headers)
+
+    content = chapter.get("content") or ""
+    return success(
+        data=ChapterDetail(
+            novel_id=novel_id,
+            chapter_number=chapter["chapter_number"],
+            title=chapter.get("title") or "",
+            content=content,
+            word_count=len(content)
+        )
+    )
+
+
 @router.get(
     "/status/{novel_id}",
     response_model=ApiResponse[dict]
@@ -540,10 +649,16 @@ def list_novels(
 @router.get("/export/{novel_id}")
 def export_novel(
     novel_id: str,
+    request: Request,
+    fmt: str = Query("txt", alias="format"),
+    gzip: bool = False,
     user_id: int = Depends(get_current_user_id),
     session: Session = Depends(get_session)
 ):
-    """导出小说为纯文本。"""
+    """导出小说：txt / md / epub / zip（TXT 压缩包），渲染结果按版本缓存。
+
+    gzip=true 时不经缓存，逐章流式输出压缩后的 TXT。
+    """
     novel_dao = NovelDAO(session)
 
     # 🚨 权限判断
@@ -554,47 +669,39 @@ def export_novel(
             detail="无权操作该小说"
         )
 
-    # 拉取世界观与章节内容（MongoDB）。
-    world = world_dao.get_latest_full(novel_id) or {}
-    chapters = chapter_dao.list_by_novel(novel_id)
-
-    # 组装文本内容。
-    lines: list[str] = []
-    lines.append(f"小说ID: {novel_id}")
-    if novel.topic:
-        lines.append(f"主题: {novel.topic}")
-    lines.append("")
-    lines.append("世界观设定")
-    tone = world.get("tone")
-    tech = world.get("technology_level")
-    if tone:
-        lines.append(f"基调: {tone}")
-    if tech:
-        lines.append(f"科技/文明水平: {tech}")
-    lines.append("世界规则:")
-    world_rules = world.get("world_rules") or []
-    if world_rules:
-        for rule in world_rules:
-            lines.append(f"- {rule}")
-    else:
-        lines.append("- （无）")
-
-    lines.append("")
-    lines.append("章节正文")
-    if not chapters:
-        lines.append("（暂无章节）")
-    for ch in chapters:
-        lines.append(f"第 {ch.get('chapter_number')} 章 · {ch.get('title')}")
-        content = ch.get("content") or ""
-        lines.append(content)
-        lines.append("")
-
-    content = "\n".join(lines)
-    filename = f"novel_{novel_id}.txt"
-    return Response(
-        content=content,
-        media_type="text/plain; charset=utf-8",
-        headers={
-            "Content-Disposition": f'attachment; filename="{filename}"'
-        }
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="不支持的导出格式")
+
+    if gzip:
+        if fmt != "txt":
+            raise HTTPException(status_code=400, detail="仅 txt 格式支持 gzip")
+        # 世界观一次读取；章节通过游标按批拉取，只投影导出所需字段。
+        world = world_dao.get_latest_full(novel_id) or {}
+        chapters = chapter_dao.iter_for_export(
+            novel_id, batch_size=EXPORT_BATCH_SIZE
+        )
+        pieces = iter_novel_text(novel_id, novel.topic, world, chapters)
+        filename = f"novel_{novel_id}.txt.gz"
+        return StreamingResponse(
+            iter_encoded(pieces, gzip=True),
+            media_type="application/gzip",
+            headers={
+                "Content-Disposition": f'attachment; filename="{filename}"'
+            }
+        )
+
+    # ETag 只取决于导出版本，先比对再渲染。
+    artifact = export_cache.describe(novel_id, fmt)
+    headers = {"ETag": artifact.etag, "Cache-Control": "private, no-cache"}
+    if request.headers.get("if-none-match") == artifact.etag:
+        return Response(status_code=304, headers=headers)
+
+    # 从已打开的文件发送：之后并发的 invalidate 删除该文件也不影响本次响应。
+    fp = export_cache.open(artifact, novel.topic)
+    headers["Content-Length"] = str(os.fstat(fp.fileno()).st_size)
+    headers["Content-Disposition"] = f'attachment; filename="{artifact.filename}"'
+    return StreamingResponse(
+        iter_file(fp),
+        media_type=artifact.media_type,
+        headers=headers
     )
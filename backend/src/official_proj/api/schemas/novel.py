@@ -1,6 +1,6 @@
 """小说相关 API 的请求与响应结构。"""
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class AuthReq(BaseModel):
@@ -23,6 +23,20 @@ class NextChapterRequest(BaseModel):
     novel_id: str
 
 
+class ChapterBatchRequest(BaseModel):
+    """批量续写请求体：连续生成 count 章。"""
+
+    novel_id: str
+    count: int = Field(default=10, ge=1, le=50)
+
+
+class ResumeStreamRequest(BaseModel):
+    """断线续传请求体：从 last_seq 之后继续接收事件。"""
+
+    novel_id: str
+    last_seq: int = 0
+
+
 class ChapterReview(BaseModel):
     """章节评审结果结构。"""
 
@@ -38,6 +52,8 @@ class RewriteInfo(BaseModel):
 
     reasons: list[str]
     applied: bool = True
+    # 段落级重写改动的段落区间（start/end/issue），整章重写时为空。
+    spans: list[dict] = []
 
 
 class ChapterResponse(BaseModel):
@@ -68,3 +84,29 @@ class InitResponse(BaseModel):
     world_rules: list[str]
     review: ChapterReview | None = None
     rewrite: RewriteInfo | None = None
+
+
+class ChapterIndexItem(BaseModel):
+    """目录条目：章节元数据，不含正文。"""
+
+    chapter_number: int
+    title: str
+    word_count: int
+    review_score: int | None = None
+
+
+class ChapterIndexPage(BaseModel):
+    """目录分页结果：next_after 为下一页的游标，没有更多时为空。"""
+
+    items: list[ChapterIndexItem]
+    next_after: int | None = None
+
+
+class ChapterDetail(BaseModel):
+    """单章正文。"""
+
+    novel_id: str
+    chapter_number: int
+    title: str
+    content: str
+    word_count: int
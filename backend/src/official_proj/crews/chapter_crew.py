@@ -1,7 +1,14 @@
 from crewai import Agent, Crew, Task, Process
 from crewai.tasks.conditional_task import ConditionalTask
 from crewai.tasks.task_output import TaskOutput
-from official_proj.services.llm_factory import get_default_llm
+from official_proj.crews.span_rewrite import (
+    CHAPTER_REWRITE_MODE,
+    SPAN_REWRITE_RETRIES,
+    ConditionalSpanRewriteTask,
+    SpanRewriteTask,
+    span_rewrite_guardrail
+)
+from official_proj.services.llm_factory import TaskLLMs
 from official_proj.schema.json_tasks import (
     WritingTaskOutput,
     PlotAnalysisOutput,
@@ -13,10 +20,12 @@ class ChapterCrew:
     """章节创作 Crew（纯代码定义，等价于 YAML）"""
 
     # ========= Agents =========
-    def __init__(self) -> None:
-        self.llm = get_default_llm()
+    def __init__(self, tenant: str | None = None, usage_tags: dict | None = None) -> None:
+        # tenant：LLM 调度器排队时的调用方（用户/小说）；usage_tags：用量记录的归属标签。
+        # 各任务按 LLM_TASK_PROFILES 取模型，未配置的任务使用默认模型。
+        self.llms = TaskLLMs(tenant, usage_tags)
 
-    def narrative_writer(self) -> Agent:
+    def narrative_writer(self, task_name: str | None = None) -> Agent:
         return Agent(
             role="专业小说写手",
             goal="创作情节生动、情感真实的小说章节正文",
@@ -24,11 +33,11 @@ class ChapterCrew:
                 "你是一名职业小说作者，擅长描写场景、人物对话与情绪变化，"
                 "严格遵循剧情规划、世界观设定和人物设定进行写作。"
             ),
-            llm=self.llm,
+            llm=self.llms.for_task(task_name),
             verbose=True
         )
 
-    def plot_analyst(self) -> Agent:
+    def plot_analyst(self, task_name: str | None = None) -> Agent:
         return Agent(
             role="资深剧情分析师",
             goal="从小说正文中提炼关键剧情信息",
@@ -37,11 +46,11 @@ class ChapterCrew:
                 "能够将小说文本转化为结构化剧情知识，"
                 "方便后续分析和长期记忆。"
             ),
-            llm=self.llm,
+            llm=self.llms.for_task(task_name),
             verbose=True
         )
 
-    def memory_keeper(self) -> Agent:
+    def memory_keeper(self, task_name: str | None = None) -> Agent:
         return Agent(
             role="长期剧情记忆与一致性管理员",
             goal="维护小说的长期记忆和剧情一致性",
@@ -49,11 +58,11 @@ class ChapterCrew:
                 "你负责追踪人物状态、人物关系和未解决的剧情线索，"
                 "确保重要信息被正确记录，并在后续章节中不被遗忘或矛盾。"
             ),
-            llm=self.llm,
+            llm=self.llms.for_task(task_name),
             verbose=True
         )
 
-    def chapter_reviewer(self) -> Agent:
+    def chapter_reviewer(self, task_name: str | None = None) -> Agent:
         return Agent(
             role="章节评审官",
             goal="评估章节质量与世界观一致性",
@@ -62,7 +71,7 @@ class ChapterCrew:
                 "擅长发现跑题、设定违背和逻辑断裂的问题，"
                 "并给出简洁客观的评分与评语。"
             ),
-            llm=self.llm,
+            llm=self.llms.for_task(task_name),
             verbose=True
         )
 
@@ -106,12 +115,20 @@ class ChapterCrew:
                 '  "content": "完整章节正文内容，使用自然段落描述"\n'
                 "}"
             ),
-            agent=self.narrative_writer(),
+            agent=self.narrative_writer("writing_task"),
             output_pydantic=WritingTaskOutput
         )
 
-    def chapter_rewrite_task(self) -> ConditionalTask:
-        return ConditionalTask(
+    def chapter_rewrite_task(
+        self,
+        writing_task: Task | None = None,
+        review_task: Task | None = None,
+        conditional: bool = True
+    ) -> Task:
+        """评审不达标时的重写任务；传入写作与评审任务时默认只重写问题段落。"""
+        if CHAPTER_REWRITE_MODE == "span" and writing_task is not None:
+            return self._span_rewrite_task(writing_task, review_task, conditional)
+        kwargs = dict(
             name="chapter_rewrite_task",
             description=(
                 "基于上一任务的评审问题，对本章节进行重写，"
@@ -133,19 +150,70 @@ class ChapterCrew:
                 '  "content": "重写后的完整章节正文内容"\n'
                 "}"
             ),
-            agent=self.chapter_reviewer(),
-            output_pydantic=ChapterRewriteOutput,
-            condition=self._needs_rewrite
+            agent=self.chapter_reviewer("chapter_rewrite_task"),
+            output_pydantic=ChapterRewriteOutput
+        )
+        if writing_task is not None and review_task is not None:
+            kwargs["context"] = [writing_task, review_task]
+        if conditional:
+            return ConditionalTask(**kwargs, condition=self._needs_rewrite)
+        return Task(**kwargs)
+
+    def _span_rewrite_task(
+        self,
+        writing_task: Task,
+        review_task: Task | None,
+        conditional: bool
+    ) -> Task:
+        # 原文按段编号后附在提示词中（见 span_rewrite），上下文只带评审结果。
+        kwargs = dict(
+            name="chapter_rewrite_task",
+            description=(
+                "本章节未通过评审，请只针对评审问题所在的段落进行改写，其余段落保持不变。\n"
+                "先列出不合格原因，再把每个问题对应到原章节的段落编号区间，"
+                "给出替换该区间的新文本；新文本要与前后段落自然衔接，可以包含多个段落。\n"
+                "必须使用白话文写作，保持原有文风与人物设定。\n\n"
+                "【世界观设定】\n{world}\n\n"
+                "【历史剧情回忆】\n{last_plot}"
+            ),
+            expected_output=(
+                "请严格只输出 JSON（最外层必须是对象），不允许输出多余文字，不要输出整章正文。\n"
+                "段落编号从 1 开始，start/end 为闭区间，各区间互不重叠。\n"
+                "格式如下：\n"
+                "{\n"
+                '  "fail_reasons": [\n'
+                '    "不合格原因1"\n'
+                "  ],\n"
+                '  "chapter_title": "章节标题（无需修改时沿用原标题）",\n'
+                '  "edits": [\n'
+                "    {\n"
+                '      "start": 3,\n'
+                '      "end": 4,\n'
+                '      "issue": "对应的评审问题",\n'
+                '      "content": "替换第 3～4 段的新文本"\n'
+                "    }\n"
+                "  ]\n"
+                "}"
+            ),
+            agent=self.chapter_reviewer("chapter_rewrite_task"),
+            guardrail=span_rewrite_guardrail(writing_task),
+            guardrail_max_retries=SPAN_REWRITE_RETRIES,
+            context=[review_task] if review_task is not None else [],
+            draft_task=writing_task,
+            review_task=review_task
         )
+        if conditional:
+            return ConditionalSpanRewriteTask(**kwargs, condition=self._needs_rewrite)
+        return SpanRewriteTask(**kwargs)
 
     def plot_analysis_task(self) -> Task:
         return Task(
             name="plot_analysis_task",
             description=(
                 "分析本章节小说内容，提取关键事件、重要信息和潜在影响，"
-                "重点关注对后续剧情有长期影响的内容。\n"
-                "若存在 chapter_rewrite_task 输出，请以重写后的 content 为准进行分析；"
-                "否则以 writing_task 的 content 为准。"
+                "重点关注对后续剧情有长期影响的内容。\n\n"
+                "【本章标题】\n{chapter_title}\n\n"
+                "【本章正文】\n{chapter_content}"
             ),
             expected_output=(
                 "请严格只输出 JSON（最外层必须是对象），格式如下：\n"
@@ -160,7 +228,7 @@ class ChapterCrew:
                 "  ]\n"
                 "}"
             ),
-            agent=self.plot_analyst(),
+            agent=self.plot_analyst("plot_analysis_task"),
             output_pydantic=PlotAnalysisOutput
         )
 
@@ -168,8 +236,10 @@ class ChapterCrew:
         return Task(
             name="memory_update_task",
             description=(
-                "基于剧情分析结果，更新小说的长期记忆内容，"
-                "标注必须长期保留的信息和不可被后续剧情违背的设定。"
+                "基于本章正文，更新小说的长期记忆内容，"
+                "标注必须长期保留的信息和不可被后续剧情违背的设定。\n\n"
+                "【本章标题】\n{chapter_title}\n\n"
+                "【本章正文】\n{chapter_content}"
             ),
             expected_output=(
                 "请严格只输出 JSON（最外层必须是对象），不允许直接输出数组。\n"
@@ -186,7 +256,7 @@ class ChapterCrew:
                 "  ]\n"
                 "}"
             ),
-            agent=self.memory_keeper(),
+            agent=self.memory_keeper("memory_update_task"),
             output_pydantic=MemoryUpdateOutput
         )
 
@@ -196,8 +266,8 @@ class ChapterCrew:
             description=(
                 "对本章节内容进行评审，重点检查是否跑题或脱离世界观设定，"
                 "并给出总体质量评分与简短评语。\n\n"
-                "【世界观设定】\n{world}\n\n"
-                "【历史剧情回忆】\n{last_plot}\n"
+                "【世界观设定】\n{review_world}\n\n"
+                "【历史剧情回忆】\n{review_last_plot}\n"
             ),
             expected_output=(
                 "请严格只输出 JSON（最外层必须是对象），不允许输出多余文字。\n"
@@ -213,19 +283,24 @@ class ChapterCrew:
                 '  "summary": "简短评语"\n'
                 "}"
             ),
-            agent=self.chapter_reviewer(),
+            agent=self.chapter_reviewer("chapter_review_task"),
             output_pydantic=ChapterReviewOutput
         )
 
-    def chapter_rewrite_review_task(self) -> ConditionalTask:
-        return ConditionalTask(
+    def chapter_rewrite_review_task(
+        self,
+        rewrite_task: Task | None = None,
+        conditional: bool = True
+    ) -> Task:
+        """重写后的评审；传入重写任务时只以重写后的正文为上下文。"""
+        kwargs = dict(
             name="chapter_rewrite_review_task",
             description=(
                 "对重写后的章节内容进行评审，重点检查是否跑题或脱离世界观设定，"
                 "并给出总体质量评分与简短评语。\n"
                 "请以 chapter_rewrite_task 输出的 content 为准进行评审。\n\n"
-                "【世界观设定】\n{world}\n\n"
-                "【历史剧情回忆】\n{last_plot}\n"
+                "【世界观设定】\n{review_world}\n\n"
+                "【历史剧情回忆】\n{review_last_plot}\n"
             ),
             expected_output=(
                 "请严格只输出 JSON（最外层必须是对象），不允许输出多余文字。\n"
@@ -241,29 +316,115 @@ class ChapterCrew:
                 '  "summary": "简短评语"\n'
                 "}"
             ),
-            agent=self.chapter_reviewer(),
-            output_pydantic=ChapterReviewOutput,
-            condition=self._has_rewrite_output
+            agent=self.chapter_reviewer("chapter_rewrite_review_task"),
+            output_pydantic=ChapterReviewOutput
         )
+        if rewrite_task is not None:
+            kwargs["context"] = [rewrite_task]
+        if conditional:
+            return ConditionalTask(**kwargs, condition=self._has_rewrite_output)
+        return Task(**kwargs)
 
     # ========= Crew =========
 
-    def crew(self) -> Crew:
+    def crew(self, completed: dict[str, TaskOutput] | None = None) -> Crew | None:
+        """写作阶段：写作 → 评审 → 条件重写 → 重写评审。
+
+        completed 为断点恢复出的已完成任务输出：这些任务不再执行，其输出作为后续任务的
+        上下文；排在待执行任务之后的断点已失效，会从 completed 中移除。
+        写作阶段已全部完成时返回 None。
+        """
+        writing = self.writing_task()
+        review = self.chapter_review_task()
+        rewrite = self.chapter_rewrite_task(writing, review)
+        chain = [writing, review, rewrite, self.chapter_rewrite_review_task(rewrite)]
+        tasks = self._remaining_tasks(chain, completed) if completed else chain
+        if not tasks:
+            return None
         return Crew(
             agents=[
                 self.narrative_writer(),
-                self.plot_analyst(),
-                self.memory_keeper(),
                 self.chapter_reviewer()
             ],
-            tasks=[
-                self.writing_task(),
-                self.chapter_review_task(),
-                self.chapter_rewrite_task(),
-                self.chapter_rewrite_review_task(),
-                self.plot_analysis_task(),
-                self.memory_update_task()
-            ],
+            tasks=tasks,
             process=Process.sequential,
             verbose=True
         )
+
+    def _remaining_tasks(self, chain: list[Task], completed: dict[str, TaskOutput]) -> list[Task]:
+        # 与顺序流程一致：条件任务看前一个任务的输出；未显式指定上下文的任务以之前所有任务的输出为上下文。
+        by_name = {task.name: task for task in chain}
+        replaced: dict[int, Task] = {}
+        done: list[Task] = []
+        remaining: list[Task] = []
+        previous: TaskOutput | None = None
+        for task in chain:
+            if not remaining:
+                if task.name in completed:
+                    task.output = completed[task.name]
+                    done.append(task)
+                    previous = task.output
+                    continue
+                if isinstance(task, ConditionalTask):
+                    if previous is None or not task.should_execute(previous):
+                        # 条件不满足，等同于被跳过。
+                        previous = None
+                        continue
+                    # crew 的第一个任务不能是条件任务，条件已在此判断。
+                    if task.name == "chapter_rewrite_task":
+                        replacement = self.chapter_rewrite_task(
+                            by_name["writing_task"],
+                            by_name["chapter_review_task"],
+                            conditional=False
+                        )
+                    else:
+                        replacement = self.chapter_rewrite_review_task(
+                            by_name["chapter_rewrite_task"],
+                            conditional=False
+                        )
+                    replaced[id(task)] = replacement
+                    task = replacement
+            if isinstance(task.context, list):
+                # 显式上下文中被替换的任务指向替换后的实例。
+                task.context = [replaced.get(id(dep), dep) for dep in task.context]
+            else:
+                task.context = done + remaining
+            remaining.append(task)
+        for task in remaining:
+            completed.pop(task.name, None)
+        return remaining
+
+    def output_models(self) -> dict[str, type | None]:
+        """任务名 → 输出模型，用于从断点还原 TaskOutput。"""
+        return {
+            "writing_task": WritingTaskOutput,
+            "chapter_review_task": ChapterReviewOutput,
+            "chapter_rewrite_task": ChapterRewriteOutput,
+            "chapter_rewrite_review_task": ChapterReviewOutput,
+            "plot_analysis_task": PlotAnalysisOutput,
+            "memory_update_task": MemoryUpdateOutput,
+        }
+
+    def post_writing_crews(self, completed: dict | None = None) -> dict[str, Crew]:
+        """写作完成后的任务：剧情分析与记忆更新只依赖最终正文，各自单独成 crew 以便并行。
+
+        completed 中已有输出的任务不再返回。
+        """
+        crews = {
+            "plot_analysis_task": Crew(
+                agents=[self.plot_analyst()],
+                tasks=[self.plot_analysis_task()],
+                process=Process.sequential,
+                verbose=True
+            ),
+            "memory_update_task": Crew(
+                agents=[self.memory_keeper()],
+                tasks=[self.memory_update_task()],
+                process=Process.sequential,
+                verbose=True
+            ),
+        }
+        return {
+            name: crew for name, crew in crews.items()
+            if not completed or name not in completed
+        }
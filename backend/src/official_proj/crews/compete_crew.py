@@ -4,15 +4,18 @@ from crewai.tasks.task_output import TaskOutput
 from official_proj.schema.json_tasks import (StoryPlanningOutput,WorldBuildingOutput,CharacterDesignOutput,
                                              PlotAnalysisOutput,MemoryUpdateOutput,WritingTaskOutput,
                                              ChapterRewriteOutput,ChapterReviewOutput)
-from official_proj.services.llm_factory import get_default_llm
+from official_proj.services.llm_factory import TaskLLMs
+from official_proj.services.task_graph import GraphNode
 class OfficialProj():
     """OfficialProj crew"""
     # ========= Agents =========
     # ========= Story Planner =========
-    def __init__(self) -> None:
-        self.llm = get_default_llm()
+    def __init__(self, tenant: str | None = None, usage_tags: dict | None = None) -> None:
+        # tenant：LLM 调度器排队时的调用方（用户/小说）；usage_tags：用量记录的归属标签。
+        # 各任务按 LLM_TASK_PROFILES 取模型，未配置的任务使用默认模型。
+        self.llms = TaskLLMs(tenant, usage_tags)
 
-    def story_planner(self) -> Agent:
+    def story_planner(self, task_name: str | None = None) -> Agent:
         return Agent(
             role="资深小说故事策划师",
             goal="为小说设计清晰、可持续展开的整体剧情结构",
@@ -20,12 +23,12 @@ class OfficialProj():
                 "你是一名经验丰富的小说策划师，精通长篇连载小说的叙事结构、"
                 "节奏控制和伏笔设计，擅长构建长期不崩盘的故事主线。"
             ),
-            llm=self.llm,
+            llm=self.llms.for_task(task_name),
             verbose=True,
         )
 
     # ========= World Builder =========
-    def world_builder(self) -> Agent:
+    def world_builder(self, task_name: str | None = None) -> Agent:
         return Agent(
             role="资深世界观构建师",
             goal="构建逻辑自洽、细节丰富的小说世界观",
@@ -33,12 +36,12 @@ class OfficialProj():
                 "你擅长设计世界规则、社会结构、力量体系和历史背景，"
                 "能够确保世界观在长篇故事中始终保持一致，不出现逻辑漏洞。"
             ),
-            llm=self.llm,
+            llm=self.llms.for_task(task_name),
             verbose=True,
         )
 
     # ========= Character Architect =========
-    def character_architect(self) -> Agent:
+    def character_architect(self, task_name: str | None = None) -> Agent:
         return Agent(
             role="资深人物架构师",
             goal="设计立体、有成长性的小说人物",
@@ -47,12 +50,12 @@ class OfficialProj():
                 "能够确保人物动机合理、情绪变化自然，"
                 "并在长期连载中保持人设稳定。"
             ),
-            llm=self.llm,
+            llm=self.llms.for_task(task_name),
             verbose=True,
         )
 
     # ========= Narrative Writer =========
-    def narrative_writer(self) -> Agent:
+    def narrative_writer(self, task_name: str | None = None) -> Agent:
         return Agent(
             role="专业小说写手",
             goal="创作情节生动、情感真实的小说章节正文",
@@ -60,12 +63,12 @@ class OfficialProj():
                 "你是一名职业小说作者，擅长描写场景、人物对话与情绪变化，"
                 "严格遵循剧情规划、世界观设定和人物设定进行写作。"
             ),
-            llm=self.llm,
+            llm=self.llms.for_task(task_name),
             verbose=True,
         )
 
     # ========= Plot Analyst =========
-    def plot_analyst(self) -> Agent:
+    def plot_analyst(self, task_name: str | None = None) -> Agent:
         return Agent(
             role="资深剧情分析师",
             goal="从小说正文中提炼关键剧情信息",
@@ -74,12 +77,12 @@ class OfficialProj():
                 "能够将小说文本转化为结构化剧情知识，"
                 "方便后续分析和长期记忆。"
             ),
-            llm=self.llm,
+            llm=self.llms.for_task(task_name),
             verbose=True,
         )
 
     # ========= Memory Keeper =========
-    def memory_keeper(self) -> Agent:
+    def memory_keeper(self, task_name: str | None = None) -> Agent:
         return Agent(
             role="长期剧情记忆与一致性管理员",
             goal="维护小说的长期记忆和剧情一致性",
@@ -87,11 +90,11 @@ class OfficialProj():
                 "你负责追踪人物状态、人物关系和未解决的剧情线索，"
                 "确保重要信息被正确记录，并在后续章节中不被遗忘或矛盾。"
             ),
-            llm=self.llm,
+            llm=self.llms.for_task(task_name),
             verbose=True,
         )
 
-    def chapter_reviewer(self) -> Agent:
+    def chapter_reviewer(self, task_name: str | None = None) -> Agent:
         return Agent(
             role="章节评审官",
             goal="评估章节质量与世界观一致性",
@@ -100,7 +103,7 @@ class OfficialProj():
                 "擅长发现跑题、设定违背和逻辑断裂的问题，"
                 "并给出简洁客观的评分与评语。"
             ),
-            llm=self.llm,
+            llm=self.llms.for_task(task_name),
             verbose=True,
         )
     # ========= Tasks =========
@@ -140,7 +143,7 @@ class OfficialProj():
                 '  "next_chapter_goal": "下一章节的写作目标"\n'
                 "}"
             ),
-            agent=self.story_planner(),
+            agent=self.story_planner("story_planning_task"),
             output_pydantic=StoryPlanningOutput
         )
 
@@ -165,7 +168,7 @@ class OfficialProj():
                 '  "technology_level": "科技或文明水平"\n'
                 "}"
             ),
-            agent=self.world_builder(),
+            agent=self.world_builder("world_building_task"),
             output_pydantic=WorldBuildingOutput
         )
 
@@ -195,7 +198,7 @@ class OfficialProj():
                 "  ]\n"
                 "}"
             ),
-            agent=self.character_architect(),
+            agent=self.character_architect("character_design_task"),
             output_pydantic=CharacterDesignOutput
         )
 
@@ -220,7 +223,7 @@ class OfficialProj():
                 '  "content": "完整章节正文内容，使用自然段落描述"\n'
                 "}"
             ),
-            agent=self.narrative_writer(),
+            agent=self.narrative_writer("writing_task"),
             output_pydantic=WritingTaskOutput
         )
 
@@ -245,7 +248,7 @@ class OfficialProj():
                 '  "content": "重写后的完整章节正文内容"\n'
                 "}"
             ),
-            agent=self.chapter_reviewer(),
+            agent=self.chapter_reviewer("chapter_rewrite_task"),
             output_pydantic=ChapterRewriteOutput,
             condition=self._needs_rewrite
         )
@@ -258,9 +261,9 @@ class OfficialProj():
             name="plot_analysis_task",
             description=(
                 "分析本章节小说内容，提取关键事件、重要信息和潜在影响，"
-                "重点关注对后续剧情有长期影响的内容。\n"
-                "若存在 chapter_rewrite_task 输出，请以重写后的 content 为准进行分析；"
-                "否则以 writing_task 的 content 为准。"
+                "重点关注对后续剧情有长期影响的内容。\n\n"
+                "【本章标题】\n{chapter_title}\n\n"
+                "【本章正文】\n{chapter_content}"
             ),
             expected_output=(
                 "请严格只输出 JSON（最外层必须是对象），格式如下：\n"
@@ -275,7 +278,7 @@ class OfficialProj():
                 "  ]\n"
                 "}"
             ),
-            agent=self.plot_analyst(),
+            agent=self.plot_analyst("plot_analysis_task"),
             output_pydantic=PlotAnalysisOutput
         )
 
@@ -286,8 +289,10 @@ class OfficialProj():
         return Task(
             name="memory_update_task",
             description=(
-                "基于剧情分析结果，更新小说的长期记忆内容，"
-                "标注必须长期保留的信息和不可被后续剧情违背的设定。"
+                "基于本章正文，更新小说的长期记忆内容，"
+                "标注必须长期保留的信息和不可被后续剧情违背的设定。\n\n"
+                "【本章标题】\n{chapter_title}\n\n"
+                "【本章正文】\n{chapter_content}"
             ),
             expected_output=(
                 "请严格只输出 JSON（最外层必须是对象），不允许直接输出数组。\n"
@@ -304,7 +309,7 @@ class OfficialProj():
                 "  ]\n"
                 "}"
             ),
-            agent=self.memory_keeper(),
+            agent=self.memory_keeper("memory_update_task"),
             output_pydantic=MemoryUpdateOutput
         )
 
@@ -332,7 +337,7 @@ class OfficialProj():
                 '  "summary": "简短评语"\n'
                 "}"
             ),
-            agent=self.chapter_reviewer(),
+            agent=self.chapter_reviewer("chapter_review_task"),
             output_pydantic=ChapterReviewOutput
         )
 
@@ -358,7 +363,7 @@ class OfficialProj():
                 '  "summary": "简短评语"\n'
                 "}"
             ),
-            agent=self.chapter_reviewer(),
+            agent=self.chapter_reviewer("chapter_rewrite_review_task"),
             output_pydantic=ChapterReviewOutput,
             condition=self._has_rewrite_output
         )
@@ -367,6 +372,7 @@ class OfficialProj():
 # ========= Crew =========
 
     def crew(self) -> Crew:
+        """写作阶段：策划 → 世界观 → 人物 → 首章 → 评审 → 条件重写 → 重写评审。"""
         return Crew(
             #写的顺序代表agent和任务的执行顺序。
             agents=[
@@ -374,8 +380,6 @@ class OfficialProj():
                 self.world_builder(),
                 self.character_architect(),
                 self.narrative_writer(),
-                self.plot_analyst(),
-                self.memory_keeper(),
                 self.chapter_reviewer()
             ],
             tasks=[
@@ -386,13 +390,88 @@ class OfficialProj():
                 self.chapter_review_task(),
                 self.chapter_rewrite_task(),
                 self.chapter_rewrite_review_task(),
-                self.plot_analysis_task(),
-                self.memory_update_task(),
             ],
             process=Process.sequential,
             verbose=True
         )
 
+    def task_graph(self) -> list[GraphNode]:
+        """写作阶段的依赖图：策划 → 世界观 ∥ 人物 → 写作链（写作 → 评审 → 条件重写 → 重写评审）。
+
+        世界观与人物只依赖主题和故事策划，可以并发；写作链保持在同一个 crew 中顺序执行，
+        ConditionalTask 仍以前一任务的输出判断是否执行。各任务的上下文显式指定，
+        与原顺序流程中可见的前序输出一致（人物设定不再等待世界观）。
+        """
+        planning = self.story_planning_task()
+        world = self.world_building_task()
+        characters = self.character_design_task()
+        writing = self.writing_task()
+        review = self.chapter_review_task()
+        rewrite = self.chapter_rewrite_task()
+        rewrite_review = self.chapter_rewrite_review_task()
+
+        world.context = [planning]
+        characters.context = [planning]
+        writing.context = [planning, world, characters]
+        review.context = [planning, world, characters, writing]
+        rewrite.context = [planning, world, characters, writing, review]
+        rewrite_review.context = [
+            planning, world, characters, writing, review, rewrite
+        ]
+
+        def single(task: Task, agent: Agent) -> Crew:
+            return Crew(
+                agents=[agent],
+                tasks=[task],
+                process=Process.sequential,
+                verbose=True
+            )
+
+        return [
+            GraphNode(
+                name="story_planning_task",
+                crew=single(planning, self.story_planner())
+            ),
+            GraphNode(
+                name="world_building_task",
+                crew=single(world, self.world_builder()),
+                depends_on=("story_planning_task",)
+            ),
+            GraphNode(
+                name="character_design_task",
+                crew=single(characters, self.character_architect()),
+                depends_on=("story_planning_task",)
+            ),
+            GraphNode(
+                name="writing_task",
+                crew=Crew(
+                    agents=[self.narrative_writer(), self.chapter_reviewer()],
+                    tasks=[writing, review, rewrite, rewrite_review],
+                    process=Process.sequential,
+                    verbose=True
+                ),
+                depends_on=("world_building_task", "character_design_task"),
+                stream=True
+            ),
+        ]
+
+    def post_writing_crews(self) -> dict[str, Crew]:
+        """首章写完后的剧情分析与记忆更新：只依赖最终正文，各自单独成 crew 以便并行。"""
+        return {
+            "plot_analysis_task": Crew(
+                agents=[self.plot_analyst()],
+                tasks=[self.plot_analysis_task()],
+                process=Process.sequential,
+                verbose=True
+            ),
+            "memory_update_task": Crew(
+                agents=[self.memory_keeper()],
+                tasks=[self.memory_update_task()],
+                process=Process.sequential,
+                verbose=True
+            ),
+        }
+
 # #debugg
 # from crewai import Agent, Crew, Process, Task
 # from crewai.project import CrewBase, agent, crew, task, output_pydantic
@@ -0,0 +1,205 @@
+"""段落级重写：只重写评审问题所在的段落，再拼回原章节。
+
+评审不达标时，整章重写要重新生成约 5000 字，耗时与费用接近再写一章。
+段落级重写把原稿按段编号后交给模型，模型只输出 ``edits``（问题对应的段落区间与替换文本），
+护栏（guardrail）校验区间后拼接出完整正文，任务输出与整章重写一样是 ChapterRewriteOutput，
+后续的重写评审、持久化与接口无需区分两种模式。区间非法时护栏让模型带着错误原因重试。
+
+CHAPTER_REWRITE_MODE=full 时恢复整章重写。
+"""
+
+import json
+import os
+from typing import Any
+
+from crewai import Task
+from crewai.tasks.conditional_task import ConditionalTask
+from crewai.tasks.output_format import OutputFormat
+from crewai.tasks.task_output import TaskOutput
+from pydantic import Field, ValidationError
+
+from official_proj.schema.json_tasks import (
+    ChapterRewriteOutput,
+    ChapterSpanRewriteOutput,
+    ParagraphEdit,
+    RewriteSpan
+)
+from official_proj.services.llm_cache import reject_cached_response
+
+# span：段落级重写（默认）；full：整章重写。
+CHAPTER_REWRITE_MODE = os.getenv("CHAPTER_REWRITE_MODE", "span").lower()
+# 段落区间不合法时允许模型重试的次数。
+SPAN_REWRITE_RETRIES = int(os.getenv("SPAN_REWRITE_RETRIES", "2"))
+
+
+def paragraph_ranges(content: str) -> list[tuple[int, int]]:
+    """各自然段（非空行）在原文中的 [起, 止) 偏移：含行首缩进，不含行尾空白与换行。"""
+    ranges: list[tuple[int, int]] = []
+    offset = 0
+    for line in (content or "").splitlines(keepends=True):
+        text = line.rstrip()
+        if text.strip():
+            ranges.append((offset, offset + len(text)))
+        offset += len(line)
+    return ranges
+
+
+def split_paragraphs(content: str) -> list[str]:
+    """按行切分自然段，忽略空行（编号与 paragraph_ranges 一致）。"""
+    return [content[start:end].strip() for start, end in paragraph_ranges(content)]
+
+
+def _indent(text: str) -> str:
+    return text[:len(text) - len(text.lstrip())]
+
+
+def _span_layout(content: str, ranges: list[tuple[int, int]], first: int, last: int) -> tuple[str, str]:
+    """被替换区间的排版：(段首缩进, 段落分隔)，沿用原文该处的写法。"""
+    start, end = ranges[first]
+    indent = _indent(content[start:end])
+    # 优先取区间内部的段间分隔，其次取相邻段之间的。
+    if last > first:
+        separator = content[ranges[first][1]:ranges[first + 1][0]]
+    elif last + 1 < len(ranges):
+        separator = content[ranges[last][1]:ranges[last + 1][0]]
+    elif first > 0:
+        separator = content[ranges[first - 1][1]:ranges[first][0]]
+    else:
+        separator = "\n"
+    # 只保留换行与空行：去掉前一段的行尾空白与下一段的缩进，缩进由 indent 补上。
+    return indent, separator.strip(" \t\u3000") or "\n"
+
+
+def apply_paragraph_edits(
+    content: str,
+    edits: list[ParagraphEdit]
+) -> tuple[str, list[RewriteSpan]]:
+    """把 edits 拼回原文，返回 (新正文, 改动记录)。
+
+    只替换 edits 覆盖的段落区间，其余文字（缩进、空行、分隔）保持原样；
+    改动记录中的 original 取自原文切片。区间越界、重叠或为空时抛出 ValueError。
+    """
+    ranges = paragraph_ranges(content)
+    total = len(ranges)
+    if not edits:
+        raise ValueError("edits 为空：至少需要改写一个段落区间")
+
+    ordered = sorted(edits, key=lambda edit: edit.start)
+    previous_end = 0
+    for edit in ordered:
+        if not 1 <= edit.start <= edit.end <= total:
+            raise ValueError(
+                f"段落区间 [{edit.start}, {edit.end}] 无效：原文共 {total} 段，编号从 1 开始"
+            )
+        if edit.start <= previous_end:
+            raise ValueError(f"段落区间 [{edit.start}, {edit.end}] 与前一处改动重叠")
+        previous_end = edit.end
+
+    result: list[str] = []
+    spans: list[RewriteSpan] = []
+    cursor = 0
+    for edit in ordered:
+        start = ranges[edit.start - 1][0]
+        end = ranges[edit.end - 1][1]
+        indent, separator = _span_layout(content, ranges, edit.start - 1, edit.end - 1)
+        replacement = separator.join(
+            indent + paragraph for paragraph in split_paragraphs(edit.content)
+        )
+        result.append(content[cursor:start])
+        result.append(replacement)
+        spans.append(RewriteSpan(
+            start=edit.start,
+            end=edit.end,
+            issue=edit.issue,
+            original=content[start:end],
+            rewritten=replacement
+        ))
+        cursor = end
+    result.append(content[cursor:])
+    return "".join(result), spans
+
+
+def _draft_content(draft_task: Task | None) -> str:
+    output = draft_task.output if draft_task is not None else None
+    draft = getattr(output, "pydantic", None)
+    return getattr(draft, "content", "") or ""
+
+
+def _review_issues(review_task: Task | None) -> list[str]:
+    output = review_task.output if review_task is not None else None
+    review = getattr(output, "pydantic", None)
+    return list(getattr(review, "issues", None) or [])
+
+
+def _span_material(draft_task: Task | None, review_task: Task | None) -> str:
+    """评审问题与带编号的原文段落，附在段落级重写任务的提示词后。"""
+    issues = _review_issues(review_task)
+    numbered = "\n".join(
+        f"[{index}] {paragraph}"
+        for index, paragraph in enumerate(split_paragraphs(_draft_content(draft_task)), 1)
+    )
+    issue_lines = "\n".join(f"- {issue}" for issue in issues) or "- （评审未列出具体问题）"
+    return f"\n\n【评审问题】\n{issue_lines}\n\n【原章节段落】\n{numbered}"
+
+
+class SpanRewriteTask(Task):
+    """段落级重写任务：提示词中带上评审问题与编号后的原文。"""
+
+    draft_task: Any = Field(default=None, exclude=True)
+    review_task: Any = Field(default=None, exclude=True)
+
+    def prompt(self) -> str:
+        return super().prompt() + _span_material(self.draft_task, self.review_task)
+
+
+class ConditionalSpanRewriteTask(ConditionalTask):
+    """条件版本的段落级重写任务（评审不达标时才执行）。"""
+
+    draft_task: Any = Field(default=None, exclude=True)
+    review_task: Any = Field(default=None, exclude=True)
+
+    def prompt(self) -> str:
+        return super().prompt() + _span_material(self.draft_task, self.review_task)
+
+
+def _json_object(raw: str) -> str:
+    # 兼容 ```json 代码块与前后多余文字。
+    start = raw.find("{")
+    end = raw.rfind("}")
+    if start == -1 or end < start:
+        raise ValueError("输出中没有 JSON 对象")
+    return raw[start:end + 1]
+
+
+def span_rewrite_guardrail(draft_task: Task):
+    """校验 edits 并拼接出完整正文，输出替换为 ChapterRewriteOutput。
+
+    任务本身不设 output_pydantic：模型输出的是 edits，不能按整章结构解析。
+    """
+    def guardrail(output: TaskOutput) -> tuple[bool, Any]:
+        try:
+            parsed = ChapterSpanRewriteOutput.model_validate_json(_json_object(output.raw or ""))
+            content, spans = apply_paragraph_edits(_draft_content(draft_task), parsed.edits)
+        except (ValueError, ValidationError) as e:
+            # 被拒绝的输出不能留在响应缓存里，否则重跑时会原样回放。
+            reject_cached_response()
+            return False, f"段落级重写输出不合法：{e}"
+        rewritten = ChapterRewriteOutput(
+            fail_reasons=parsed.fail_reasons,
+            chapter_title=parsed.chapter_title,
+            content=content,
+            spans=spans
+        )
+        return True, output.model_copy(update={
+            # raw 是后续任务（重写评审）的上下文，只保留拼接后的正文。
+            "raw": json.dumps(
+                rewritten.model_dump(mode="json", exclude={"spans"}), ensure_ascii=False
+            ),
+            "pydantic": rewritten,
+            "output_format": OutputFormat.PYDANTIC,
+        })
+    return guardrail
+
+
+def is_span_rewrite(task: Task) -> bool:
+    return isinstance(task, (SpanRewriteTask, ConditionalSpanRewriteTask))
@@ -6,14 +6,14 @@ class AgentLogDAO:
     def __init__(self, mongo):
         self.col = mongo.collection("agent_logs")
 
-    def create(
+    def build(
         self,
         novel_id: str,
         agent_name: str,
         input_summary: str,
         output_summary: str
-    ):
-        doc = {
+    ) -> dict:
+        return {
             "_id": str(uuid.uuid4()),
             "novel_id": novel_id,
             "agent_name": agent_name,
@@ -21,5 +21,12 @@ class AgentLogDAO:
             "output_summary": output_summary,
             "created_at": datetime.utcnow()
         }
+
+    def create(self, **fields) -> dict:
+        doc = self.build(**fields)
         self.col.insert_one(doc)
         return doc
+
+    def insert_many(self, docs: list[dict], session=None) -> None:
+        if docs:
+            self.col.insert_many(docs, session=session)
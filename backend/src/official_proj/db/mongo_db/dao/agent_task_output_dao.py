@@ -24,3 +24,37 @@ class AgentTaskOutputDAO:
         }
         self.col.insert_one(doc)
         return doc
+
+    def save_checkpoint(
+        self,
+        run_id: str,
+        novel_id: str,
+        task_name: str,
+        output_type: str,
+        raw_output: str | None,
+        json_output: dict | list | None
+    ) -> None:
+        """写入某次运行中一个任务的输出（同一 run_id + task_name 覆盖）。"""
+        self.col.update_one(
+            {"run_id": run_id, "task_name": task_name},
+            {
+                "$set": {
+                    "novel_id": novel_id,
+                    "output_type": output_type,
+                    "raw_output": raw_output,
+                    "json_output": json_output,
+                    "created_at": datetime.utcnow()
+                },
+                "$setOnInsert": {"_id": str(uuid.uuid4())}
+            },
+            upsert=True
+        )
+
+    def list_by_run(self, run_id: str, since: datetime | None = None) -> list[dict]:
+        query: dict = {"run_id": run_id}
+        if since is not None:
+            query["created_at"] = {"$gte": since}
+        return list(self.col.find(query))
+
+    def delete_by_run(self, run_id: str) -> int:
+        return self.col.delete_many({"run_id": run_id}).deleted_count
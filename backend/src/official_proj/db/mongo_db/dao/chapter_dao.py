@@ -6,42 +6,65 @@ class ChapterDAO:
     def __init__(self, mongo):
         self.col = mongo.collection("chapters")
 
-    def create(
+    def build(
         self,
         novel_id: str,
         chapter_number: int,
         title: str,
-        content: str
+        content: str,
+        context_stats: dict | None = None,
+        rewrite_meta: dict | None = None
     ) -> dict:
+        """组装章节文档（不写库），供批量写入使用。"""
         doc = {
             "_id": str(uuid.uuid4()),
             "novel_id": novel_id,
             "chapter_number": chapter_number,
             "title": title,
             "content": content,
+            "word_count": len(content or ""),
             "created_at": datetime.utcnow()
         }
-        self.col.insert_one(doc)
+        # 续写时上下文裁剪的 token 统计（原始/实际/节省）。
+        if context_stats:
+            doc["context_stats"] = context_stats
+        # 重写信息随章节一起写入，无需事后 update。
+        if rewrite_meta:
+            doc["rewrite_meta"] = rewrite_meta
         return doc
 
-    def set_rewrite_meta(
+    def create(
         self,
-        chapter_id: str,
+        novel_id: str,
+        chapter_number: int,
+        title: str,
+        content: str,
+        context_stats: dict | None = None
+    ) -> dict:
+        doc = self.build(novel_id, chapter_number, title, content, context_stats)
+        self.col.insert_one(doc)
+        return doc
+
+    def insert_many(self, docs: list[dict], session=None) -> None:
+        if docs:
+            self.col.insert_many(docs, session=session)
+
+    @staticmethod
+    def build_rewrite_meta(
         reasons: list[str],
         original_title: str,
-        original_content: str
-    ) -> dict | None:
-        rewrite_meta = {
+        original_content: str,
+        spans: list[dict] | None = None
+    ) -> dict:
+        return {
             "reasons": reasons,
             "original_title": original_title,
             "original_content": original_content,
+            # 段落级重写记录每处改动（段落区间、问题、原文与新文本），整章重写为空。
+            "mode": "span" if spans else "full",
+            "spans": spans or [],
             "created_at": datetime.utcnow()
         }
-        self.col.update_one(
-            {"_id": chapter_id},
-            {"$set": {"rewrite_meta": rewrite_meta}}
-        )
-        return self.col.find_one({"_id": chapter_id})
 
     def get_last_chapter(self, novel_id: str) -> dict | None:
         return self.col.find_one(
@@ -49,6 +72,67 @@ class ChapterDAO:
             sort=[("chapter_number", -1)]
         )
 
+    def exists(self, novel_id: str, chapter_number: int) -> bool:
+        return self.col.count_documents(
+            {"novel_id": novel_id, "chapter_number": chapter_number},
+            limit=1
+        ) > 0
+
+    def list_index(
+        self,
+        novel_id: str,
+        after_number: int = 0,
+        limit: int = 50
+    ) -> list[dict]:
+        """目录分页：按章节号键集翻页，只返回元数据，不传输正文。
+
+        旧章节没有 word_count 字段时由服务端用 $strLenCP 计算。
+        """
+        return list(
+            self.col.aggregate([
+                {"$match": {
+                    "novel_id": novel_id,
+                    "chapter_number": {"$gt": after_number}
+                }},
+                {"$sort": {"chapter_number": 1}},
+                {"$limit": limit},
+                {"$project": {
+                    "chapter_number": 1,
+                    "title": 1,
+                    "word_count": {"$ifNull": [
+                        "$word_count",
+                        {"$strLenCP": {"$ifNull": ["$content", ""]}}
+                    ]}
+                }}
+            ])
+        )
+
+    def get_meta(self, novel_id: str, chapter_number: int) -> dict | None:
+        """单章元数据（不含正文），用于计算 ETag。"""
+        return self.col.find_one(
+            {"novel_id": novel_id, "chapter_number": chapter_number},
+            {"_id": 1, "created_at": 1, "updated_at": 1}
+        )
+
+    def get_by_number(self, novel_id: str, chapter_number: int) -> dict | None:
+        return self.col.find_one(
+            {"novel_id": novel_id, "chapter_number": chapter_number},
+            {
+                "chapter_number": 1,
+                "title": 1,
+                "content": 1,
+                "created_at": 1,
+                "updated_at": 1
+            }
+        )
+
+    def iter_for_export(self, novel_id: str, batch_size: int = 50):
+        """按章节号顺序返回游标，只投影导出所需字段，逐批从服务端拉取。"""
+        return self.col.find(
+            {"novel_id": novel_id},
+            {"chapter_number": 1, "title": 1, "content": 1, "_id": 0}
+        ).sort("chapter_number", 1).batch_size(batch_size)
+
     def list_by_novel(self, novel_id: str) -> list[dict]:
         return list(
             self.col.find(
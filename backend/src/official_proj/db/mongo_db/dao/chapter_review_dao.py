@@ -6,7 +6,7 @@ class ChapterReviewDAO:
     def __init__(self, mongo):
         self.col = mongo.collection("chapter_reviews")
 
-    def create(
+    def build(
         self,
         novel_id: str,
         chapter_id: str,
@@ -16,7 +16,7 @@ class ChapterReviewDAO:
         issues: list,
         summary: str
     ) -> dict:
-        doc = {
+        return {
             "_id": str(uuid.uuid4()),
             "novel_id": novel_id,
             "chapter_id": chapter_id,
@@ -27,11 +27,32 @@ class ChapterReviewDAO:
             "summary": summary,
             "created_at": datetime.utcnow()
         }
+
+    def create(self, **fields) -> dict:
+        doc = self.build(**fields)
         self.col.insert_one(doc)
         return doc
 
+    def insert_many(self, docs: list[dict], session=None) -> None:
+        if docs:
+            self.col.insert_many(docs, session=session)
+
     def get_latest_by_chapter(self, chapter_id: str) -> dict | None:
         return self.col.find_one(
             {"chapter_id": chapter_id},
             sort=[("created_at", -1)]
         )
+
+    def latest_scores(self, chapter_ids: list[str]) -> dict[str, int]:
+        """一次查询取多章最新评审的总分：chapter_id → overall_score。"""
+        if not chapter_ids:
+            return {}
+        scores: dict[str, int] = {}
+        cursor = self.col.find(
+            {"chapter_id": {"$in": chapter_ids}},
+            {"chapter_id": 1, "overall_score": 1, "_id": 0}
+        ).sort("created_at", 1)
+        for doc in cursor:
+            # 按时间升序遍历，后写入的评审覆盖先前的。
+            scores[doc["chapter_id"]] = doc.get("overall_score")
+        return scores
@@ -6,16 +6,23 @@ class CharacterDAO:
     def __init__(self, mongo):
         self.col = mongo.collection("characters")
 
-    def create(self, novel_id: str, **kwargs) -> dict:
-        doc = {
+    def build(self, novel_id: str, **kwargs) -> dict:
+        return {
             "_id": str(uuid.uuid4()),
             "novel_id": novel_id,
             **kwargs,
             "created_at": datetime.utcnow()
         }
+
+    def create(self, novel_id: str, **kwargs) -> dict:
+        doc = self.build(novel_id, **kwargs)
         self.col.insert_one(doc)
         return doc
 
+    def insert_many(self, docs: list[dict], session=None) -> None:
+        if docs:
+            self.col.insert_many(docs, session=session)
+
     def list_by_novel(self, novel_id: str) -> list[dict]:
         return list(self.col.find({"novel_id": novel_id}))
 
@@ -25,6 +32,20 @@ class CharacterDAO:
             "name": name
         })
 
+    def get_by_names(self, novel_id: str, names: list[str]) -> dict[str, dict]:
+        """一次 $in 查询取多个角色：name → {_id, name}。"""
+        if not names:
+            return {}
+        cursor = self.col.find(
+            {"novel_id": novel_id, "name": {"$in": list(names)}},
+            {"_id": 1, "name": 1}
+        )
+        return {doc["name"]: doc for doc in cursor}
+
+    def list_names(self, novel_id: str) -> list[dict]:
+        """小说的全部角色（只含 _id 与 name），用于角色名模糊匹配。"""
+        return list(self.col.find({"novel_id": novel_id}, {"_id": 1, "name": 1}))
+
 if __name__ == "__main__":
     from official_proj.db.mongo_db.mongo import MongoDB
     mongo = MongoDB()
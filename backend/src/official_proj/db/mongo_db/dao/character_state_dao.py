@@ -6,7 +6,7 @@ class CharacterStateDAO:
     def __init__(self, mongo):
         self.col = mongo.collection("character_states")
 
-    def create(
+    def build(
         self,
         character_name: str,
         character_id: str,
@@ -16,7 +16,7 @@ class CharacterStateDAO:
         goal: str,
         relationships: dict
     ) -> dict:
-        doc = {
+        return {
             "character_name": character_name,
             "_id": str(uuid.uuid4()),
             "character_id": character_id,
@@ -27,9 +27,16 @@ class CharacterStateDAO:
             "relationships": relationships,
             "created_at": datetime.utcnow()
         }
+
+    def create(self, **fields) -> dict:
+        doc = self.build(**fields)
         self.col.insert_one(doc)
         return doc
 
+    def insert_many(self, docs: list[dict], session=None) -> None:
+        if docs:
+            self.col.insert_many(docs, session=session)
+
     def get_latest(self, character_id: str) -> dict | None:
         return self.col.find_one(
             {"character_id": character_id},
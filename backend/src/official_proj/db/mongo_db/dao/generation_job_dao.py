@@ -0,0 +1,184 @@
+# official_proj/db/dao/generation_job_dao.py
+import uuid
+from datetime import datetime
+
+from pymongo import ReturnDocument
+
+# 任务状态：排队 → 运行 → 成功/失败。
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+JOB_TERMINAL_STATES = (JOB_SUCCEEDED, JOB_FAILED)
+
+
+def _active_key(novel_id: str, kind: str) -> str:
+    return f"{novel_id}:{kind}"
+
+
+class GenerationJobDAO:
+    def __init__(self, mongo):
+        self.col = mongo.collection("generation_jobs")
+
+    def ensure_indexes(self):
+        """排队中/运行中的任务带 active_key，结束时移除：唯一索引保证同一小说同类任务最多一个未结束。"""
+        self.col.create_index("active_key", unique=True, sparse=True)
+
+    def create(
+        self,
+        novel_id: str,
+        user_id: int,
+        kind: str,
+        inputs: dict
+    ) -> dict:
+        """写入排队中的任务；该小说已有未结束的同类任务时抛出 DuplicateKeyError。"""
+        now = datetime.utcnow()
+        doc = {
+            "_id": str(uuid.uuid4()),
+            "novel_id": novel_id,
+            "user_id": user_id,
+            "kind": kind,              # "init" / "next_chapter"
+            "active_key": _active_key(novel_id, kind),
+            "inputs": inputs,
+            "status": JOB_QUEUED,
+            "attempts": 0,
+            "owner": None,
+            # 事件写在 generation_job_events，这里只记录最新的 seq。
+            "last_seq": 0,
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+            "heartbeat_at": now
+        }
+        self.col.insert_one(doc)
+        return doc
+
+    def get(self, job_id: str) -> dict | None:
+        return self.col.find_one({"_id": job_id})
+
+    def find_active(self, novel_id: str, kind: str) -> dict | None:
+        """查找该小说排队中/运行中的同类任务。"""
+        return self.col.find_one(
+            {
+                "novel_id": novel_id,
+                "kind": kind,
+                "status": {"$in": [JOB_QUEUED, JOB_RUNNING]}
+            }
+        )
+
+    def set_inputs(self, job_id: str, inputs: dict):
+        """执行时补充的输入（如分配到的章节号）写回任务，重试时沿用。"""
+        self.col.update_one(
+            {"_id": job_id},
+            {"$set": {"inputs": inputs, "updated_at": datetime.utcnow()}}
+        )
+
+    def claim(self, job_id: str, owner: str) -> dict | None:
+        """原子地把排队中的任务标记为运行中，防止多个 worker 重复执行。"""
+        now = datetime.utcnow()
+        return self.col.find_one_and_update(
+            {"_id": job_id, "status": JOB_QUEUED},
+            {
+                "$set": {
+                    "status": JOB_RUNNING,
+                    "owner": owner,
+                    "started_at": now,
+                    "updated_at": now,
+                    "heartbeat_at": now
+                },
+                "$inc": {"attempts": 1}
+            },
+            return_document=ReturnDocument.AFTER
+        )
+
+    def set_last_seq(self, job_id: str, last_seq: int):
+        """事件写入后更新最新 seq（同时视为一次心跳）。"""
+        now = datetime.utcnow()
+        self.col.update_one(
+            {"_id": job_id},
+            {
+                "$set": {
+                    "last_seq": last_seq,
+                    "updated_at": now,
+                    "heartbeat_at": now
+                }
+            }
+        )
+
+    def heartbeat(self, job_id: str, owner: str):
+        self.col.update_one(
+            {"_id": job_id, "owner": owner, "status": JOB_RUNNING},
+            {"$set": {"heartbeat_at": datetime.utcnow()}}
+        )
+
+    def finish(
+        self,
+        job_id: str,
+        status: str,
+        result: dict | None = None,
+        error: str | None = None
+    ):
+        now = datetime.utcnow()
+        self.col.update_one(
+            {"_id": job_id},
+            {
+                "$set": {
+                    "status": status,
+                    "result": result,
+                    "error": error,
+                    "finished_at": now,
+                    "updated_at": now
+                },
+                "$unset": {"active_key": ""}
+            }
+        )
+
+    def requeue(self, job_id: str, stale_before: datetime) -> bool:
+        """把心跳超时的运行中任务重新排队（条件更新，避免与其他 worker 竞争）。"""
+        result = self.col.update_one(
+            {
+                "_id": job_id,
+                "status": JOB_RUNNING,
+                "heartbeat_at": {"$lt": stale_before}
+            },
+            {
+                "$set": {
+                    "status": JOB_QUEUED,
+                    "owner": None,
+                    "updated_at": datetime.utcnow()
+                }
+            }
+        )
+        return result.modified_count == 1
+
+    def fail_stale(self, job_id: str, stale_before: datetime, error: str) -> bool:
+        now = datetime.utcnow()
+        result = self.col.update_one(
+            {
+                "_id": job_id,
+                "status": JOB_RUNNING,
+                "heartbeat_at": {"$lt": stale_before}
+            },
+            {
+                "$set": {
+                    "status": JOB_FAILED,
+                    "error": error,
+                    "finished_at": now,
+                    "updated_at": now
+                },
+                "$unset": {"active_key": ""}
+            }
+        )
+        return result.modified_count == 1
+
+    def list_unfinished(self, updated_before: datetime) -> list[dict]:
+        """列出长时间无进展的排队/运行中任务。"""
+        return list(
+            self.col.find(
+                {
+                    "status": {"$in": [JOB_QUEUED, JOB_RUNNING]},
+                    "heartbeat_at": {"$lt": updated_before}
+                }
+            )
+        )
@@ -0,0 +1,58 @@
+# official_proj/db/dao/generation_job_event_dao.py
+from datetime import datetime
+
+# seq 定长编码的位数。
+_SEQ_DIGITS = 12
+
+
+def _event_id(job_id: str, seq: int) -> str:
+    # _id 由 (job_id, seq) 定长拼接：按 _id 范围查询即按 seq 顺序读取，无需额外索引。
+    return f"{job_id}:{seq:0{_SEQ_DIGITS}d}"
+
+
+class GenerationJobEventDAO:
+    """后台任务的进度事件：每条事件一个文档，不随事件增多撑大任务记录。"""
+
+    def __init__(self, mongo):
+        self.col = mongo.collection("generation_job_events")
+
+    def append(self, job_id: str, events: list[dict]):
+        if not events:
+            return
+        now = datetime.utcnow()
+        self.col.insert_many([
+            {
+                "_id": _event_id(job_id, event["seq"]),
+                "job_id": job_id,
+                **event,
+                "created_at": now
+            }
+            for event in events
+        ])
+
+    def delete_after(self, job_id: str, after_seq: int):
+        """删除 after_seq 之后的事件（中断的上一次执行已写入、但未记入 last_seq 的部分）。"""
+        self.col.delete_many(self._after(job_id, after_seq))
+
+    def list_after(
+        self,
+        job_id: str,
+        after_seq: int = 0,
+        limit: int = 500
+    ) -> list[dict]:
+        """按 seq 顺序读取 after_seq 之后的事件。"""
+        return list(
+            self.col.find(
+                self._after(job_id, after_seq),
+                {"_id": 0, "job_id": 0, "created_at": 0}
+            ).sort("_id", 1).limit(limit)
+        )
+
+    @staticmethod
+    def _after(job_id: str, after_seq: int) -> dict:
+        return {
+            "_id": {
+                "$gt": _event_id(job_id, after_seq),
+                "$lte": _event_id(job_id, 10 ** _SEQ_DIGITS - 1)
+            }
+        }
@@ -0,0 +1,59 @@
+# official_proj/db/dao/generation_lease_dao.py
+from datetime import datetime, timedelta
+
+from pymongo.errors import DuplicateKeyError
+
+
+class GenerationLeaseDAO:
+    """每本小说一条租约文档（_id = novel_id），保证同一时刻只有一个生成在跑。"""
+
+    def __init__(self, mongo):
+        self.col = mongo.collection("generation_leases")
+
+    def acquire(
+        self,
+        novel_id: str,
+        holder: str,
+        ttl_seconds: float,
+        kind: str
+    ) -> bool:
+        """租约不存在、已过期或本就属于 holder 时获取成功。"""
+        now = datetime.utcnow()
+        try:
+            self.col.update_one(
+                {
+                    "_id": novel_id,
+                    "$or": [
+                        {"expires_at": {"$lt": now}},
+                        {"holder": holder}
+                    ]
+                },
+                {
+                    "$set": {
+                        "holder": holder,
+                        "kind": kind,
+                        "acquired_at": now,
+                        "expires_at": now + timedelta(seconds=ttl_seconds)
+                    }
+                },
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # 条件不满足时 upsert 会尝试插入同 _id 文档：说明租约被他人持有。
+            return False
+        return True
+
+    def renew(self, novel_id: str, holder: str, ttl_seconds: float) -> bool:
+        result = self.col.update_one(
+            {"_id": novel_id, "holder": holder},
+            {"$set": {
+                "expires_at": datetime.utcnow() + timedelta(seconds=ttl_seconds)
+            }}
+        )
+        return result.matched_count == 1
+
+    def release(self, novel_id: str, holder: str):
+        self.col.delete_one({"_id": novel_id, "holder": holder})
+
+    def get(self, novel_id: str) -> dict | None:
+        return self.col.find_one({"_id": novel_id})
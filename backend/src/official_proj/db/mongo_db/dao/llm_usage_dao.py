@@ -0,0 +1,53 @@
+# official_proj/db/dao/llm_usage_dao.py
+
+# 汇总时累加的数值字段。
+_SUM_FIELDS = (
+    "prompt_tokens",
+    "completion_tokens",
+    "total_tokens",
+    "duration_ms",
+)
+
+
+class LLMUsageDAO:
+    """LLM 调用明细：每次调用一条，写入由 LLMUsageRecorder 批量完成。"""
+
+    def __init__(self, mongo):
+        self.col = mongo.collection("llm_usage")
+
+    def insert_many(self, docs: list[dict]) -> None:
+        if docs:
+            # 无序写入：单条失败不影响同批其他记录。
+            self.col.insert_many(docs, ordered=False)
+
+    def rollup(
+        self,
+        match: dict,
+        group_by: list[str],
+        sort: dict | None = None
+    ) -> list[dict]:
+        """按 group_by 字段汇总 token、耗时、首 token 延迟与输出速度（默认按 token 数降序）。"""
+        group_id = {key: f"${key}" for key in group_by}
+        group = {
+            "_id": group_id,
+            "calls": {"$sum": 1},
+            "failed_calls": {"$sum": {"$cond": ["$success", 0, 1]}},
+            "retried_attempts": {"$sum": {"$max": [{"$subtract": ["$attempts", 1]}, 0]}},
+            "avg_ttft_ms": {"$avg": "$ttft_ms"},
+            "max_ttft_ms": {"$max": "$ttft_ms"},
+            "avg_tokens_per_second": {"$avg": "$tokens_per_second"},
+            **{key: {"$sum": f"${key}"} for key in _SUM_FIELDS},
+        }
+        rows = self.col.aggregate([
+            {"$match": match},
+            {"$group": group},
+            {"$sort": sort or {"total_tokens": -1}},
+        ])
+        result = []
+        for row in rows:
+            keys = row.pop("_id") or {}
+            for field in ("avg_ttft_ms", "max_ttft_ms", "avg_tokens_per_second"):
+                if row.get(field) is not None:
+                    row[field] = round(row[field], 1)
+            result.append({**keys, **row})
+        return result
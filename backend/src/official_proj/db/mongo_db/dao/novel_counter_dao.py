@@ -0,0 +1,67 @@
+# official_proj/db/dao/novel_counter_dao.py
+from datetime import datetime
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+
+class NovelCounterDAO:
+    """每本小说的计数器文档（_id = novel_id）：章节号与导出版本，均以 $inc 原子更新。"""
+
+    def __init__(self, mongo):
+        self.col = mongo.collection("novel_counters")
+
+    def increment_chapter(self, novel_id: str) -> int | None:
+        """计数器加一并返回新章节号；计数器尚未建立时返回 None。"""
+        doc = self.col.find_one_and_update(
+            {"_id": novel_id, "last_chapter_number": {"$exists": True}},
+            {"$inc": {"last_chapter_number": 1}},
+            return_document=ReturnDocument.AFTER
+        )
+        return doc["last_chapter_number"] if doc else None
+
+    def seed_chapter(self, novel_id: str, last_chapter_number: int):
+        """以现有最大章节号初始化计数器（$max 幂等，不会回退）。"""
+        try:
+            self.col.update_one(
+                {"_id": novel_id},
+                {"$max": {"last_chapter_number": last_chapter_number}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # 并发初始化时另一方已插入，$max 语义下无需重试。
+            pass
+
+    def release_chapter(self, novel_id: str, chapter_number: int) -> bool:
+        """生成失败时归还章节号（仅当它仍是最新分配的号码）。"""
+        result = self.col.update_one(
+            {"_id": novel_id, "last_chapter_number": chapter_number},
+            {"$inc": {"last_chapter_number": -1}}
+        )
+        return result.modified_count == 1
+
+    def bump_export_version(self, novel_id: str) -> int:
+        """章节/世界观写入后递增导出版本，使已缓存的导出文件失效。"""
+        update = {
+            "$inc": {"export_version": 1},
+            "$set": {"content_updated_at": datetime.utcnow()}
+        }
+        try:
+            doc = self.col.find_one_and_update(
+                {"_id": novel_id},
+                update,
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # 并发 upsert 时文档已由另一方插入，直接更新即可。
+            doc = self.col.find_one_and_update(
+                {"_id": novel_id},
+                update,
+                return_document=ReturnDocument.AFTER
+            )
+        return doc["export_version"]
+
+    def get_export_version(self, novel_id: str) -> int:
+        doc = self.col.find_one({"_id": novel_id}, {"export_version": 1})
+        return (doc or {}).get("export_version", 0)
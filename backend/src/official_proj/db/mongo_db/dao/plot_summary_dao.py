@@ -6,14 +6,14 @@ class PlotSummaryDAO:
     def __init__(self, mongo):
         self.col = mongo.collection("plot_summaries")
 
-    def create(
+    def build(
         self,
         novel_id: str,
         chapter_id: str,
         key_events: list,
         consequences: list
     ) -> dict:
-        doc = {
+        return {
             "_id": str(uuid.uuid4()),
             "novel_id": novel_id,
             "chapter_id": chapter_id,
@@ -21,9 +21,16 @@ class PlotSummaryDAO:
             "consequences": consequences,
             "created_at": datetime.utcnow()
         }
+
+    def create(self, **fields) -> dict:
+        doc = self.build(**fields)
         self.col.insert_one(doc)
         return doc
 
+    def insert_many(self, docs: list[dict], session=None) -> None:
+        if docs:
+            self.col.insert_many(docs, session=session)
+
     def list_recent(self, novel_id: str, limit: int = 5) -> list[dict]:
         # 投影参数：1=保留该字段，0=排除该字段
         # 注意：_id字段默认会返回，需要显式设为0排除
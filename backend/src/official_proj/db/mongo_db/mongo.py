@@ -1,5 +1,6 @@
 # official_proj/db/mongo.py
 from pymongo import MongoClient
+from pymongo.errors import PyMongoError
 
 class MongoDB:
     def __init__(
@@ -9,6 +10,30 @@ class MongoDB:
     ):
         self.client = MongoClient(uri)
         self.db = self.client[db_name]
+        self._supports_transactions: bool | None = None
 
     def collection(self, name: str):
         return self.db[name]
+
+    def supports_transactions(self) -> bool:
+        """副本集或分片集群才支持多文档事务；单机部署返回 False（探测结果缓存）。"""
+        if self._supports_transactions is None:
+            try:
+                hello = self.client.admin.command("hello")
+            except PyMongoError:
+                # 暂时连不上时不缓存，下次写入再探测。
+                return False
+            self._supports_transactions = bool(
+                hello.get("setName") or hello.get("msg") == "isdbgrid"
+            )
+        return self._supports_transactions
+
+    def run_in_transaction(self, callback):
+        """在一个事务中执行 callback(session)；不支持事务时以 session=None 直接执行。
+
+        with_transaction 遇到瞬时错误会重跑 callback，callback 需可重复执行。
+        """
+        if not self.supports_transactions():
+            return callback(None)
+        with self.client.start_session() as session:
+            return session.with_transaction(callback)
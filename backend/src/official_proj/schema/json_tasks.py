@@ -78,6 +78,16 @@ class WritingTaskOutput(BaseModel):
 
 
 # 7. 章节重写
+class RewriteSpan(BaseModel):
+    """段落级重写的一处改动（段落编号从 1 开始，闭区间）。"""
+
+    start: int
+    end: int
+    issue: str = ""
+    original: str
+    rewritten: str
+
+
 class ChapterRewriteOutput(BaseModel):
     """章节重写输出（原稿未达标时）。"""
 
@@ -90,6 +100,27 @@ class ChapterRewriteOutput(BaseModel):
     content: str = Field(
         description="重写后的章节正文内容"
     )
+    spans: List[RewriteSpan] = Field(
+        default_factory=list,
+        description="段落级重写的改动记录，整章重写时为空"
+    )
+
+
+class ParagraphEdit(BaseModel):
+    """段落级重写中模型给出的一处替换。"""
+
+    start: int = Field(description="起始段落编号（从 1 开始）")
+    end: int = Field(description="结束段落编号（含）")
+    issue: str = Field(default="", description="对应的评审问题")
+    content: str = Field(description="替换这些段落的新文本")
+
+
+class ChapterSpanRewriteOutput(BaseModel):
+    """段落级重写的模型输出：只包含需要替换的段落。"""
+
+    fail_reasons: List[str]
+    chapter_title: str
+    edits: List[ParagraphEdit]
 
 
 # 8. 章节评审
@@ -1,10 +1,29 @@
+import logging
+import os
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterator
+
 from official_proj.crews.chapter_crew import ChapterCrew
 from official_proj.db.mongo_db.dao.chapter_dao import ChapterDAO
 from official_proj.db.mongo_db.dao.character_state_dao import CharacterStateDAO
 from official_proj.db.mongo_db.dao.plot_summary_dao import PlotSummaryDAO
 from official_proj.db.mongo_db.dao.world_setting_dao import WorldSettingDAO
 from official_proj.services.chapter_persist_service import persist_chapter_result
+from official_proj.services.generation_guard import NovelGenerationGuard
 from official_proj.services.knowledge_cleanup import cleanup_generated_knowledge
+from official_proj.services.llm_scheduler import tenant_for
+from official_proj.services.llm_usage import usage_tags_for
+from official_proj.services.post_writing_runner import run_post_writing
+from official_proj.services.prompt_context import assemble_chapter_context
+from official_proj.services.task_checkpoint import TaskCheckpointStore, chapter_run_id
+from official_proj.utils.task_outputs import extract_writing
+
+logger = logging.getLogger(__name__)
+
+# 单次批量生成的章节数上限。
+CHAPTER_BATCH_MAX = int(os.getenv("CHAPTER_BATCH_MAX", "50"))
 
 
 class ChapterLoopRunner:
@@ -15,50 +34,260 @@ class ChapterLoopRunner:
         self.plot_dao = PlotSummaryDAO(mongo)
         self.state_dao = CharacterStateDAO(mongo)
         self.world_dao = WorldSettingDAO(mongo)
+        self.guard = NovelGenerationGuard(mongo)
+        self.checkpoints = TaskCheckpointStore(mongo)
 
-    def run_one_chapter(self, novel_id: str):
-        # 1️⃣ 章节号
-        last = self.chapter_dao.get_last_chapter(novel_id)
-        chapter_number = 1 if not last else last["chapter_number"] + 1
+    def run_one_chapter(self, novel_id: str, user_id: int | None = None) -> tuple[int, dict]:
+        """生成并落库一章，返回 (章节号, task_outputs)。
+
+        已有生成进行中时抛出 GenerationInProgressError。
+        """
+        holder = str(uuid.uuid4())
+        self.guard.acquire(novel_id, holder, "next_chapter")
+        with self.guard.keep_alive(novel_id, holder):
+            return self._run_one_chapter(novel_id, user_id)
 
-        # 2️⃣ 世界观（只读）
+    def _load_context(self, novel_id: str) -> tuple[list, list]:
+        # 1️⃣ 世界观（只读）
         world = self.world_dao.get_latest(novel_id)
         if not world:
             raise RuntimeError("World not initialized")
 
-        # 3️⃣ 上一章剧情（结构化）
+        # 2️⃣ 上一章剧情（结构化）
         last_plot_doc = self.plot_dao.list_recent(novel_id, limit=1)
         last_plot = (
             last_plot_doc[0]["key_events"]
             if last_plot_doc else []
         )
+        return world, last_plot
 
+    @staticmethod
+    def _chapter_inputs(
+        novel_id: str,
+        chapter_number: int,
+        world,
+        last_plot,
+        user_id: int | None
+    ) -> dict:
         inputs = {
             "novel_id": novel_id,
             "chapter_number": chapter_number,
-            "world": world,
-            "last_plot": last_plot,
+            **assemble_chapter_context(world, last_plot),
         }
+        if user_id is not None:
+            inputs["user_id"] = user_id
+        return inputs
 
-        crew = ChapterCrew().crew()
-        crew.kickoff(inputs=inputs)
+    def _run_writing(self, factory: ChapterCrew, inputs: dict, run_id: str) -> tuple[dict, dict]:
+        """写作阶段（断点恢复已完成的任务），返回 (task_outputs, completed)。"""
+        completed = self.checkpoints.load(run_id, factory.output_models())
+        crew = factory.crew(completed)
+        task_outputs = dict(completed)
+        if crew is not None:
+            self.checkpoints.attach([crew], run_id, inputs["novel_id"])
+            crew.kickoff(inputs=inputs)
+            task_outputs.update({
+                task.name: task.output
+                for task in crew.tasks
+            })
+        return task_outputs, completed
 
-        task_outputs = {
-            task.name: task.output
-            for task in crew.tasks
-        }
+    def _post_writing_crews(self, factory: ChapterCrew, completed: dict, inputs: dict, run_id: str) -> dict:
+        crews = factory.post_writing_crews(completed)
+        self.checkpoints.attach(crews.values(), run_id, inputs["novel_id"])
+        return crews
+
+    def _run_one_chapter(self, novel_id: str, user_id: int | None) -> tuple[int, dict]:
+        world, last_plot = self._load_context(novel_id)
+
+        # 3️⃣ 章节号（计数器原子分配）
+        chapter_number = self.guard.allocate_chapter_number(novel_id)
+        inputs = self._chapter_inputs(novel_id, chapter_number, world, last_plot, user_id)
+
+        # 同一章的重试共用 run id：已完成的任务从断点恢复，不再重复执行。
+        run_id = chapter_run_id(inputs)
+
+        try:
+            factory = ChapterCrew(tenant_for(inputs), usage_tags_for(inputs))
+            task_outputs, completed = self._run_writing(factory, inputs, run_id)
+
+            # 剧情分析与记忆更新并行执行。
+            run_post_writing(
+                self._post_writing_crews(factory, completed, inputs, run_id),
+                inputs,
+                task_outputs
+            )
+        except Exception:
+            self.guard.release_chapter_number(novel_id, chapter_number)
+            cleanup_generated_knowledge()
+            raise
 
         try:
             persist_chapter_result(
                 mongo=self.mongo,
                 novel_id=novel_id,
                 chapter_number=chapter_number,
-                task_outputs=task_outputs
+                task_outputs=task_outputs,
+                context_stats=inputs["context_stats"]
             )
         except Exception:
             print("❌ Persist failed")
+            self.guard.release_chapter_number(novel_id, chapter_number)
             raise
         finally:
             cleanup_generated_knowledge()
+        self.checkpoints.clear(run_id)
+
+        return chapter_number, task_outputs
+
+    # ========= 批量生成 =========
+
+    def batch_target(self, novel_id: str, count: int) -> int:
+        """批量生成的目标章节号：当前最后一章 + count。"""
+        if not 1 <= count <= CHAPTER_BATCH_MAX:
+            raise ValueError(f"count must be between 1 and {CHAPTER_BATCH_MAX}")
+        last = self.chapter_dao.get_last_chapter(novel_id)
+        return (last["chapter_number"] if last else 0) + count
+
+    def iter_batch(
+        self,
+        novel_id: str,
+        until_chapter: int,
+        user_id: int | None = None
+    ) -> Iterator[dict]:
+        """流水线式生成章节直到 until_chapter（租约由调用方持有）。
+
+        下一章只依赖本章的最终正文与剧情分析，因此本章剧情分析完成后立即开始下一章写作，
+        本章的记忆更新与落库在后台线程继续进行。落库按章节顺序串行，最多一章在途。
+        逐章产出 chapter_done 事件，最后产出包含吞吐量（章/小时）的 final 事件。
+        中途失败时等在途落库结束，倒序归还未落库的章节号后抛出异常。
+        """
+        world, last_plot = self._load_context(novel_id)
+        last = self.chapter_dao.get_last_chapter(novel_id)
+        count = until_chapter - (last["chapter_number"] if last else 0)
+
+        started = time.perf_counter()
+        allocated: list[int] = []
+        done: list[dict] = []
+        in_flight: Future | None = None
+
+        pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="chapter-batch")
+        try:
+            for _ in range(max(count, 0)):
+                chapter_started = time.perf_counter()
+                chapter_number = self.guard.allocate_chapter_number(novel_id)
+                allocated.append(chapter_number)
+                inputs = self._chapter_inputs(novel_id, chapter_number, world, last_plot, user_id)
+                run_id = chapter_run_id(inputs)
+                yield {"type": "progress", "task": "writing_task", "chapter_number": chapter_number}
+
+                factory = ChapterCrew(tenant_for(inputs), usage_tags_for(inputs))
+                task_outputs, completed = self._run_writing(factory, inputs, run_id)
+
+                # 记忆更新放到后台，剧情分析留在关键路径上（下一章要用）。
+                post_crews = self._post_writing_crews(factory, completed, inputs, run_id)
+                memory_crews = {
+                    name: crew for name, crew in post_crews.items()
+                    if name == "memory_update_task"
+                }
+                memory_future = pool.submit(
+                    run_post_writing, memory_crews, inputs, dict(task_outputs)
+                )
+                run_post_writing(
+                    {
+                        name: crew for name, crew in post_crews.items()
+                        if name not in memory_crews
+                    },
+                    inputs,
+                    task_outputs
+                )
+                plot = task_outputs.get("plot_analysis_task")
+                if plot is not None and plot.pydantic is not None:
+                    last_plot = plot.pydantic.key_events
+
+                # 上一章落库完成后再提交本章，保证落库顺序。
+                if in_flight is not None:
+                    previous, in_flight = in_flight, None
+                    done.append(previous.result())
+                    yield {"type": "chapter_done", "data": done[-1]}
+                in_flight = pool.submit(
+                    self._finish_chapter,
+                    inputs,
+                    task_outputs,
+                    memory_future,
+                    run_id,
+                    chapter_started
+                )
+
+            if in_flight is not None:
+                previous, in_flight = in_flight, None
+                done.append(previous.result())
+                yield {"type": "chapter_done", "data": done[-1]}
+        except BaseException:
+            if in_flight is not None:
+                try:
+                    in_flight.result()
+                except Exception:
+                    logger.exception("batch persist failed for %s", novel_id)
+            # 计数器只能从最新的章节号往回退，因此倒序归还（已落库的会被跳过）。
+            for chapter_number in reversed(allocated):
+                self.guard.release_chapter_number(novel_id, chapter_number)
+            raise
+        finally:
+            pool.shutdown(wait=True)
+            cleanup_generated_knowledge()
+
+        seconds = time.perf_counter() - started
+        result = {
+            "novel_id": novel_id,
+            "chapters": done,
+            "chapter_count": len(done),
+            "seconds": round(seconds, 3),
+            "chapters_per_hour": round(len(done) * 3600 / seconds, 2) if seconds else 0.0,
+        }
+        logger.info(
+            "batch %s: %d chapters in %.1fs (%.2f chapters/hour)",
+            novel_id, len(done), seconds, result["chapters_per_hour"]
+        )
+        yield {"type": "final", "data": result}
+
+    def _finish_chapter(
+        self,
+        inputs: dict,
+        task_outputs: dict,
+        memory_future: Future,
+        run_id: str,
+        chapter_started: float
+    ) -> dict:
+        """等待记忆更新后落库一章，返回章节摘要。"""
+        memory_outputs = memory_future.result()
+        if "memory_update_task" in memory_outputs:
+            task_outputs["memory_update_task"] = memory_outputs["memory_update_task"]
+        persist_chapter_result(
+            mongo=self.mongo,
+            novel_id=inputs["novel_id"],
+            chapter_number=inputs["chapter_number"],
+            task_outputs=task_outputs,
+            context_stats=inputs["context_stats"]
+        )
+        self.checkpoints.clear(run_id)
+        return {
+            "chapter_number": inputs["chapter_number"],
+            "title": extract_writing(task_outputs).final_title,
+            "seconds": round(time.perf_counter() - chapter_started, 3),
+        }
+
+    def run_batch(self, novel_id: str, count: int, user_id: int | None = None) -> dict:
+        """同步批量生成 count 章，返回吞吐量统计。
 
-        return task_outputs
+        已有生成进行中时抛出 GenerationInProgressError。
+        """
+        until_chapter = self.batch_target(novel_id, count)
+        holder = str(uuid.uuid4())
+        self.guard.acquire(novel_id, holder, "chapter_batch")
+        result: dict = {}
+        with self.guard.keep_alive(novel_id, holder):
+            for event in self.iter_batch(novel_id, until_chapter, user_id):
+                if event["type"] == "final":
+                    result = event["data"]
+        return result
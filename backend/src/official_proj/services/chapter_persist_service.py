@@ -1,90 +1,121 @@
-"""章节结果持久化服务：将任务输出写入 MongoDB."""
+"""章节结果持久化服务：将任务输出写入 MongoDB.
 
+一章的章节、重写信息、剧情分析、人物状态（及自动建档的新角色）、评审（初始化时还有
+agent 日志）先在内存中组装为 ChapterDocuments，再按集合各一次 insert_many 写入；
+MongoDB 为副本集时在同一事务中提交，章节与其附属记录要么全部写入，要么都不写入。
+"""
+
+from dataclasses import dataclass, field
+
+from official_proj.db.mongo_db.dao.agent_log_dao import AgentLogDAO
 from official_proj.db.mongo_db.dao.chapter_dao import ChapterDAO
+from official_proj.db.mongo_db.dao.character_dao import CharacterDAO
 from official_proj.db.mongo_db.dao.character_state_dao import CharacterStateDAO
 from official_proj.db.mongo_db.dao.plot_summary_dao import PlotSummaryDAO
 from official_proj.db.mongo_db.dao.chapter_review_dao import ChapterReviewDAO
-from official_proj.services.character_state_persist_service import persist_character_state
+from official_proj.services.character_state_persist_service import build_character_states
+from official_proj.services.export_cache import invalidate_novel_exports
 from official_proj.utils.task_outputs import extract_writing, iter_review_outputs
 
 
-def persist_chapter_result(
+@dataclass
+class ChapterDocuments:
+    """一章任务输出对应的全部待写入文档。"""
+
+    chapter: dict
+    characters: list[dict] = field(default_factory=list)
+    plot_summaries: list[dict] = field(default_factory=list)
+    character_states: list[dict] = field(default_factory=list)
+    reviews: list[dict] = field(default_factory=list)
+    agent_logs: list[dict] = field(default_factory=list)
+
+    @property
+    def chapter_id(self) -> str:
+        return self.chapter["_id"]
+
+
+def _pydantic(task_outputs: dict, task_name: str):
+    # 可选任务可能不存在或未解析出结构化输出。
+    output = task_outputs.get(task_name)
+    return getattr(output, "pydantic", None) if output is not None else None
+
+
+def build_chapter_documents(
     mongo,
     novel_id: str,
     chapter_number: int,
-    task_outputs: dict
-):
-    """将一章的任务输出统一落库（章节、剧情、人物状态、评审）。"""
-    # 初始化 DAO，复用同一 MongoDB 连接。
+    task_outputs: dict,
+    context_stats: dict | None = None
+) -> ChapterDocuments:
+    """按任务输出组装一章的全部文档（只读查询角色，不写库）。"""
     chapter_dao = ChapterDAO(mongo)
     plot_dao = PlotSummaryDAO(mongo)
-    state_dao = CharacterStateDAO(mongo)
     review_dao = ChapterReviewDAO(mongo)
 
-    # print("🧪 task_outputs keys:", task_outputs.keys())
-    #
-    # for name, output in task_outputs.items():
-    #     print(f"\n--- {name} ---")
-    #     print("raw:", output.raw)
-    #     print("pydantic:", output.pydantic)
-
     # ---------- 章节 ----------
     # 抽取最终正文与重写信息（重写优先）。
     writing_pack = extract_writing(task_outputs)
     writing = writing_pack.writing_output
     rewrite_output = writing_pack.rewrite_output
 
-    chapter = chapter_dao.create(
-        novel_id=novel_id,
-        chapter_number=chapter_number,
-        title=writing_pack.final_title,
-        content=writing_pack.final_content
-    )
-    chapter_id = chapter["_id"]
-
     # 有重写时记录原始内容与重写原因，便于回溯。
+    rewrite_meta = None
     if rewrite_output:
-        chapter_dao.set_rewrite_meta(
-            chapter_id=chapter_id,
+        rewrite_meta = chapter_dao.build_rewrite_meta(
             reasons=rewrite_output.fail_reasons,
             original_title=writing.chapter_title,
-            original_content=writing.content
+            original_content=writing.content,
+            spans=[span.model_dump() for span in rewrite_output.spans]
         )
 
+    documents = ChapterDocuments(
+        chapter=chapter_dao.build(
+            novel_id=novel_id,
+            chapter_number=chapter_number,
+            title=writing_pack.final_title,
+            content=writing_pack.final_content,
+            context_stats=context_stats,
+            rewrite_meta=rewrite_meta
+        )
+    )
+    chapter_id = documents.chapter_id
+
     # ---------- 剧情分析 ----------
-    # 可选任务：剧情分析可能不存在。
-    if "plot_analysis_task" in task_outputs:
-        analysis = task_outputs["plot_analysis_task"].pydantic
-        plot_dao.create(
+    analysis = _pydantic(task_outputs, "plot_analysis_task")
+    if analysis:
+        documents.plot_summaries.append(plot_dao.build(
             novel_id=novel_id,
             chapter_id=chapter_id,
             key_events=analysis.key_events,
             consequences=analysis.consequences
-        )
+        ))
 
     # ---------- 人物状态 ----------
-    # 可选任务：人物状态更新可能不存在。
-    if "memory_update_task" in task_outputs:
-        memory = task_outputs["memory_update_task"].pydantic
-        for s in memory.states:
-            # 逐个角色状态写入，内部会校验角色是否存在。
-            persist_character_state(
-                mongo=mongo,
-                novel_id=novel_id,
-                chapter_id=chapter_id,
-                state={
+    memory = _pydantic(task_outputs, "memory_update_task")
+    if memory and memory.states:
+        # 一次查询解析全部角色名；无法匹配的按配置自动建档或跳过。
+        state_batch = build_character_states(
+            mongo=mongo,
+            novel_id=novel_id,
+            chapter_id=chapter_id,
+            states=[
+                {
                     "character_name": s.character_name,
                     "location": s.location,
                     "emotion": s.emotion,
                     "goal": s.goal,
                     "relationships": s.relationships
                 }
-            )
+                for s in memory.states
+            ]
+        )
+        documents.characters = state_batch.characters
+        documents.character_states = state_batch.states
 
     # ---------- 章节评审 ----------
-    # 按顺序写入普通评审与重写评审（如存在）。
+    # 按顺序记录普通评审与重写评审（如存在）。
     for review in iter_review_outputs(task_outputs):
-        review_dao.create(
+        documents.reviews.append(review_dao.build(
             novel_id=novel_id,
             chapter_id=chapter_id,
             overall_score=review.overall_score,
@@ -92,4 +123,45 @@ def persist_chapter_result(
             off_topic=review.off_topic,
             issues=review.issues,
             summary=review.summary
-        )
+        ))
+    return documents
+
+
+def write_chapter_documents(mongo, documents: ChapterDocuments) -> None:
+    """按集合批量写入一章的文档（支持事务时在同一事务中提交）。"""
+    chapter_dao = ChapterDAO(mongo)
+    character_dao = CharacterDAO(mongo)
+    plot_dao = PlotSummaryDAO(mongo)
+    state_dao = CharacterStateDAO(mongo)
+    review_dao = ChapterReviewDAO(mongo)
+    agent_log_dao = AgentLogDAO(mongo)
+
+    def write(session):
+        # 章节先写，无事务时中途失败也不会留下没有章节的附属记录。
+        chapter_dao.insert_many([documents.chapter], session=session)
+        character_dao.insert_many(documents.characters, session=session)
+        plot_dao.insert_many(documents.plot_summaries, session=session)
+        state_dao.insert_many(documents.character_states, session=session)
+        review_dao.insert_many(documents.reviews, session=session)
+        agent_log_dao.insert_many(documents.agent_logs, session=session)
+
+    mongo.run_in_transaction(write)
+
+
+def persist_chapter_result(
+    mongo,
+    novel_id: str,
+    chapter_number: int,
+    task_outputs: dict,
+    context_stats: dict | None = None
+):
+    """将一章的任务输出统一落库（章节、剧情、人物状态、评审）。"""
+    documents = build_chapter_documents(
+        mongo, novel_id, chapter_number, task_outputs, context_stats
+    )
+    try:
+        write_chapter_documents(mongo, documents)
+    finally:
+        # 章节可能已写入，旧的导出缓存失效。
+        invalidate_novel_exports(mongo, novel_id)
+    return documents
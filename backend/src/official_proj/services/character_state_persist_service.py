@@ -1,38 +1,151 @@
-"""人物状态持久化服务。"""
+"""人物状态持久化服务。
+
+一章的全部人物状态批量处理：角色名用一次 $in 查询解析；未命中的名字再对照小说的角色表
+统一做模糊匹配（去括号注释、包含关系、相似度），仍无法匹配的按配置自动建档或跳过。
+这里只组装文档，由 chapter_persist_service 与章节其他记录一起批量写入。
+"""
+
+import difflib
+import logging
+import os
+import re
+from dataclasses import dataclass, field
 
 from official_proj.db.mongo_db.dao.character_dao import CharacterDAO
 from official_proj.db.mongo_db.dao.character_state_dao import CharacterStateDAO
 from official_proj.db.mongo_db.mongo import MongoDB
 
+logger = logging.getLogger(__name__)
+
+# 无法匹配到已有角色时是否自动建档（默认跳过，与此前行为一致）。
+CHARACTER_AUTO_CREATE = os.getenv("CHARACTER_AUTO_CREATE", "0").lower() in ("1", "true", "yes")
+# 相似度匹配阈值：过低会把“沈知微”和“沈知秋”这类不同角色混为一人。
+CHARACTER_MATCH_CUTOFF = float(os.getenv("CHARACTER_MATCH_CUTOFF", "0.8"))
+
+# 模型常在角色名后附带身份注释，如“林照（主角）”。
+_ANNOTATION_RE = re.compile(r"[（(【\[].*?[）)】\]]")
+
+
+@dataclass
+class CharacterStateBatch:
+    """一章人物状态的解析结果。"""
+
+    # 自动建档的新角色（需先于状态写入）。
+    characters: list[dict] = field(default_factory=list)
+    states: list[dict] = field(default_factory=list)
+    # 未能对应到角色而跳过的名字。
+    skipped: list[str] = field(default_factory=list)
+
+
+def _normalize_name(name: str) -> str:
+    return re.sub(r"\s+", "", _ANNOTATION_RE.sub("", name or ""))
+
+
+def _fuzzy_match(name: str, known: dict[str, dict]) -> dict | None:
+    """在小说已有角色（规范化名 → 角色）中为 name 找唯一的对应角色。"""
+    normalized = _normalize_name(name)
+    if not normalized:
+        return None
+    if normalized in known:
+        return known[normalized]
+
+    # 简称或全称：“知微” / “沈知微”，只在唯一时采用。
+    if len(normalized) >= 2:
+        contained = [
+            key for key in known
+            if len(key) >= 2 and (key in normalized or normalized in key)
+        ]
+        if len(contained) == 1:
+            return known[contained[0]]
+
+    close = difflib.get_close_matches(
+        normalized, list(known), n=2, cutoff=CHARACTER_MATCH_CUTOFF
+    )
+    if len(close) == 1:
+        return known[close[0]]
+    return None
+
 
-def persist_character_state(
+def resolve_characters(
+    mongo: MongoDB,
+    novel_id: str,
+    names: list[str]
+) -> tuple[dict[str, dict], list[str]]:
+    """批量解析角色名，返回 (name → 角色 {_id, name}, 未匹配的名字)。"""
+    character_dao = CharacterDAO(mongo)
+    names = list(dict.fromkeys(name for name in names if name))
+    resolved = character_dao.get_by_names(novel_id, names)
+
+    missing = [name for name in names if name not in resolved]
+    if not missing:
+        return resolved, []
+
+    # 只有存在未命中的名字时才读取角色表做模糊匹配。
+    known = {
+        _normalize_name(doc["name"]): doc
+        for doc in character_dao.list_names(novel_id)
+    }
+    unmatched = []
+    for name in missing:
+        character = _fuzzy_match(name, known)
+        if character:
+            resolved[name] = character
+        else:
+            unmatched.append(name)
+    return resolved, unmatched
+
+
+def build_character_states(
     mongo: MongoDB,
     novel_id: str,
     chapter_id: str,
-    state: dict
-):
-    """将单个角色的状态写入数据库（角色不存在则跳过）。"""
-    # 初始化 DAO。
+    states: list[dict]
+) -> CharacterStateBatch:
+    """组装一章的人物状态文档（不写库）。"""
     character_dao = CharacterDAO(mongo)
     state_dao = CharacterStateDAO(mongo)
+    batch = CharacterStateBatch()
 
-    # 通过角色名查找角色主记录。
-    name = state["character_name"]
-
-    character = character_dao.get_by_name(
-        novel_id=novel_id,
-        name=name
-    )
-    if not character:
-        return
-
-    # 写入该角色在当前章节的状态。
-    state_dao.create(
-        character_id=character["_id"],
-        character_name=character["name"],
-        chapter_id=chapter_id,
-        location=state.get("location"),
-        emotion=state.get("emotion"),
-        goal=state.get("goal"),
-        relationships=state.get("relationships", {})
+    resolved, unmatched = resolve_characters(
+        mongo, novel_id, [state["character_name"] for state in states]
     )
+    # 同一新角色可能以不同写法出现（“阿福”“阿福（仆人）”），按规范化名只建一份档案。
+    created: dict[str, dict] = {}
+    for name in unmatched:
+        if CHARACTER_AUTO_CREATE:
+            normalized = _normalize_name(name) or name
+            character = created.get(normalized)
+            if character is None:
+                # 新角色只有名字，其余设定留空，由后续人物设定补全。
+                character = character_dao.build(
+                    novel_id=novel_id,
+                    name=normalized,
+                    role=None,
+                    auto_created=True,
+                    first_chapter_id=chapter_id
+                )
+                created[normalized] = character
+                batch.characters.append(character)
+            resolved[name] = character
+        else:
+            batch.skipped.append(name)
+    if batch.skipped:
+        logger.warning(
+            "novel %s: skip states of unknown characters %s", novel_id, batch.skipped
+        )
+
+    for state in states:
+        character = resolved.get(state["character_name"])
+        if not character:
+            continue
+        batch.states.append(state_dao.build(
+            character_id=character["_id"],
+            character_name=character["name"],
+            chapter_id=chapter_id,
+            location=state.get("location"),
+            emotion=state.get("emotion"),
+            goal=state.get("goal"),
+            relationships=state.get("relationships", {})
+        ))
+    return batch
+
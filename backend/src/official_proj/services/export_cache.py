@@ -0,0 +1,175 @@
+"""导出文件缓存：按小说与导出版本缓存渲染结果到本地磁盘。
+
+章节或世界观写入时递增小说的导出版本（MongoDB），版本号是缓存键的一部分，
+因此多 worker 下也不会读到过期文件；本机旧版本文件顺带删除。
+
+ETag 只取决于导出版本，describe 不渲染即可比对 If-None-Match；open 返回已打开的
+文件，之后文件被并发的 invalidate 删除也能完整发送。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO
+
+from official_proj.db.mongo_db.dao.chapter_dao import ChapterDAO
+from official_proj.db.mongo_db.dao.novel_counter_dao import NovelCounterDAO
+from official_proj.db.mongo_db.dao.world_setting_dao import WorldSettingDAO
+from official_proj.services.novel_export_service import (
+    EXPORT_BATCH_SIZE,
+    iter_novel_markdown,
+    iter_novel_text,
+    write_epub,
+    write_txt_zip
+)
+
+logger = logging.getLogger(__name__)
+
+# 缓存目录，默认位于 backend/export_cache。
+EXPORT_CACHE_DIR = Path(
+    os.getenv(
+        "EXPORT_CACHE_DIR",
+        str(Path(__file__).resolve().parents[3] / "export_cache")
+    )
+)
+# 渲染中断（进程被杀等）遗留的 .part 临时文件超过该秒数未修改即删除。
+EXPORT_PART_MAX_AGE_SECONDS = float(os.getenv("EXPORT_PART_MAX_AGE_SECONDS", "3600"))
+
+# 格式 → (文件后缀, Content-Type)。
+EXPORT_FORMATS = {
+    "txt": (".txt", "text/plain; charset=utf-8"),
+    "md": (".md", "text/markdown; charset=utf-8"),
+    "epub": (".epub", "application/epub+zip"),
+    "zip": (".txt.zip", "application/zip"),
+}
+
+
+@dataclass(frozen=True)
+class ExportArtifact:
+    """某一导出版本的文件（不保证已渲染）。"""
+
+    novel_id: str
+    fmt: str
+    version: int
+    path: Path
+    filename: str
+    media_type: str
+    etag: str
+
+
+def _novel_key(novel_id: str) -> str:
+    # novel_id 由用户提供，哈希后再作为文件名。
+    return hashlib.sha1(novel_id.encode("utf-8")).hexdigest()[:20]
+
+
+class NovelExportCache:
+    """渲染并缓存各格式导出文件。"""
+
+    def __init__(self, mongo, cache_dir: Path = EXPORT_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.chapter_dao = ChapterDAO(mongo)
+        self.world_dao = WorldSettingDAO(mongo)
+        self.counter_dao = NovelCounterDAO(mongo)
+
+    def describe(self, novel_id: str, fmt: str) -> ExportArtifact:
+        """当前导出版本的文件名与 ETag（只查版本号，不渲染）。"""
+        suffix, media_type = EXPORT_FORMATS[fmt]
+        version = self.counter_dao.get_export_version(novel_id)
+        key = _novel_key(novel_id)
+        return ExportArtifact(
+            novel_id=novel_id,
+            fmt=fmt,
+            version=version,
+            path=self.cache_dir / f"{key}-v{version}{suffix}",
+            filename=f"novel_{novel_id}{suffix}",
+            media_type=media_type,
+            etag=f'"{key}-{version}-{fmt}"'
+        )
+
+    def open(self, artifact: ExportArtifact, topic: str | None) -> BinaryIO:
+        """打开导出文件，未缓存时先渲染；调用方负责关闭。"""
+        try:
+            return artifact.path.open("rb")
+        except FileNotFoundError:
+            pass
+        fp = self._render(artifact.novel_id, topic, artifact.fmt, artifact.path)
+        self._remove_stale(_novel_key(artifact.novel_id), keep_version=artifact.version)
+        return fp
+
+    def invalidate(self, novel_id: str) -> None:
+        """递增导出版本并删除本机缓存文件。"""
+        version = self.counter_dao.bump_export_version(novel_id)
+        self._remove_stale(_novel_key(novel_id), keep_version=version)
+
+    def _render(self, novel_id: str, topic: str | None, fmt: str, path: Path) -> BinaryIO:
+        """先写临时文件再原子替换，并发渲染同一文件时读者不会看到半成品。
+
+        返回替换前打开的文件，替换后即被删除也不影响读取。
+        """
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        world = self.world_dao.get_latest_full(novel_id) or {}
+        chapters = self.chapter_dao.iter_for_export(
+            novel_id, batch_size=EXPORT_BATCH_SIZE
+        )
+
+        fd, tmp_name = tempfile.mkstemp(dir=self.cache_dir, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                if fmt == "txt":
+                    for piece in iter_novel_text(novel_id, topic, world, chapters):
+                        fp.write(piece.encode("utf-8"))
+                elif fmt == "md":
+                    for piece in iter_novel_markdown(novel_id, topic, world, chapters):
+                        fp.write(piece.encode("utf-8"))
+                elif fmt == "epub":
+                    write_epub(fp, novel_id, topic, world, chapters)
+                else:
+                    write_txt_zip(fp, novel_id, topic, world, chapters)
+            rendered = open(tmp_name, "rb")
+            try:
+                os.replace(tmp_name, path)
+            except BaseException:
+                rendered.close()
+                raise
+        except BaseException:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
+        return rendered
+
+    def _remove_stale(self, key: str, keep_version: int) -> None:
+        if not self.cache_dir.exists():
+            return
+        keep_prefix = f"{key}-v{keep_version}."
+        for stale in self.cache_dir.glob(f"{key}-v*"):
+            if stale.name.startswith(keep_prefix):
+                continue
+            try:
+                stale.unlink()
+            except OSError:
+                # 可能正被其他请求读取或删除，下次再清理。
+                continue
+        self._remove_orphaned_parts()
+
+    def _remove_orphaned_parts(self) -> None:
+        # 渲染中的临时文件持续写入，修改时间不会超过期限。
+        cutoff = time.time() - EXPORT_PART_MAX_AGE_SECONDS
+        for part in self.cache_dir.glob("*.part"):
+            try:
+                if part.stat().st_mtime < cutoff:
+                    part.unlink()
+            except OSError:
+                continue
+
+
+def invalidate_novel_exports(mongo, novel_id: str) -> None:
+    """落库流程调用：使该小说的导出缓存失效（失败不影响落库）。"""
+    try:
+        NovelExportCache(mongo).invalidate(novel_id)
+    except Exception:
+        logger.exception("invalidate exports for %s failed", novel_id)
@@ -0,0 +1,379 @@
+"""生成流程的事件流：运行 crew，产出 progress / title / content_delta / final 等事件。
+
+流式接口与后台任务共用这些同步生成器，它们应在生成线程池中迭代；
+续写另有异步版本（aiter_next_chapter_events），可直接在事件循环上迭代。
+"""
+
+import asyncio
+from functools import partial
+
+from official_proj.api.schemas.novel import ChapterResponse, InitResponse
+from official_proj.crews.chapter_crew import ChapterCrew
+from official_proj.crews.compete_crew import OfficialProj
+from official_proj.crews.span_rewrite import is_span_rewrite
+from official_proj.services.chapter_loop_runner import ChapterLoopRunner
+from official_proj.services.chapter_persist_service import persist_chapter_result
+from official_proj.services.crew_persist_runner import CrewPersistRunner
+from official_proj.services.knowledge_cleanup import cleanup_generated_knowledge
+from official_proj.services.llm_scheduler import tenant_for
+from official_proj.services.llm_usage import usage_tags_for
+from official_proj.services.post_writing_runner import aiter_post_writing, iter_post_writing
+from official_proj.services.streaming_helpers import ChapterJsonStreamParser
+from official_proj.services.task_checkpoint import TaskCheckpointStore, chapter_run_id
+from official_proj.services.task_graph import iter_task_graph
+from official_proj.utils.task_outputs import extract_writing, select_review
+
+
+def _chunk_text(chunk) -> str:
+    """从流式 chunk 中尽量提取文本字段。"""
+    for attr in ("content", "delta", "text", "chunk", "raw"):
+        value = getattr(chunk, attr, None)
+        if not value:
+            continue
+        if isinstance(value, bytes):
+            try:
+                return value.decode("utf-8")
+            except Exception:
+                continue
+        if isinstance(value, dict):
+            for key in ("content", "text", "delta"):
+                inner = value.get(key)
+                if isinstance(inner, str) and inner:
+                    return inner
+            continue
+        if isinstance(value, str):
+            return value
+    return ""
+
+
+def _task_outputs_from_result(result, fallback_tasks: list | None = None) -> dict:
+    """从 crew 结果中构建 task_outputs 字典（带回退逻辑）。"""
+    task_outputs: dict = {}
+    if result is not None and getattr(result, "tasks_output", None):
+        for output in result.tasks_output:
+            name = getattr(output, "name", None)
+            if name:
+                task_outputs[name] = output
+    if not task_outputs and fallback_tasks:
+        task_outputs = {
+            task.name: task.output
+            for task in fallback_tasks
+            if task.name and task.output is not None
+        }
+    return task_outputs
+
+
+def _crew_agent_ids(crew) -> set[str]:
+    """收集 crew 内执行任务的 agent id，用于过滤其他并发 crew 的 chunk。"""
+    return {
+        str(task.agent.id)
+        for task in crew.tasks
+        if getattr(task, "agent", None) is not None
+    }
+
+
+def _is_own_chunk(chunk, agent_ids: set[str]) -> bool:
+    """crewai 的流式处理器挂在全局事件总线上，并发流会收到彼此的 chunk。"""
+    agent_id = getattr(chunk, "agent_id", "") or ""
+    return not agent_id or agent_id in agent_ids
+
+
+def _stream_content_chunks(content: str, chunk_size: int = 200):
+    """将完整正文切成小块，用于流式回传。"""
+    for idx in range(0, len(content), chunk_size):
+        yield content[idx : idx + chunk_size]
+
+
+class _CrewEventParser:
+    """把 crew 的流式 chunk 解析为写作/重写任务的标题与正文增量事件。
+
+    同步与异步两种驱动方式共用；finish 在 state 中写入 task_outputs 与
+    draft_started / sent_delta 标记。
+    """
+
+    def __init__(self, crew) -> None:
+        self.crew = crew
+        self.parser = ChapterJsonStreamParser()
+        self.rewrite_parser = ChapterJsonStreamParser()
+        self.seen_tasks: set[str] = set()
+        self.draft_started = False
+        self.rewrite_started = False
+        self.rewrite_mode = False
+        self.sent_delta = False
+        self.agent_ids = _crew_agent_ids(crew)
+        # 段落级重写只输出改动的段落，拼接后的完整正文在 crew 结束后一次性补发。
+        self.span_rewrite = any(is_span_rewrite(task) for task in crew.tasks)
+
+    def feed(self, chunk) -> list[dict]:
+        if not _is_own_chunk(chunk, self.agent_ids):
+            return []
+        events: list[dict] = []
+        # 发送进度：每个任务只发一次。
+        task_name = getattr(chunk, "task_name", "") or ""
+        agent_role = getattr(chunk, "agent_role", "") or ""
+        if task_name and task_name not in self.seen_tasks:
+            self.seen_tasks.add(task_name)
+            events.append({"type": "progress", "task": task_name})
+
+        # 提取文本片段，无法解析则跳过。
+        text = _chunk_text(chunk)
+        if not text:
+            return events
+
+        # 发现重写任务或 fail_reasons 则进入重写模式。
+        if task_name == "chapter_rewrite_task" or '"fail_reasons"' in text:
+            self.rewrite_mode = True
+
+        if not self.rewrite_mode:
+            # 普通写作模式：解析标题与正文增量。
+            is_writing = (
+                task_name == "writing_task"
+                or agent_role == "专业小说写手"
+                or not self.draft_started
+            )
+            if is_writing:
+                title, delta = self.parser.feed(text)
+                if (title or delta) and not self.draft_started:
+                    self.draft_started = True
+                    events.append({"type": "draft_start"})
+                if title:
+                    events.append({"type": "title", "data": title})
+                if delta:
+                    self.sent_delta = True
+                    events.append({"type": "content_delta", "data": delta})
+
+        if self.rewrite_mode and not self.span_rewrite:
+            # 重写模式：解析重写后的标题与正文增量。
+            title, delta = self.rewrite_parser.feed(text)
+            if (title or delta) and not self.rewrite_started:
+                self.rewrite_started = True
+                events.append({"type": "rewrite_start"})
+            if title:
+                events.append({"type": "title", "data": title})
+            if delta:
+                self.sent_delta = True
+                events.append({"type": "content_delta", "data": delta})
+        return events
+
+    def finish(self, result, state: dict) -> list[dict]:
+        events: list[dict] = []
+        state["task_outputs"] = _task_outputs_from_result(result, self.crew.tasks)
+        rewrite = state["task_outputs"].get("chapter_rewrite_task")
+        if self.span_rewrite and rewrite is not None and rewrite.pydantic is not None:
+            events.append({"type": "rewrite_start"})
+            if rewrite.pydantic.chapter_title:
+                events.append({"type": "title", "data": rewrite.pydantic.chapter_title})
+            for piece in _stream_content_chunks(rewrite.pydantic.content or ""):
+                self.sent_delta = True
+                events.append({"type": "content_delta", "data": piece})
+        state["draft_started"] = self.draft_started
+        state["sent_delta"] = self.sent_delta
+        return events
+
+
+def _iter_crew_events(crew, inputs: dict, state: dict):
+    """运行 crew 并解析写作/重写任务的标题与正文增量。
+
+    结束后在 state 中写入 task_outputs 与 draft_started / sent_delta 标记。
+    """
+    crew.stream = True
+    events = _CrewEventParser(crew)
+    streaming = crew.kickoff(inputs=inputs)
+    for chunk in streaming:
+        yield from events.feed(chunk)
+    yield from events.finish(streaming.result, state)
+
+
+async def _aiter_crew_events(crew, inputs: dict, state: dict):
+    """_iter_crew_events 的异步版本：crewai 原生异步执行，LLM 流在事件循环上读取。"""
+    crew.stream = True
+    events = _CrewEventParser(crew)
+    streaming = await crew.akickoff(inputs=inputs)
+    async for chunk in streaming:
+        for event in events.feed(chunk):
+            yield event
+    for event in events.finish(streaming.result, state):
+        yield event
+
+
+def _iter_fallback_events(writing_pack, draft_started: bool):
+    """若没有任何增量输出，则补发完整内容。"""
+    writing_output = writing_pack.writing_output
+    rewrite_output = writing_pack.rewrite_output
+    if not draft_started:
+        yield {"type": "draft_start"}
+    if writing_output.chapter_title:
+        yield {"type": "title", "data": writing_output.chapter_title}
+    for piece in _stream_content_chunks(writing_output.content or ""):
+        yield {"type": "content_delta", "data": piece}
+    if rewrite_output:
+        yield {"type": "rewrite_start"}
+        if rewrite_output.chapter_title:
+            yield {"type": "title", "data": rewrite_output.chapter_title}
+        for piece in _stream_content_chunks(rewrite_output.content or ""):
+            yield {"type": "content_delta", "data": piece}
+
+
+def iter_init_events(mongo, inputs: dict):
+    """初始化小说的事件流：生成世界观/人物/首章，落库后发送 final。"""
+    state: dict = {}
+    try:
+        # 按依赖图执行写作阶段：世界观与人物并发，写作链以流式输出正文。
+        factory = OfficialProj(tenant_for(inputs), usage_tags_for(inputs))
+        task_outputs: dict = {}
+        yield from iter_task_graph(
+            factory.task_graph(),
+            inputs,
+            task_outputs,
+            stream_runner=partial(_iter_crew_events, state=state)
+        )
+
+        # 写作阶段完成后并行运行剧情分析与记忆更新，全部结束再持久化。
+        yield from iter_post_writing(
+            factory.post_writing_crews(), inputs, task_outputs
+        )
+        CrewPersistRunner(mongo).persist_outputs(inputs, task_outputs)
+
+        # 组装最终返回数据。
+        writing_pack = extract_writing(task_outputs)
+        world_settings = task_outputs["world_building_task"].pydantic
+        review_output = select_review(task_outputs)
+
+        if not state["sent_delta"]:
+            yield from _iter_fallback_events(writing_pack, state["draft_started"])
+
+        # 最终响应：包含标题/正文/评审/重写信息。
+        data = InitResponse(
+            novel_id=inputs["novel_id"],
+            chapter_number=1,
+            title=writing_pack.final_title,
+            content=writing_pack.final_content,
+            world_rules=world_settings.world_rules,
+            review=review_output.dict()
+            if review_output else None,
+            rewrite=writing_pack.rewrite_info
+        )
+        yield {"type": "final", "data": data.dict()}
+    except Exception as e:
+        # 捕获异常并以流式错误返回。
+        yield {"type": "error", "message": str(e)}
+    finally:
+        # 清理由 crew 生成的知识文件。
+        cleanup_generated_knowledge()
+
+
+def iter_next_chapter_events(mongo, inputs: dict):
+    """续写下一章的事件流：生成章节，落库后发送 final。"""
+    state: dict = {}
+    try:
+        # 重试或重连时已完成的任务从断点恢复，不再重复执行。
+        run_id = chapter_run_id(inputs)
+        checkpoints = TaskCheckpointStore(mongo)
+        factory = ChapterCrew(tenant_for(inputs), usage_tags_for(inputs))
+        completed = checkpoints.load(run_id, factory.output_models())
+        task_outputs = dict(completed)
+
+        crew = factory.crew(completed)
+        if crew is not None:
+            checkpoints.attach([crew], run_id, inputs["novel_id"])
+            yield from _iter_crew_events(crew, inputs, state)
+            task_outputs.update(state["task_outputs"])
+        else:
+            state.update(draft_started=False, sent_delta=False)
+
+        # 写作阶段完成后并行运行剧情分析与记忆更新，全部结束再持久化。
+        post_crews = factory.post_writing_crews(completed)
+        checkpoints.attach(post_crews.values(), run_id, inputs["novel_id"])
+        yield from iter_post_writing(post_crews, inputs, task_outputs)
+        _persist_next_chapter(mongo, inputs, task_outputs, checkpoints, run_id)
+        yield from _iter_chapter_final_events(inputs, task_outputs, state)
+    except Exception as e:
+        # 异常转为流式错误消息。
+        yield {"type": "error", "message": str(e)}
+    finally:
+        # 清理生成过程中的知识文件。
+        cleanup_generated_knowledge()
+
+
+async def aiter_next_chapter_events(mongo, inputs: dict):
+    """iter_next_chapter_events 的异步版本，直接在事件循环上迭代。
+
+    crew 走 crewai 的原生异步执行，LLM 流式响应由 AsyncOpenAI 读取，
+    多章并发生成时不再各占一个阻塞线程；MongoDB 读写仍放到线程池执行。
+    """
+    state: dict = {}
+    try:
+        run_id = chapter_run_id(inputs)
+        checkpoints = TaskCheckpointStore(mongo)
+        factory = ChapterCrew(tenant_for(inputs), usage_tags_for(inputs))
+        completed = await asyncio.to_thread(
+            checkpoints.load, run_id, factory.output_models()
+        )
+        task_outputs = dict(completed)
+
+        crew = factory.crew(completed)
+        if crew is not None:
+            checkpoints.attach([crew], run_id, inputs["novel_id"])
+            async for event in _aiter_crew_events(crew, inputs, state):
+                yield event
+            task_outputs.update(state["task_outputs"])
+        else:
+            state.update(draft_started=False, sent_delta=False)
+
+        post_crews = factory.post_writing_crews(completed)
+        checkpoints.attach(post_crews.values(), run_id, inputs["novel_id"])
+        async for event in aiter_post_writing(post_crews, inputs, task_outputs):
+            yield event
+        await asyncio.to_thread(
+            _persist_next_chapter, mongo, inputs, task_outputs, checkpoints, run_id
+        )
+        for event in _iter_chapter_final_events(inputs, task_outputs, state):
+            yield event
+    except Exception as e:
+        yield {"type": "error", "message": str(e)}
+    finally:
+        await asyncio.to_thread(cleanup_generated_knowledge)
+
+
+def _persist_next_chapter(mongo, inputs: dict, task_outputs: dict, checkpoints, run_id: str) -> None:
+    persist_chapter_result(
+        mongo=mongo,
+        novel_id=inputs["novel_id"],
+        chapter_number=inputs["chapter_number"],
+        task_outputs=task_outputs,
+        context_stats=inputs.get("context_stats")
+    )
+    checkpoints.clear(run_id)
+
+
+def _iter_chapter_final_events(inputs: dict, task_outputs: dict, state: dict):
+    """续写结束：必要时补发完整正文，再发送 final。"""
+    # 组装最终响应。
+    writing_pack = extract_writing(task_outputs)
+    review_output = select_review(task_outputs)
+
+    if not state["sent_delta"]:
+        yield from _iter_fallback_events(writing_pack, state["draft_started"])
+
+    # 发送最终结果（包含评审与重写信息）。
+    data = ChapterResponse(
+        novel_id=inputs["novel_id"],
+        chapter_number=inputs["chapter_number"],
+        title=writing_pack.final_title,
+        content=writing_pack.final_content,
+        review=review_output.dict()
+        if review_output else None,
+        rewrite=writing_pack.rewrite_info
+    )
+    yield {"type": "final", "data": data.dict()}
+
+
+def iter_chapter_batch_events(mongo, inputs: dict):
+    """批量续写的事件流：流水线生成到 until_chapter，final 中包含吞吐量统计。"""
+    try:
+        runner = ChapterLoopRunner(mongo)
+        yield from runner.iter_batch(
+            inputs["novel_id"], inputs["until_chapter"], user_id=inputs.get("user_id")
+        )
+    except Exception as e:
+        yield {"type": "error", "message": str(e)}
@@ -0,0 +1,170 @@
+"""单本小说的生成互斥与章节号分配。
+
+同一本小说同一时刻只允许一个生成：进程内由会话表合并重复请求，跨 worker 由
+MongoDB 租约保证；章节号通过计数器原子递增分配，不再依赖排序查询推算。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import AsyncIterator, Callable, Iterable, Iterator
+
+from official_proj.db.mongo_db.dao.chapter_dao import ChapterDAO
+from official_proj.db.mongo_db.dao.generation_lease_dao import GenerationLeaseDAO
+from official_proj.db.mongo_db.dao.novel_counter_dao import NovelCounterDAO
+
+logger = logging.getLogger(__name__)
+
+# 租约有效期与续期间隔：持有进程退出后最多 LEASE_SECONDS 秒即可被接管。
+LEASE_SECONDS = float(os.getenv("GENERATION_LEASE_SECONDS", "120"))
+LEASE_RENEW_SECONDS = float(os.getenv("GENERATION_LEASE_RENEW_SECONDS", "30"))
+
+
+class GenerationInProgressError(RuntimeError):
+    """该小说已有生成在其他请求/进程中进行。"""
+
+    def __init__(self, novel_id: str, lease: dict | None = None):
+        super().__init__(f"novel {novel_id} is already generating")
+        self.novel_id = novel_id
+        self.lease = lease or {}
+
+
+class NovelGenerationGuard:
+    """生成租约与章节计数器的组合操作。"""
+
+    def __init__(self, mongo):
+        self.lease_dao = GenerationLeaseDAO(mongo)
+        self.counter_dao = NovelCounterDAO(mongo)
+        self.chapter_dao = ChapterDAO(mongo)
+
+    # ---------- 租约 ----------
+
+    def acquire(self, novel_id: str, holder: str, kind: str) -> None:
+        """获取生成租约，被他人持有时抛出 GenerationInProgressError。"""
+        if not self.lease_dao.acquire(novel_id, holder, LEASE_SECONDS, kind):
+            raise GenerationInProgressError(novel_id, self.lease_dao.get(novel_id))
+
+    def active_holder(self, novel_id: str) -> str | None:
+        """持有未过期租约的生成（流式生成的 generation_id 或后台任务的 job id）。"""
+        lease = self.lease_dao.get(novel_id)
+        if lease is None or lease["expires_at"] < datetime.utcnow():
+            return None
+        return lease["holder"]
+
+    def release(self, novel_id: str, holder: str) -> None:
+        try:
+            self.lease_dao.release(novel_id, holder)
+        except Exception:
+            # 释放失败时租约会在过期后自动失效。
+            logger.exception("release lease for %s failed", novel_id)
+
+    @contextmanager
+    def keep_alive(self, novel_id: str, holder: str):
+        """生成期间后台续期租约，退出时释放。"""
+        stop = self._start_renewer(novel_id, holder)
+        try:
+            yield
+        finally:
+            self._stop_and_release(novel_id, holder, stop)
+
+    def _start_renewer(self, novel_id: str, holder: str) -> threading.Event:
+        """启动后台续期线程，返回用于停止它的事件。"""
+        stop = threading.Event()
+
+        def renew_loop():
+            while not stop.wait(LEASE_RENEW_SECONDS):
+                try:
+                    if not self.lease_dao.renew(novel_id, holder, LEASE_SECONDS):
+                        logger.warning("lease for %s lost by %s", novel_id, holder)
+                        return
+                except Exception:
+                    logger.exception("renew lease for %s failed", novel_id)
+
+        threading.Thread(target=renew_loop, daemon=True).start()
+        return stop
+
+    def _stop_and_release(self, novel_id: str, holder: str, stop: threading.Event) -> None:
+        stop.set()
+        self.release(novel_id, holder)
+
+    # ---------- 章节号 ----------
+
+    def allocate_chapter_number(self, novel_id: str) -> int:
+        """原子分配下一章章节号；首次使用时以现有最大章节号初始化计数器。"""
+        number = self.counter_dao.increment_chapter(novel_id)
+        if number is not None:
+            return number
+
+        last = self.chapter_dao.get_last_chapter(novel_id)
+        self.counter_dao.seed_chapter(
+            novel_id, last["chapter_number"] if last else 0
+        )
+        return self.counter_dao.increment_chapter(novel_id)
+
+    def release_chapter_number(self, novel_id: str, chapter_number: int) -> None:
+        """生成失败、章节未落库时归还章节号。"""
+        try:
+            if self.chapter_dao.exists(novel_id, chapter_number):
+                # 章节已写入（失败发生在落库之后），号码不可复用。
+                return
+            self.counter_dao.release_chapter(novel_id, chapter_number)
+        except Exception:
+            logger.exception(
+                "release chapter %s of %s failed", chapter_number, novel_id
+            )
+
+    # ---------- 事件流包装 ----------
+
+    def guarded_events(
+        self,
+        novel_id: str,
+        holder: str,
+        events: Callable[[], Iterable[dict]],
+        chapter_number: int | None = None
+    ) -> Iterator[dict]:
+        """在租约保护下迭代事件流（租约需已由调用方获取）。
+
+        未产生 final 事件时归还已分配的章节号。
+        """
+        succeeded = False
+        stop = self._start_renewer(novel_id, holder)
+        try:
+            for event in events():
+                if event.get("type") == "final":
+                    succeeded = True
+                yield event
+        finally:
+            try:
+                if chapter_number is not None and not succeeded:
+                    self.release_chapter_number(novel_id, chapter_number)
+            finally:
+                self._stop_and_release(novel_id, holder, stop)
+
+    async def aguarded_events(
+        self,
+        novel_id: str,
+        holder: str,
+        events: Callable[[], AsyncIterator[dict]],
+        chapter_number: int | None = None
+    ) -> AsyncIterator[dict]:
+        """guarded_events 的异步版本：租约续期仍在后台线程，MongoDB 操作放到线程池。"""
+        succeeded = False
+        stop = self._start_renewer(novel_id, holder)
+        try:
+            async for event in events():
+                if event.get("type") == "final":
+                    succeeded = True
+                yield event
+        finally:
+            try:
+                if chapter_number is not None and not succeeded:
+                    await asyncio.to_thread(
+                        self.release_chapter_number, novel_id, chapter_number
+                    )
+            finally:
+                await asyncio.to_thread(self._stop_and_release, novel_id, holder, stop)
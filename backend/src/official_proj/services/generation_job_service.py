@@ -0,0 +1,266 @@
+"""后台生成任务：提交后立即返回 job id，由生成线程池执行并把进度写入 MongoDB。"""
+
+from __future__ import annotations
+
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from functools import partial
+
+from pymongo.errors import DuplicateKeyError
+
+from official_proj.db.mongo_db.dao.chapter_dao import ChapterDAO
+from official_proj.db.mongo_db.dao.generation_job_dao import (
+    JOB_FAILED,
+    JOB_QUEUED,
+    JOB_SUCCEEDED,
+    GenerationJobDAO
+)
+from official_proj.db.mongo_db.dao.generation_job_event_dao import GenerationJobEventDAO
+from official_proj.db.mongo_db.dao.world_setting_dao import WorldSettingDAO
+from official_proj.services.generation_events import (
+    iter_chapter_batch_events,
+    iter_init_events,
+    iter_next_chapter_events
+)
+from official_proj.services.generation_guard import (
+    GenerationInProgressError,
+    NovelGenerationGuard
+)
+from official_proj.services.generation_pool import get_generation_executor
+
+logger = logging.getLogger(__name__)
+
+# 心跳间隔；超过 JOB_STALE_SECONDS 无心跳的运行中任务视为所属进程已退出。
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "15"))
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "90"))
+# 中断后最多重试的次数（含首次执行）。
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "2"))
+# 事件批量写入：累计条数或间隔任一达到即写一次。
+JOB_EVENT_BATCH = int(os.getenv("JOB_EVENT_BATCH", "32"))
+JOB_EVENT_FLUSH_SECONDS = float(os.getenv("JOB_EVENT_FLUSH_SECONDS", "1.0"))
+
+_EVENT_SOURCES = {
+    "init": iter_init_events,
+    "next_chapter": iter_next_chapter_events,
+    "chapter_batch": iter_chapter_batch_events,
+}
+
+
+class _JobEventWriter:
+    """把事件编号后批量写入事件集合，相邻的 content_delta 合并为一条。"""
+
+    def __init__(
+        self,
+        job_dao: GenerationJobDAO,
+        event_dao: GenerationJobEventDAO,
+        job_id: str,
+        last_seq: int
+    ):
+        self.job_dao = job_dao
+        self.event_dao = event_dao
+        self.job_id = job_id
+        self.seq = last_seq
+        self._pending: list[dict] = []
+        self._last_flush = time.monotonic()
+
+    def add(self, event: dict) -> None:
+        last = self._pending[-1] if self._pending else None
+        if (
+            event.get("type") == "content_delta"
+            and last is not None
+            and last.get("type") == "content_delta"
+        ):
+            last["data"] += event.get("data") or ""
+        else:
+            self.seq += 1
+            self._pending.append({"seq": self.seq, **event})
+
+        if (
+            len(self._pending) >= JOB_EVENT_BATCH
+            or time.monotonic() - self._last_flush >= JOB_EVENT_FLUSH_SECONDS
+            or event.get("type") in ("final", "error")
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        if self._pending:
+            # 先写事件再更新 last_seq：订阅方读到 last_seq 时事件已可读。
+            self.event_dao.append(self.job_id, self._pending)
+            self.job_dao.set_last_seq(self.job_id, self.seq)
+            self._pending = []
+        self._last_flush = time.monotonic()
+
+
+class GenerationJobService:
+    """提交、执行与恢复后台生成任务。"""
+
+    def __init__(self, mongo):
+        self.mongo = mongo
+        self.job_dao = GenerationJobDAO(mongo)
+        self.event_dao = GenerationJobEventDAO(mongo)
+        self.chapter_dao = ChapterDAO(mongo)
+        self.world_dao = WorldSettingDAO(mongo)
+        self.guard = NovelGenerationGuard(mongo)
+        # 当前进程的唯一标识，用于任务归属与心跳。
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        # 已提交到本进程线程池、尚未执行完的任务，避免恢复时重复排队。
+        self._scheduled: set[str] = set()
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, novel_id: str, user_id: int, inputs: dict) -> dict:
+        """写入排队中的任务记录并交给生成线程池，立即返回。
+
+        该小说已有同类任务未结束时直接返回该任务，不重复提交。
+        """
+        if kind not in _EVENT_SOURCES:
+            raise ValueError(f"unknown job kind: {kind}")
+        while True:
+            active = self.job_dao.find_active(novel_id, kind)
+            if active:
+                return active
+            try:
+                job = self.job_dao.create(
+                    novel_id=novel_id,
+                    user_id=user_id,
+                    kind=kind,
+                    inputs=inputs
+                )
+            except DuplicateKeyError:
+                # 并发提交的同类任务刚刚写入：返回那一个。
+                continue
+            self._schedule(job["_id"])
+            return job
+
+    def _schedule(self, job_id: str) -> None:
+        with self._lock:
+            if job_id in self._scheduled:
+                return
+            self._scheduled.add(job_id)
+        get_generation_executor().submit(self._run_scheduled, job_id)
+
+    def _run_scheduled(self, job_id: str) -> None:
+        try:
+            self._run(job_id)
+        except Exception:
+            logger.exception("job %s crashed", job_id)
+        finally:
+            with self._lock:
+                self._scheduled.discard(job_id)
+
+    def _already_done(self, job: dict) -> bool:
+        """重试前检查上次执行是否已经落库，避免重复生成。"""
+        inputs = job["inputs"]
+        if job["kind"] == "init":
+            return self.world_dao.get_latest(job["novel_id"]) is not None
+        if job["kind"] == "chapter_batch":
+            # 批量任务重试时只补齐未生成的章节，全部已落库才算完成。
+            last = self.chapter_dao.get_last_chapter(job["novel_id"])
+            return bool(last) and last["chapter_number"] >= inputs["until_chapter"]
+        if "chapter_number" not in inputs:
+            # 上次在分配章节号之前就中断了。
+            return False
+        return self.chapter_dao.exists(job["novel_id"], inputs["chapter_number"])
+
+    def _run(self, job_id: str) -> None:
+        job = self.job_dao.claim(job_id, self.owner)
+        if not job:
+            # 已被其他 worker 领取或已结束。
+            return
+
+        last_seq = job.get("last_seq", 0)
+        if job["attempts"] > 1:
+            # 上次执行可能在写入事件后、记录 last_seq 前中断，从 last_seq 起重新编号。
+            self.event_dao.delete_after(job_id, last_seq)
+        writer = _JobEventWriter(self.job_dao, self.event_dao, job_id, last_seq)
+        if job["attempts"] > 1:
+            writer.add({"type": "retry", "attempt": job["attempts"]})
+            if self._already_done(job):
+                result = {"novel_id": job["novel_id"]}
+                writer.add({"type": "final", "data": result})
+                self.job_dao.finish(job_id, JOB_SUCCEEDED, result=result)
+                return
+
+        # 以 job id 作为租约持有者：重试时可直接接管自己遗留的租约。
+        novel_id = job["novel_id"]
+        inputs = job["inputs"]
+        try:
+            self.guard.acquire(novel_id, job_id, job["kind"])
+        except GenerationInProgressError:
+            error = "该小说正在生成中"
+            writer.add({"type": "error", "message": error})
+            writer.flush()
+            self.job_dao.finish(job_id, JOB_FAILED, error=error)
+            return
+
+        chapter_number = None
+        if job["kind"] == "next_chapter":
+            chapter_number = inputs.get("chapter_number")
+            if chapter_number is None:
+                try:
+                    chapter_number = self.guard.allocate_chapter_number(novel_id)
+                except Exception:
+                    self.guard.release(novel_id, job_id)
+                    raise
+                inputs = {**inputs, "chapter_number": chapter_number}
+                self.job_dao.set_inputs(job_id, inputs)
+
+        stop_heartbeat = threading.Event()
+        heartbeat = threading.Thread(
+            target=self._heartbeat_loop,
+            args=(job_id, stop_heartbeat),
+            daemon=True
+        )
+        heartbeat.start()
+
+        final: dict | None = None
+        error: str | None = None
+        try:
+            events = self.guard.guarded_events(
+                novel_id,
+                job_id,
+                partial(_EVENT_SOURCES[job["kind"]], self.mongo, inputs),
+                chapter_number
+            )
+            for event in events:
+                writer.add(event)
+                if event.get("type") == "final":
+                    final = event.get("data")
+                elif event.get("type") == "error":
+                    error = event.get("message")
+        except Exception as e:
+            error = str(e)
+            writer.add({"type": "error", "message": error})
+        finally:
+            stop_heartbeat.set()
+            writer.flush()
+
+        if final is not None and error is None:
+            self.job_dao.finish(job_id, JOB_SUCCEEDED, result=final)
+        else:
+            self.job_dao.finish(job_id, JOB_FAILED, error=error or "任务未产生结果")
+
+    def _heartbeat_loop(self, job_id: str, stop: threading.Event) -> None:
+        while not stop.wait(JOB_HEARTBEAT_SECONDS):
+            try:
+                self.job_dao.heartbeat(job_id, self.owner)
+            except Exception:
+                logger.exception("job %s heartbeat failed", job_id)
+
+    def recover(self) -> None:
+        """恢复无人处理的任务：排队中的重新调度，中断的运行中任务重试或标记失败。"""
+        stale_before = datetime.utcnow() - timedelta(seconds=JOB_STALE_SECONDS)
+        for job in self.job_dao.list_unfinished(stale_before):
+            job_id = job["_id"]
+            if job["status"] == JOB_QUEUED:
+                self._schedule(job_id)
+            elif job["attempts"] < JOB_MAX_ATTEMPTS:
+                if self.job_dao.requeue(job_id, stale_before):
+                    logger.warning("job %s interrupted, requeued", job_id)
+                    self._schedule(job_id)
+            elif self.job_dao.fail_stale(job_id, stale_before, "任务执行中断（服务重启）"):
+                logger.warning("job %s interrupted, marked failed", job_id)
@@ -0,0 +1,106 @@
+"""生成任务专用的有界线程池：把阻塞的 crew 运行桥接为异步迭代。"""
+
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import os
+import threading
+from typing import AsyncIterator, Callable, Iterable, TypeVar
+
+T = TypeVar("T")
+
+# 同时运行的 crew 数量上限（每个 crew 占用一个工作线程）。
+GENERATION_MAX_WORKERS = int(os.getenv("GENERATION_MAX_WORKERS", "8"))
+# 工作线程与响应之间的队列长度，写满后生产端阻塞（背压）。
+STREAM_QUEUE_SIZE = int(os.getenv("GENERATION_STREAM_QUEUE_SIZE", "64"))
+
+_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=GENERATION_MAX_WORKERS,
+    thread_name_prefix="generation"
+)
+
+
+class _StreamEnd:
+    """生产端正常结束的哨兵。"""
+
+
+class _StreamError:
+    """包装生产端抛出的异常，交由消费端重新抛出。"""
+
+    def __init__(self, error: BaseException) -> None:
+        self.error = error
+
+
+class _ConsumerGone(Exception):
+    """消费端已放弃（如客户端断开），生产端应尽快退出。"""
+
+
+_END = _StreamEnd()
+
+
+def get_generation_executor() -> concurrent.futures.ThreadPoolExecutor:
+    """返回进程内共享的生成线程池。"""
+    return _executor
+
+
+async def iterate_in_pool(
+    factory: Callable[[], Iterable[T]],
+    maxsize: int = STREAM_QUEUE_SIZE
+) -> AsyncIterator[T]:
+    """在生成线程池中运行同步迭代器，并通过 asyncio.Queue 异步产出元素。
+
+    工作线程满时新任务排队等待；队列写满时工作线程阻塞，直到响应端消费。
+    消费端提前退出时会通知工作线程停止并关闭底层迭代器。
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+    stopped = threading.Event()
+
+    def put(item) -> None:
+        # 在事件循环上执行 queue.put，队列满时在此阻塞工作线程。
+        future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+        while True:
+            try:
+                future.result(timeout=0.5)
+                return
+            except concurrent.futures.TimeoutError:
+                if stopped.is_set():
+                    future.cancel()
+                    raise _ConsumerGone()
+
+    def produce() -> None:
+        iterator = None
+        try:
+            iterator = iter(factory())
+            for item in iterator:
+                if stopped.is_set():
+                    return
+                put(item)
+            put(_END)
+        except _ConsumerGone:
+            return
+        except BaseException as exc:
+            if stopped.is_set():
+                return
+            try:
+                put(_StreamError(exc))
+            except _ConsumerGone:
+                return
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    loop.run_in_executor(_executor, produce)
+    try:
+        while True:
+            item = await queue.get()
+            if item is _END:
+                return
+            if isinstance(item, _StreamError):
+                raise item.error
+            yield item
+    finally:
+        # 客户端断开或消费完成：通知工作线程不再写入。
+        stopped.set()
@@ -0,0 +1,165 @@
+"""生成会话：为流式事件编号并缓存，支持断线后按序号续传。
+
+会话只存在于启动它的进程内：多 worker 部署时，续传请求必须路由到同一 worker
+（按 novel_id 做粘性会话）；否则应使用后台任务接口（/novel/*_job + /jobs/{job_id}/events），
+其事件持久化在 MongoDB，任何 worker 都能读取。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import uuid
+import weakref
+from collections import deque
+from contextlib import aclosing
+from typing import AsyncIterator
+
+from official_proj.services.streaming_helpers import CoalesceStats, coalesce_events
+
+logger = logging.getLogger(__name__)
+
+# 每个生成会话保留的最近事件数（环形缓冲）。
+REPLAY_BUFFER_SIZE = int(os.getenv("STREAM_REPLAY_BUFFER", "2048"))
+# 生成结束后会话继续保留的秒数，供晚到的重连读取 final。
+SESSION_TTL_SECONDS = float(os.getenv("STREAM_SESSION_TTL", "600"))
+
+
+class GenerationSession:
+    """一次生成的事件流：事件带递增 seq，写入环形缓冲并广播给订阅者。"""
+
+    def __init__(
+        self,
+        key: str,
+        label: str,
+        buffer_size: int = REPLAY_BUFFER_SIZE,
+        generation_id: str | None = None
+    ):
+        self.key = key
+        self.label = label
+        self.generation_id = generation_id or str(uuid.uuid4())
+        self.done = False
+        self._events: deque[dict] = deque(maxlen=buffer_size)
+        self._last_seq = 0
+        self._cond = asyncio.Condition()
+        self._task: asyncio.Task | None = None
+
+    @property
+    def last_seq(self) -> int:
+        return self._last_seq
+
+    async def publish(self, event: dict) -> dict:
+        """为事件分配 seq 并写入缓冲，唤醒所有订阅者。"""
+        async with self._cond:
+            self._last_seq += 1
+            stamped = {"seq": self._last_seq, **event}
+            self._events.append(stamped)
+            self._cond.notify_all()
+        return stamped
+
+    async def finish(self) -> None:
+        async with self._cond:
+            self.done = True
+            self._cond.notify_all()
+
+    async def subscribe(self, after_seq: int = 0) -> AsyncIterator[dict]:
+        """先回放 seq > after_seq 的缓存事件，再跟随实时尾部直到生成结束。"""
+        cursor = after_seq
+        while True:
+            async with self._cond:
+                while self._last_seq <= cursor and not self.done:
+                    await self._cond.wait()
+                oldest = self._events[0]["seq"] if self._events else cursor + 1
+                batch = [e for e in self._events if e["seq"] > cursor]
+                finished = self.done
+
+            if oldest > cursor + 1:
+                # 缓冲已覆盖部分事件，告知客户端缺口范围。
+                yield {
+                    "type": "replay_gap",
+                    "from_seq": cursor + 1,
+                    "to_seq": oldest - 1,
+                    "generation_id": self.generation_id
+                }
+            for event in batch:
+                yield event
+                cursor = event["seq"]
+
+            if finished and cursor >= self._last_seq:
+                return
+
+    def start(self, events: AsyncIterator[dict]) -> asyncio.Task:
+        """在事件循环上运行生成泵，与任何客户端连接解耦。"""
+        self._task = asyncio.create_task(self._pump(events))
+        return self._task
+
+    async def _pump(self, events: AsyncIterator[dict]) -> None:
+        stats = CoalesceStats()
+        try:
+            async with aclosing(coalesce_events(events, stats=stats)) as coalesced:
+                async for event in coalesced:
+                    await self.publish(event)
+        except Exception as e:
+            # 上游异常同样作为流式错误事件广播。
+            await self.publish({"type": "error", "message": str(e)})
+        finally:
+            await self.finish()
+            logger.info(
+                "%s stream coalesced %d events into %d (saved %d)",
+                self.label, stats.events_in, stats.events_out, stats.saved
+            )
+
+
+class GenerationRegistry:
+    """进程内生成会话表：按小说 ID 索引，结束后保留一段时间供重连。"""
+
+    def __init__(self, ttl_seconds: float = SESSION_TTL_SECONDS):
+        self._sessions: dict[str, GenerationSession] = {}
+        self._locks: weakref.WeakValueDictionary[str, asyncio.Lock] = (
+            weakref.WeakValueDictionary()
+        )
+        self._ttl = ttl_seconds
+
+    def get(self, key: str) -> GenerationSession | None:
+        return self._sessions.get(key)
+
+    def get_active(self, key: str) -> GenerationSession | None:
+        """返回仍在生成中的会话。"""
+        session = self._sessions.get(key)
+        return session if session is not None and not session.done else None
+
+    def lock(self, key: str) -> asyncio.Lock:
+        """同一 key 的启动流程串行化，后到的请求可复用刚启动的会话。"""
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[key] = lock
+        return lock
+
+    def start(
+        self,
+        key: str,
+        events: AsyncIterator[dict],
+        label: str,
+        generation_id: str | None = None
+    ) -> GenerationSession:
+        """创建并启动会话，结束后按 TTL 从表中移除。"""
+        session = GenerationSession(key, label, generation_id=generation_id)
+        self._sessions[key] = session
+        task = session.start(events)
+        task.add_done_callback(lambda _: self._schedule_expiry(session))
+        return session
+
+    def _schedule_expiry(self, session: GenerationSession) -> None:
+        loop = asyncio.get_running_loop()
+        loop.call_later(self._ttl, self._expire, session)
+
+    def _expire(self, session: GenerationSession) -> None:
+        # 仅移除仍指向该会话的条目，避免误删新一轮生成。
+        if self._sessions.get(session.key) is session:
+            del self._sessions[session.key]
+
+
+# 进程级单例，路由共享。
+generation_registry = GenerationRegistry()
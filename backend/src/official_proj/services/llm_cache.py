@@ -0,0 +1,323 @@
+"""LLM 响应缓存：按请求内容寻址，存放在本地 SQLite 文件中。
+
+落库失败后的重试、客户端断线重连后的重新生成，会向模型发出完全相同的请求。
+开启缓存后（LLM_CACHE_ENABLED=1），OpenAI 客户端的 chat.completions.create
+先按 (模型, 消息, 响应格式, 采样参数…) 的哈希查缓存：
+
+- 非流式响应保存完整的 ChatCompletion；
+- 流式响应在完整读完后保存全部 chunk，命中时逐个回放，上层照常发出 chunk 事件，
+  流式接口的行为与实时生成一致。
+
+文件总大小超过 LLM_CACHE_MAX_BYTES 时按最近使用时间淘汰（LRU）。
+下游拒绝了响应（护栏或结构校验失败）时调用 reject_cached_response 删除该条目，
+重试在 bypass_response_cache 内进行，不会再回放同一个被拒绝的响应。
+注意：命中即返回相同内容，温度大于 0 时也不再随机，因此默认关闭。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Iterator
+
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "0").lower() in ("1", "true", "yes")
+# 缓存文件，默认位于 backend/llm_cache.sqlite3。
+LLM_CACHE_PATH = Path(
+    os.getenv(
+        "LLM_CACHE_PATH",
+        str(Path(__file__).resolve().parents[3] / "llm_cache.sqlite3")
+    )
+)
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# 每多少次查询输出一次命中率日志。
+LLM_CACHE_LOG_EVERY = int(os.getenv("LLM_CACHE_LOG_EVERY", "100"))
+
+# 不影响模型输出的请求参数，不参与缓存键。
+_NON_SEMANTIC_PARAMS = frozenset({
+    "stream_options",
+    "timeout",
+    "extra_headers",
+    "extra_query",
+    "user",
+    "metadata",
+})
+
+# 当前上下文最近一次经过缓存的请求 (缓存, 键)：下游拒绝该响应时据此删除。
+_last_entry: contextvars.ContextVar[tuple[LLMResponseCache, str] | None] = (
+    contextvars.ContextVar("llm_cache_last_entry", default=None)
+)
+# 为 True 时不读缓存（结果仍写入），用于重试。
+_bypass: contextvars.ContextVar[bool] = contextvars.ContextVar(
+    "llm_cache_bypass", default=False
+)
+
+
+@contextmanager
+def bypass_response_cache(enabled: bool = True):
+    """在当前上下文内跳过缓存读取：重试要拿到新的响应，而不是回放上一次的。"""
+    token = _bypass.set(enabled)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+def reject_cached_response() -> None:
+    """当前上下文最近一次 LLM 响应被下游拒绝：从缓存中删除，之后相同的请求重新生成。"""
+    entry = _last_entry.get()
+    if entry is None:
+        return
+    _last_entry.set(None)
+    cache, key = entry
+    cache.discard(key)
+
+
+def cache_key(params: dict[str, Any]) -> str:
+    """按请求参数计算缓存键（sha256）。"""
+    keyed = {
+        name: value for name, value in params.items()
+        if name not in _NON_SEMANTIC_PARAMS and value is not None
+    }
+    payload = json.dumps(keyed, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """SQLite 存储的响应缓存，按字节数做 LRU 淘汰。"""
+
+    def __init__(self, path: Path = LLM_CACHE_PATH, max_bytes: int = LLM_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0, "misses": 0, "stores": 0, "evictions": 0, "rejections": 0
+        }
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " kind TEXT NOT NULL,"
+                " body TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " last_used REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)"
+            )
+            self._conn.commit()
+
+    def get(self, key: str, kind: str) -> str | None:
+        """读取缓存并刷新最近使用时间；未命中返回 None。"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body FROM responses WHERE key = ? AND kind = ?", (key, kind)
+            ).fetchone()
+            if row is not None:
+                self._conn.execute(
+                    "UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key)
+                )
+                self._conn.commit()
+            self._record("hits" if row is not None else "misses")
+        return row[0] if row is not None else None
+
+    def put(self, key: str, kind: str, body: str) -> None:
+        """写入缓存，超出容量时淘汰最久未使用的条目。"""
+        size = len(body.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, kind, body, size, last_used)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, kind, body, size, time.time())
+            )
+            self._stats["stores"] += 1
+            self._evict()
+            self._conn.commit()
+
+    def discard(self, key: str) -> None:
+        """删除被下游拒绝的条目。"""
+        with self._lock:
+            deleted = self._conn.execute(
+                "DELETE FROM responses WHERE key = ?", (key,)
+            ).rowcount
+            self._conn.commit()
+            if deleted:
+                self._stats["rejections"] += 1
+
+    def _evict(self) -> None:
+        (total,) = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM responses ORDER BY last_used"
+        ).fetchall():
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._stats["evictions"] += 1
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def _record(self, outcome: str) -> None:
+        self._stats[outcome] += 1
+        lookups = self._stats["hits"] + self._stats["misses"]
+        if LLM_CACHE_LOG_EVERY and lookups % LLM_CACHE_LOG_EVERY == 0:
+            logger.info(
+                "llm cache: %d hits / %d misses (%.1f%%)",
+                self._stats["hits"], self._stats["misses"],
+                100.0 * self._stats["hits"] / lookups
+            )
+
+    def stats(self) -> dict:
+        """命中/未命中等计数（本进程）与当前条目数、字节数。"""
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+                "entries": entries,
+                "bytes": size,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+
+class CachedChatCompletions:
+    """包装 client.chat.completions：create 先查缓存，其余属性透传。"""
+
+    def __init__(self, completions, cache: LLMResponseCache):
+        self._completions = completions
+        self._cache = cache
+
+    def __getattr__(self, name: str):
+        return getattr(self._completions, name)
+
+    def _begin(self, params: dict[str, Any]) -> str:
+        key = cache_key(params)
+        _last_entry.set((self._cache, key))
+        return key
+
+    def _lookup(self, key: str, kind: str) -> str | None:
+        return None if _bypass.get() else self._cache.get(key, kind)
+
+    def create(self, **params):
+        key = self._begin(params)
+        if params.get("stream"):
+            body = self._lookup(key, "stream")
+            if body is not None:
+                return _replay_stream(json.loads(body))
+            return self._record_stream(key, self._completions.create(**params))
+
+        body = self._lookup(key, "completion")
+        if body is not None:
+            return ChatCompletion.model_validate_json(body)
+        response = self._completions.create(**params)
+        self._cache.put(key, "completion", response.model_dump_json())
+        return response
+
+    def _record_stream(self, key: str, stream) -> Iterator[ChatCompletionChunk]:
+        """透传实时 chunk，完整读完后才写入缓存（中途中断不缓存）。"""
+        chunks: list[dict] = []
+        try:
+            for chunk in stream:
+                chunks.append(chunk.model_dump(mode="json"))
+                yield chunk
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+        self._cache.put(key, "stream", json.dumps(chunks, ensure_ascii=False))
+
+
+class AsyncCachedChatCompletions(CachedChatCompletions):
+    """AsyncOpenAI 客户端的缓存包装；SQLite 读写放到工作线程，不阻塞事件循环。"""
+
+    async def create(self, **params):
+        key = self._begin(params)
+        if params.get("stream"):
+            body = await asyncio.to_thread(self._lookup, key, "stream")
+            if body is not None:
+                return _areplay_stream(json.loads(body))
+            return self._arecord_stream(key, await self._completions.create(**params))
+
+        body = await asyncio.to_thread(self._lookup, key, "completion")
+        if body is not None:
+            return ChatCompletion.model_validate_json(body)
+        response = await self._completions.create(**params)
+        await asyncio.to_thread(
+            self._cache.put, key, "completion", response.model_dump_json()
+        )
+        return response
+
+    async def _arecord_stream(self, key: str, stream) -> AsyncIterator[ChatCompletionChunk]:
+        chunks: list[dict] = []
+        try:
+            async for chunk in stream:
+                chunks.append(chunk.model_dump(mode="json"))
+                yield chunk
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                await close()
+        await asyncio.to_thread(
+            self._cache.put, key, "stream", json.dumps(chunks, ensure_ascii=False)
+        )
+
+
+def _replay_stream(chunks: list[dict]) -> Iterator[ChatCompletionChunk]:
+    for chunk in chunks:
+        yield ChatCompletionChunk.model_validate(chunk)
+
+
+async def _areplay_stream(chunks: list[dict]) -> AsyncIterator[ChatCompletionChunk]:
+    for chunk in chunks:
+        yield ChatCompletionChunk.model_validate(chunk)
+
+
+_cache: LLMResponseCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> LLMResponseCache | None:
+    """进程级缓存实例；未开启时返回 None。"""
+    global _cache
+    if not LLM_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LLMResponseCache()
+    return _cache
+
+
+def install_response_cache(client, asynchronous: bool = False) -> None:
+    """在 OpenAI 客户端上启用响应缓存（未开启或已安装时不做处理）；asynchronous 表示 AsyncOpenAI。"""
+    cache = get_llm_cache()
+    if cache is None or isinstance(client.chat.completions, CachedChatCompletions):
+        return
+    wrapper = AsyncCachedChatCompletions if asynchronous else CachedChatCompletions
+    client.chat.completions = wrapper(client.chat.completions, cache)
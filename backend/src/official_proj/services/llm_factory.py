@@ -1,12 +1,76 @@
-"""LLM 工厂：根据环境变量返回默认模型实例。"""
+"""LLM 工厂：根据环境变量返回默认模型实例，或按任务返回配置的 LLM profile。
+
+进程内按配置缓存 LLM 模板（含 OpenAI 客户端与 keep-alive 连接池），每次调用返回模板的
+浅拷贝：HTTP 客户端共享，crewai 在运行中修改的状态（stop / stream / token 统计）各自独立。
+
+按任务路由（见 TaskLLMs）：LLM_PROFILES 定义 profile，LLM_TASK_PROFILES 把任务名映射到
+profile。评审、剧情分析、记忆更新等短结构化输出可以交给更快的模型并限制输出长度，
+写作与重写保留默认的强模型。例如::
+
+    LLM_PROFILES='{"fast": {"model": "qwen-turbo", "max_tokens": 2000, "temperature": 0.3, "timeout": 120}}'
+"""
 
 from __future__ import annotations
 
+import copy
+import json
+import logging
 import os
+import threading
 
+import httpx
 from crewai.llm import LLM
+from crewai.llms.providers.openai.completion import OpenAICompletion
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
+
+from official_proj.services.llm_cache import install_response_cache
+from official_proj.services.llm_scheduler import TenantClient, install_scheduler
+from official_proj.services.streaming_openai import (
+    DashScopeOpenAICompletion,
+    MeteredOpenAICompletion
+)
+
+# 共享连接池大小与空闲连接保活时间。
+LLM_POOL_MAX_CONNECTIONS = int(os.getenv("LLM_POOL_MAX_CONNECTIONS", "100"))
+LLM_POOL_MAX_KEEPALIVE = int(os.getenv("LLM_POOL_MAX_KEEPALIVE", "20"))
+LLM_POOL_KEEPALIVE_EXPIRY = float(os.getenv("LLM_POOL_KEEPALIVE_EXPIRY", "60"))
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROFILE = "default"
+# 默认的任务 → profile 映射；映射到未定义的 profile 时使用默认模型。
+_DEFAULT_TASK_PROFILES = {
+    "writing_task": "writer",
+    "chapter_rewrite_task": "writer",
+    "chapter_review_task": "fast",
+    "chapter_rewrite_review_task": "fast",
+    "plot_analysis_task": "fast",
+    "memory_update_task": "fast",
+}
+# profile 可配置的字段：未给出的沿用默认配置（MODEL / OPENAI_API_BASE / OPENAI_API_KEY）。
+_PROFILE_FIELDS = ("model", "base_url", "api_key", "max_tokens", "temperature", "timeout")
+
+
+def _json_env(name: str, default: dict) -> dict:
+    raw = os.getenv(name)
+    if not raw:
+        return default
+    try:
+        value = json.loads(raw)
+    except ValueError:
+        logger.error("%s is not valid JSON, using defaults", name)
+        return default
+    if not isinstance(value, dict):
+        logger.error("%s must be a JSON object, using defaults", name)
+        return default
+    return value
 
-from official_proj.services.streaming_openai import DashScopeOpenAICompletion
+
+LLM_PROFILES: dict[str, dict] = _json_env("LLM_PROFILES", {})
+LLM_TASK_PROFILES: dict[str, str] = _json_env("LLM_TASK_PROFILES", _DEFAULT_TASK_PROFILES)
+
+_templates: dict[tuple, object] = {}
+_templates_lock = threading.Lock()
 
 
 def _is_dashscope(base_url: str | None) -> bool:
@@ -16,24 +80,163 @@ def _is_dashscope(base_url: str | None) -> bool:
     return "dashscope.aliyuncs.com" in base_url.lower()
 
 
-def get_default_llm():
-    """获取默认 LLM 实例，优先根据环境变量配置。"""
+def _llm_config() -> tuple[str, str | None, str | None]:
     # 读取模型与 OpenAI 兼容配置。
     model = os.getenv("MODEL") or "gpt-4o-mini"
     base_url = os.getenv("OPENAI_API_BASE") or os.getenv("OPENAI_BASE_URL")
     api_key = os.getenv("OPENAI_API_KEY")
+    return model, base_url, api_key
+
 
+def _build_llm(
+    model: str,
+    base_url: str | None,
+    api_key: str | None,
+    timeout: float | None = None
+):
+    """新建 LLM 实例（每次都会创建新的 OpenAI 客户端）。"""
     # DashScope 走自定义的流式兼容实现。
     if _is_dashscope(base_url):
         return DashScopeOpenAICompletion(
             model=model,
             api_key=api_key,
             base_url=base_url,
+            timeout=timeout,
         )
 
-    # 其余兼容 OpenAI 的基类实现。
-    return LLM(
+    # 其余按 crewai 的 provider 路由；OpenAI 兼容实现换成记录用量的子类。
+    llm = LLM(
         model=model,
         api_key=api_key,
         base_url=base_url,
+        timeout=timeout,
+    )
+    if type(llm) is OpenAICompletion:
+        return MeteredOpenAICompletion(
+            model=llm.model,
+            api_key=api_key,
+            base_url=base_url,
+            timeout=timeout,
+        )
+    return llm
+
+
+def _use_pooled_clients(llm) -> None:
+    """把模板的 OpenAI 客户端换成显式配置连接池的客户端。"""
+    if not isinstance(llm, OpenAICompletion) or llm.interceptor:
+        return
+    limits = httpx.Limits(
+        max_connections=LLM_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=LLM_POOL_KEEPALIVE_EXPIRY,
     )
+    params = llm._get_client_params()
+    llm.client = OpenAI(**params, http_client=DefaultHttpxClient(limits=limits))
+    llm.async_client = AsyncOpenAI(
+        **params, http_client=DefaultAsyncHttpxClient(limits=limits)
+    )
+
+
+def _clone_llm(template, tenant: str | None = None, usage_tags: dict | None = None):
+    """浅拷贝模板：共享客户端，重置 crewai 会按次修改或累加的字段。
+
+    指定 tenant 时客户端换成绑定该调用方的视图，调度器据此公平排队；
+    usage_tags（小说 / 章节 / 用户）写入该实例每次调用的用量记录。
+    """
+    llm = copy.copy(template)
+    if isinstance(template, MeteredOpenAICompletion):
+        llm.usage_tags = dict(usage_tags or {})
+    if tenant and isinstance(template, OpenAICompletion):
+        llm.client = TenantClient(template.client, tenant)
+        llm.async_client = TenantClient(template.async_client, tenant, asynchronous=True)
+    if isinstance(getattr(template, "_token_usage", None), dict):
+        llm._token_usage = {key: 0 for key in template._token_usage}
+    if isinstance(getattr(template, "stop", None), list):
+        llm.stop = list(template.stop)
+    return llm
+
+
+def get_llm_template(
+    model: str,
+    base_url: str | None,
+    api_key: str | None,
+    timeout: float | None = None
+):
+    """按配置取进程级 LLM 模板，首次调用时创建（超时不同的 profile 各用一组客户端）。"""
+    key = (model, base_url, api_key, timeout)
+    template = _templates.get(key)
+    if template is None:
+        with _templates_lock:
+            template = _templates.get(key)
+            if template is None:
+                template = _build_llm(model, base_url, api_key, timeout)
+                _use_pooled_clients(template)
+                if isinstance(template, OpenAICompletion):
+                    # 全局并发 / TPM 限额与公平排队；缓存包在外层，命中时不占名额。
+                    install_scheduler(template.client)
+                    install_scheduler(template.async_client, asynchronous=True)
+                    # 可选：相同请求直接返回缓存的响应（LLM_CACHE_ENABLED）。
+                    install_response_cache(template.client)
+                    install_response_cache(template.async_client, asynchronous=True)
+                _templates[key] = template
+    return template
+
+
+def get_default_llm(tenant: str | None = None, usage_tags: dict | None = None):
+    """获取默认 LLM 实例，优先根据环境变量配置；tenant 为调用方（用户/小说）。"""
+    return _clone_llm(
+        get_llm_template(*_llm_config()),
+        tenant,
+        {**(usage_tags or {}), "llm_profile": DEFAULT_PROFILE}
+    )
+
+
+def task_profile(task_name: str | None) -> str | None:
+    """任务使用的 profile 名；未映射或 profile 未定义时返回 None（使用默认模型）。"""
+    profile = LLM_TASK_PROFILES.get(task_name) if task_name else None
+    return profile if profile in LLM_PROFILES else None
+
+
+def get_profile_llm(
+    profile: str,
+    tenant: str | None = None,
+    usage_tags: dict | None = None
+):
+    """按 LLM_PROFILES 中的 profile 创建 LLM 实例。"""
+    config = LLM_PROFILES[profile]
+    unknown = set(config) - set(_PROFILE_FIELDS)
+    if unknown:
+        raise ValueError(f"LLM profile {profile!r} has unknown fields: {sorted(unknown)}")
+    model, base_url, api_key = _llm_config()
+    template = get_llm_template(
+        config.get("model") or model,
+        config.get("base_url") or base_url,
+        config.get("api_key") or api_key,
+        config.get("timeout"),
+    )
+    llm = _clone_llm(template, tenant, {**(usage_tags or {}), "llm_profile": profile})
+    # 输出上限与温度按 profile 设置在副本上，不影响共享模板。
+    for field in ("max_tokens", "temperature"):
+        if config.get(field) is not None:
+            setattr(llm, field, config[field])
+    return llm
+
+
+class TaskLLMs:
+    """一个 crew 内按任务取 LLM：同一 profile 的任务共用一个实例，未配置的任务使用默认模型。"""
+
+    def __init__(self, tenant: str | None = None, usage_tags: dict | None = None) -> None:
+        self.tenant = tenant
+        self.usage_tags = usage_tags
+        self.default = get_default_llm(tenant, usage_tags)
+        self._profiles: dict[str, object] = {}
+
+    def for_task(self, task_name: str | None = None):
+        profile = task_profile(task_name)
+        if profile is None:
+            return self.default
+        llm = self._profiles.get(profile)
+        if llm is None:
+            llm = get_profile_llm(profile, self.tenant, self.usage_tags)
+            self._profiles[profile] = llm
+        return llm
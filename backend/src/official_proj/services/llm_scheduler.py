@@ -0,0 +1,501 @@
+"""跨小说的 LLM 调度器：全局并发数与每分钟 token 数（TPM）限额，按用户公平排队。
+
+所有生成共用进程级的 OpenAI 客户端，调度器挂在其 chat.completions.create 之前：
+
+- 同时在途的请求数不超过 LLM_MAX_CONCURRENCY（流式请求读完才释放名额）；
+- 最近 60 秒内的 token 数不超过 LLM_TOKENS_PER_MINUTE（请求前按 prompt 估算，
+  完成后按实际用量修正）；
+- 超出限额的请求排队等待而不是直接打到供应商触发 429；不同用户之间轮转放行，
+  单个用户的大量请求不会饿死其他用户。
+
+调用方（用户 / 小说）由 tenant_scope 设置，LLM 实例在创建时绑定，见 llm_factory。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any
+
+from official_proj.services.prompt_context import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# 0 表示不限制。
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))
+# 未指定 max_tokens 时预估的输出 token 数（一章正文约 5000 字）。
+LLM_COMPLETION_TOKENS_ESTIMATE = int(os.getenv("LLM_COMPLETION_TOKENS_ESTIMATE", "4000"))
+# 排队超过该秒数仍未放行则报错。
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "900"))
+
+_WINDOW_SECONDS = 60.0
+DEFAULT_TENANT = "default"
+
+_current_tenant: contextvars.ContextVar[str] = contextvars.ContextVar(
+    "llm_tenant", default=DEFAULT_TENANT
+)
+
+
+class LLMQueueTimeout(RuntimeError):
+    """排队等待超时。"""
+
+
+@contextmanager
+def tenant_scope(tenant: str | None):
+    """在当前线程内把 LLM 调用归属到 tenant（用于公平排队）。"""
+    token = _current_tenant.set(tenant or DEFAULT_TENANT)
+    try:
+        yield
+    finally:
+        _current_tenant.reset(token)
+
+
+def tenant_for(inputs: dict) -> str:
+    """生成流程的调用方：优先按用户，其次按小说。"""
+    if inputs.get("user_id") is not None:
+        return f"user:{inputs['user_id']}"
+    return f"novel:{inputs.get('novel_id')}"
+
+
+def estimate_tokens(params: dict[str, Any]) -> int:
+    """请求前估算本次调用的 token 数（prompt + 预计输出）。"""
+    prompt = 0
+    for message in params.get("messages") or []:
+        content = message.get("content") if isinstance(message, dict) else None
+        if isinstance(content, str):
+            prompt += count_tokens(content)
+        elif content is not None:
+            prompt += count_tokens(json.dumps(content, ensure_ascii=False))
+    completion = (
+        params.get("max_completion_tokens")
+        or params.get("max_tokens")
+        or LLM_COMPLETION_TOKENS_ESTIMATE
+    )
+    return prompt + int(completion)
+
+
+@dataclass
+class _Waiter:
+    tenant: str
+    tokens: int
+    enqueued_at: float = field(default_factory=time.monotonic)
+    # 异步等待者：由所在事件循环唤醒。
+    loop: asyncio.AbstractEventLoop | None = None
+    wakeup: asyncio.Event | None = None
+
+
+@dataclass
+class Ticket:
+    """已放行的一次调用，结束时交回调度器。"""
+
+    tenant: str
+    tokens: int
+    admitted_at: float
+    _usage_entry: list = field(repr=False, default_factory=list)
+    released: bool = False
+
+
+class LLMScheduler:
+    """全局并发 + TPM 限额，按 tenant 轮转的公平队列。"""
+
+    def __init__(
+        self,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        tokens_per_minute: int = LLM_TOKENS_PER_MINUTE,
+        queue_timeout: float = LLM_QUEUE_TIMEOUT_SECONDS
+    ):
+        self.max_concurrency = max_concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        # tenant → 排队中的请求；键的顺序即轮转顺序。
+        self._queues: OrderedDict[str, deque[_Waiter]] = OrderedDict()
+        self._in_flight = 0
+        # 最近 60 秒的 [时间, token 数]，完成后按实际用量修正。
+        self._usage: deque[list] = deque()
+        self._waits: deque[float] = deque(maxlen=1000)
+        self._admitted = 0
+        self._timeouts = 0
+
+    # ---------- 放行 ----------
+
+    def acquire(self, tenant: str, tokens: int) -> Ticket:
+        """排队直到满足并发与 TPM 限额，且轮到该 tenant。"""
+        waiter = _Waiter(tenant, tokens)
+        deadline = waiter.enqueued_at + self.queue_timeout
+        with self._cond:
+            self._queues.setdefault(tenant, deque()).append(waiter)
+            try:
+                while (timeout := self._poll(waiter, deadline)) is not None:
+                    self._cond.wait(timeout)
+            finally:
+                self._remove(waiter)
+                # 队首变化后其他等待者需要重新检查。
+                self._wake()
+            return self._admit(waiter)
+
+    async def acquire_async(self, tenant: str, tokens: int) -> Ticket:
+        """acquire 的异步版本：在事件循环上等待，不占用工作线程。
+
+        等待者与同步请求在同一队列中排队，轮到它或名额释放时经其事件循环唤醒；
+        被取消或超时时从队列中移除，放行与返回之间没有挂起点，不会遗留名额。
+        """
+        waiter = _Waiter(
+            tenant, tokens, loop=asyncio.get_running_loop(), wakeup=asyncio.Event()
+        )
+        deadline = waiter.enqueued_at + self.queue_timeout
+        with self._cond:
+            self._queues.setdefault(tenant, deque()).append(waiter)
+        try:
+            while True:
+                with self._cond:
+                    waiter.wakeup.clear()
+                    timeout = self._poll(waiter, deadline)
+                    if timeout is None:
+                        self._remove(waiter)
+                        self._wake()
+                        return self._admit(waiter)
+                try:
+                    await asyncio.wait_for(waiter.wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            with self._cond:
+                self._remove(waiter)
+                self._wake()
+            raise
+
+    def _poll(self, waiter: _Waiter, deadline: float) -> float | None:
+        """None 表示可以放行；否则返回需等待的秒数，已超过 deadline 时报错。"""
+        if self._next_waiter() is waiter:
+            retry_after = self._admission_delay(waiter.tokens)
+            if retry_after == 0:
+                return None
+        else:
+            retry_after = None
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            self._timeouts += 1
+            raise LLMQueueTimeout(f"LLM 请求排队超过 {self.queue_timeout:g} 秒")
+        return remaining if retry_after is None else min(remaining, retry_after)
+
+    def _admit(self, waiter: _Waiter) -> Ticket:
+        now = time.monotonic()
+        self._prune(now)
+        self._in_flight += 1
+        entry = [now, waiter.tokens]
+        self._usage.append(entry)
+        self._admitted += 1
+        self._waits.append(now - waiter.enqueued_at)
+        return Ticket(waiter.tenant, waiter.tokens, now, entry)
+
+    def _wake(self) -> None:
+        """通知等待者重新检查：同步等待者经条件变量，异步的队首经其事件循环。"""
+        self._cond.notify_all()
+        head = self._next_waiter()
+        if head is not None and head.wakeup is not None:
+            try:
+                head.loop.call_soon_threadsafe(head.wakeup.set)
+            except RuntimeError:
+                # 事件循环已关闭，等待者不会再被调度。
+                pass
+
+    def release(self, ticket: Ticket, actual_tokens: int | None = None) -> None:
+        """结束一次调用；有实际用量时替换预估值。"""
+        with self._cond:
+            if ticket.released:
+                return
+            ticket.released = True
+            self._in_flight -= 1
+            if actual_tokens is not None and ticket._usage_entry:
+                ticket._usage_entry[1] = actual_tokens
+            self._wake()
+
+    def _next_waiter(self) -> _Waiter | None:
+        # 轮转：最早进入轮转顺序且有排队请求的 tenant 的队首。
+        for queue in self._queues.values():
+            if queue:
+                return queue[0]
+        return None
+
+    def _remove(self, waiter: _Waiter) -> None:
+        queue = self._queues.get(waiter.tenant)
+        if queue is None:
+            return
+        try:
+            queue.remove(waiter)
+        except ValueError:
+            pass
+        # 放行后该 tenant 移到轮转末尾；没有排队请求则移除。
+        if queue:
+            self._queues.move_to_end(waiter.tenant)
+        else:
+            del self._queues[waiter.tenant]
+
+    def _prune(self, now: float) -> None:
+        while self._usage and now - self._usage[0][0] >= _WINDOW_SECONDS:
+            self._usage.popleft()
+
+    def _admission_delay(self, tokens: int) -> float | None:
+        """0 表示可立即放行；正数为 TPM 窗口腾出额度前的等待秒数；None 表示等并发名额。"""
+        if self.max_concurrency and self._in_flight >= self.max_concurrency:
+            return None
+        if not self.tokens_per_minute:
+            return 0
+        now = time.monotonic()
+        self._prune(now)
+        used = sum(entry[1] for entry in self._usage)
+        # 窗口为空时即使单次超额也放行，避免大请求永远排不上。
+        if not self._usage or used + tokens <= self.tokens_per_minute:
+            return 0
+        return max(self._usage[0][0] + _WINDOW_SECONDS - now, 0.05)
+
+    # ---------- 指标 ----------
+
+    def stats(self) -> dict:
+        """队列深度、等待时间、在途请求与窗口内 token 数。"""
+        with self._cond:
+            now = time.monotonic()
+            window = [e for e in self._usage if now - e[0] < _WINDOW_SECONDS]
+            waits = sorted(self._waits)
+            oldest = min(
+                (q[0].enqueued_at for q in self._queues.values() if q),
+                default=None
+            )
+            return {
+                "max_concurrency": self.max_concurrency,
+                "tokens_per_minute": self.tokens_per_minute,
+                "in_flight": self._in_flight,
+                "queue_depth": sum(len(q) for q in self._queues.values()),
+                "queue_by_tenant": {t: len(q) for t, q in self._queues.items() if q},
+                "oldest_wait_seconds": round(now - oldest, 3) if oldest else 0.0,
+                "tokens_last_minute": sum(e[1] for e in window),
+                "admitted": self._admitted,
+                "timeouts": self._timeouts,
+                "wait_avg_seconds": round(sum(waits) / len(waits), 3) if waits else 0.0,
+                "wait_p95_seconds": round(waits[int(len(waits) * 0.95) - 1], 3)
+                if waits else 0.0,
+                "wait_max_seconds": round(waits[-1], 3) if waits else 0.0,
+            }
+
+
+class _StreamAccounting:
+    """流式响应的用量统计：结束时交回名额，并按实际输出修正 token 数。"""
+
+    def __init__(self, stream, scheduler: LLMScheduler, ticket: Ticket, prompt_tokens: int):
+        self._stream = stream
+        self._scheduler = scheduler
+        self._ticket = ticket
+        self._prompt_tokens = prompt_tokens
+        self._completion_text: list[str] = []
+        self._usage_tokens: int | None = None
+
+    def _observe(self, chunk) -> None:
+        usage = getattr(chunk, "usage", None)
+        if usage is not None and getattr(usage, "total_tokens", None):
+            self._usage_tokens = usage.total_tokens
+        for choice in getattr(chunk, "choices", None) or []:
+            content = getattr(choice.delta, "content", None)
+            if content:
+                self._completion_text.append(content)
+
+    def __del__(self):
+        self._finish()
+
+    def __getattr__(self, name: str):
+        return getattr(self._stream, name)
+
+    def _finish(self) -> None:
+        if self._ticket.released:
+            return
+        actual = self._usage_tokens
+        if actual is None:
+            actual = self._prompt_tokens + count_tokens("".join(self._completion_text))
+        self._scheduler.release(self._ticket, actual)
+
+
+class _ScheduledStream(_StreamAccounting):
+    """包装流式响应：读完、出错或关闭时交回名额。"""
+
+    def __init__(self, stream, scheduler: LLMScheduler, ticket: Ticket, prompt_tokens: int):
+        super().__init__(stream, scheduler, ticket, prompt_tokens)
+        self._iter = iter(stream)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            chunk = next(self._iter)
+        except BaseException:
+            self._finish()
+            raise
+        self._observe(chunk)
+        return chunk
+
+    def close(self) -> None:
+        try:
+            close = getattr(self._stream, "close", None)
+            if close is not None:
+                close()
+        finally:
+            self._finish()
+
+
+class _AsyncScheduledStream(_StreamAccounting):
+    """异步流式响应的包装，语义同 _ScheduledStream。"""
+
+    def __init__(self, stream, scheduler: LLMScheduler, ticket: Ticket, prompt_tokens: int):
+        super().__init__(stream, scheduler, ticket, prompt_tokens)
+        self._iter = stream.__aiter__()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            chunk = await self._iter.__anext__()
+        except BaseException:
+            self._finish()
+            raise
+        self._observe(chunk)
+        return chunk
+
+    async def close(self) -> None:
+        try:
+            close = getattr(self._stream, "close", None)
+            if close is not None:
+                await close()
+        finally:
+            self._finish()
+
+    aclose = close
+
+
+class ScheduledChatCompletions:
+    """包装 client.chat.completions：create 前经调度器排队，其余属性透传。"""
+
+    def __init__(self, completions, scheduler: LLMScheduler):
+        self._completions = completions
+        self._scheduler = scheduler
+
+    def __getattr__(self, name: str):
+        return getattr(self._completions, name)
+
+    def create(self, **params):
+        estimate = estimate_tokens(params)
+        ticket = self._scheduler.acquire(_current_tenant.get(), estimate)
+        try:
+            response = self._completions.create(**params)
+        except BaseException:
+            self._scheduler.release(ticket)
+            raise
+        if params.get("stream"):
+            return _ScheduledStream(
+                response, self._scheduler, ticket, _prompt_tokens(params, estimate)
+            )
+        usage = getattr(response, "usage", None)
+        self._scheduler.release(ticket, getattr(usage, "total_tokens", None))
+        return response
+
+
+class AsyncScheduledChatCompletions(ScheduledChatCompletions):
+    """AsyncOpenAI 客户端的 chat.completions 包装，与同步客户端共用调度器。"""
+
+    async def create(self, **params):
+        estimate = estimate_tokens(params)
+        ticket = await self._scheduler.acquire_async(_current_tenant.get(), estimate)
+        try:
+            response = await self._completions.create(**params)
+        except BaseException:
+            self._scheduler.release(ticket)
+            raise
+        if params.get("stream"):
+            return _AsyncScheduledStream(
+                response, self._scheduler, ticket, _prompt_tokens(params, estimate)
+            )
+        usage = getattr(response, "usage", None)
+        self._scheduler.release(ticket, getattr(usage, "total_tokens", None))
+        return response
+
+
+def _prompt_tokens(params: dict[str, Any], estimate: int) -> int:
+    # 预估值减去预计输出，即 prompt 部分。
+    return estimate - int(
+        params.get("max_completion_tokens")
+        or params.get("max_tokens")
+        or LLM_COMPLETION_TOKENS_ESTIMATE
+    )
+
+
+class TenantChatCompletions:
+    """绑定 tenant 的 completions 视图：调用期间设置 tenant，再交给共享客户端。"""
+
+    def __init__(self, completions, tenant: str):
+        self._completions = completions
+        self._tenant = tenant
+
+    def __getattr__(self, name: str):
+        return getattr(self._completions, name)
+
+    def create(self, **params):
+        with tenant_scope(self._tenant):
+            return self._completions.create(**params)
+
+
+class AsyncTenantChatCompletions(TenantChatCompletions):
+    """异步客户端的 tenant 视图：在协程执行期间设置 tenant。"""
+
+    async def create(self, **params):
+        with tenant_scope(self._tenant):
+            return await self._completions.create(**params)
+
+
+class _TenantChat:
+    def __init__(self, chat, tenant: str, asynchronous: bool = False):
+        self._chat = chat
+        completions = AsyncTenantChatCompletions if asynchronous else TenantChatCompletions
+        self.completions = completions(chat.completions, tenant)
+
+    def __getattr__(self, name: str):
+        return getattr(self._chat, name)
+
+
+class TenantClient:
+    """共享 OpenAI 客户端的轻量视图，只替换 chat.completions.create。
+
+    asynchronous=True 用于 AsyncOpenAI 客户端。
+    """
+
+    def __init__(self, client, tenant: str, asynchronous: bool = False):
+        self._client = client
+        self.chat = _TenantChat(client.chat, tenant, asynchronous)
+
+    def __getattr__(self, name: str):
+        return getattr(self._client, name)
+
+
+_scheduler = LLMScheduler()
+
+
+def get_llm_scheduler() -> LLMScheduler:
+    return _scheduler
+
+
+def install_scheduler(client, asynchronous: bool = False) -> None:
+    """在 OpenAI 客户端上启用调度（已安装时不做处理）；asynchronous 表示 AsyncOpenAI。"""
+    completions = client.chat.completions
+    if isinstance(completions, ScheduledChatCompletions):
+        return
+    wrapper = AsyncScheduledChatCompletions if asynchronous else ScheduledChatCompletions
+    client.chat.completions = wrapper(completions, _scheduler)
+
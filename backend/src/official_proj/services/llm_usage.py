@@ -0,0 +1,301 @@
+"""LLM 调用的 token 用量与延迟统计。
+
+每次 LLM 调用记录 prompt / completion token、首 token 延迟（TTFT）、总耗时与输出速度，
+并标注小说、章节、用户、任务名与 agent 角色，写入 MongoDB 的 llm_usage 集合：
+
+- 调用期间由 track_llm_call 在 contextvar 中放置一个 LLMCallMetrics，
+  流式 chunk 与用量回调只需更新它，不必层层传参；
+- 调用结束后记录只进入内存队列，后台线程按批 insert_many，不阻塞生成；
+- 供应商未返回用量时（如 DashScope 流式不带 usage），按文本估算并标记 usage_estimated。
+"""
+
+from __future__ import annotations
+
+import contextvars
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Iterator
+
+from official_proj.db.mongo_db.dao.llm_usage_dao import LLMUsageDAO
+from official_proj.db.mongo_db.mongo import MongoDB
+from official_proj.services.prompt_context import count_tokens
+
+logger = logging.getLogger(__name__)
+
+LLM_USAGE_ENABLED = os.getenv("LLM_USAGE_ENABLED", "1").lower() in ("1", "true", "yes")
+# 每批最多写入的记录数与最长等待时间（秒）。
+LLM_USAGE_BATCH_SIZE = int(os.getenv("LLM_USAGE_BATCH_SIZE", "200"))
+LLM_USAGE_FLUSH_SECONDS = float(os.getenv("LLM_USAGE_FLUSH_SECONDS", "5"))
+# 队列上限：MongoDB 不可用时丢弃超出部分，而不是让内存无限增长。
+LLM_USAGE_QUEUE_MAX = int(os.getenv("LLM_USAGE_QUEUE_MAX", "10000"))
+
+_current_call: contextvars.ContextVar[LLMCallMetrics | None] = contextvars.ContextVar(
+    "llm_call_metrics", default=None
+)
+
+
+def usage_tags_for(inputs: dict) -> dict:
+    """生成流程中 LLM 调用的归属标签：小说、章节与用户。"""
+    return {
+        key: inputs[key]
+        for key in ("novel_id", "chapter_number", "user_id")
+        if inputs.get(key) is not None
+    }
+
+
+def _prompt_text_tokens(messages: list) -> int:
+    total = 0
+    for message in messages or []:
+        content = message.get("content") if isinstance(message, dict) else None
+        if isinstance(content, str):
+            total += count_tokens(content)
+        elif content is not None:
+            total += count_tokens(json.dumps(content, ensure_ascii=False))
+    return total
+
+
+@dataclass
+class LLMCallMetrics:
+    """单次 LLM 调用的计量（包括结构化输出中断重试的各次尝试）。"""
+
+    model: str
+    streamed: bool
+    messages: list = field(default_factory=list)
+    tags: dict = field(default_factory=dict)
+    started: float = field(default_factory=time.perf_counter)
+    first_token_at: float | None = None
+    attempts: int = 0
+    usage: dict | None = None
+    _pieces: list[str] = field(default_factory=list)
+
+    def observe(self, text: str) -> None:
+        """记录一段流式输出（首段即首 token 时间）。"""
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        if text:
+            self._pieces.append(text)
+
+    def to_document(self, error: BaseException | None = None) -> dict:
+        finished = time.perf_counter()
+        duration = finished - self.started
+        usage = self.usage or {}
+        prompt_tokens = usage.get("prompt_tokens") or 0
+        completion_tokens = usage.get("completion_tokens") or 0
+        estimated = not (prompt_tokens or completion_tokens)
+        if estimated:
+            prompt_tokens = _prompt_text_tokens(self.messages)
+            completion_tokens = count_tokens("".join(self._pieces))
+
+        ttft = None
+        if self.first_token_at is not None:
+            ttft = self.first_token_at - self.started
+        elif not self.streamed and error is None:
+            # 非流式调用整段返回，首 token 即完成时间。
+            ttft = duration
+        # 输出速度按生成阶段计算（扣除首 token 前的排队与 prefill 时间）。
+        generating = duration - ttft if self.streamed and ttft is not None else duration
+
+        return {
+            "_id": str(uuid.uuid4()),
+            **self.tags,
+            "model": self.model,
+            "streamed": self.streamed,
+            "attempts": max(self.attempts, 1),
+            "success": error is None,
+            "error": f"{type(error).__name__}: {error}"[:500] if error else None,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "usage_estimated": estimated,
+            "ttft_ms": round(ttft * 1000, 1) if ttft is not None else None,
+            "duration_ms": round(duration * 1000, 1),
+            "tokens_per_second": (
+                round(completion_tokens / generating, 2)
+                if generating > 0 and completion_tokens else None
+            ),
+            "created_at": datetime.utcnow()
+        }
+
+
+def current_llm_call() -> LLMCallMetrics | None:
+    """当前正在计量的 LLM 调用（不在 track_llm_call 内时为 None）。"""
+    return _current_call.get()
+
+
+@contextmanager
+def track_llm_call(
+    model: str,
+    messages: list,
+    streamed: bool,
+    tags: dict | None = None
+) -> Iterator[LLMCallMetrics]:
+    """计量一次 LLM 调用，结束（含异常）后交给 LLMUsageRecorder。
+
+    嵌套调用时只计量最外层，避免同一请求记录两次。
+    """
+    if not LLM_USAGE_ENABLED or _current_call.get() is not None:
+        yield _current_call.get() or LLMCallMetrics(model=model, streamed=streamed)
+        return
+
+    metrics = LLMCallMetrics(
+        model=model,
+        streamed=streamed,
+        messages=messages,
+        tags=dict(tags or {})
+    )
+    token = _current_call.set(metrics)
+    error: BaseException | None = None
+    try:
+        yield metrics
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        _current_call.reset(token)
+        try:
+            get_usage_recorder().record(metrics.to_document(error))
+        except Exception:
+            logger.exception("record llm usage failed")
+
+
+class LLMUsageRecorder:
+    """llm_usage 的批量写入器：调用方只入队，后台线程凑批后 insert_many。"""
+
+    def __init__(
+        self,
+        dao_factory,
+        batch_size: int = LLM_USAGE_BATCH_SIZE,
+        flush_seconds: float = LLM_USAGE_FLUSH_SECONDS,
+        max_queue: int = LLM_USAGE_QUEUE_MAX
+    ):
+        # DAO 延迟创建：首次写入时才连接 MongoDB。
+        self._dao_factory = dao_factory
+        self._dao = None
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._queue: queue.Queue[dict] = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._worker: threading.Thread | None = None
+        self._stop = threading.Event()
+        self.written = 0
+        self.dropped = 0
+        self.failed_batches = 0
+
+    def record(self, doc: dict) -> None:
+        """非阻塞入队；队列已满时丢弃并计数。"""
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(doc)
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_worker(self) -> None:
+        if self._worker is not None:
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._run, name="llm-usage-writer", daemon=True
+                )
+                self._worker.start()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._write(self._next_batch())
+        # 退出前写完剩余记录。
+        self.flush()
+
+    def _next_batch(self) -> list[dict]:
+        """等到凑满一批或距首条记录超过 flush_seconds。"""
+        try:
+            batch = [self._queue.get(timeout=self.flush_seconds)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_seconds
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _drain(self) -> list[dict]:
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: list[dict]) -> None:
+        if not batch:
+            return
+        try:
+            if self._dao is None:
+                self._dao = self._dao_factory()
+            self._dao.insert_many(batch)
+            self.written += len(batch)
+        except Exception:
+            # 用量统计不影响生成：写入失败只记日志。
+            self.failed_batches += 1
+            logger.exception("write %d llm usage records failed", len(batch))
+
+    def flush(self) -> None:
+        """同步写出队列中的全部记录。"""
+        while True:
+            batch = self._drain()
+            if not batch:
+                return
+            self._write(batch)
+
+    def close(self, timeout: float = 10.0) -> None:
+        """停止后台线程并写出剩余记录（应用关闭时调用）。"""
+        self._stop.set()
+        worker = self._worker
+        if worker is not None:
+            worker.join(timeout)
+        self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "pending": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed_batches": self.failed_batches,
+        }
+
+
+def _default_dao() -> LLMUsageDAO:
+    return LLMUsageDAO(MongoDB())
+
+
+_recorder: LLMUsageRecorder | None = None
+_recorder_lock = threading.Lock()
+
+
+def get_usage_recorder() -> LLMUsageRecorder:
+    """进程级写入器，首次使用时创建。"""
+    global _recorder
+    if _recorder is None:
+        with _recorder_lock:
+            if _recorder is None:
+                _recorder = LLMUsageRecorder(_default_dao)
+    return _recorder
+
+
+def close_usage_recorder() -> None:
+    """应用关闭时写出剩余记录；从未使用过时不做处理。"""
+    if _recorder is not None:
+        _recorder.close()
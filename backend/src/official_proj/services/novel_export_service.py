@@ -0,0 +1,248 @@
+"""小说导出：从游标逐章生成 TXT / Markdown / EPUB，内存占用与章节数无关。"""
+
+import os
+import zipfile
+import zlib
+from datetime import datetime
+from html import escape
+from typing import BinaryIO, Iterable, Iterator
+
+# 导出游标每批拉取的章节数。
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "20"))
+# 流式 gzip 压缩级别（1 最快，9 最小）。
+EXPORT_GZIP_LEVEL = int(os.getenv("EXPORT_GZIP_LEVEL", "6"))
+# 发送已缓存导出文件时每次读取的字节数。
+EXPORT_READ_CHUNK_SIZE = 64 * 1024
+
+
+def _header_lines(novel_id: str, topic: str | None, world: dict) -> list[str]:
+    """导出文本头部：小说信息与世界观设定。"""
+    lines: list[str] = []
+    lines.append(f"小说ID: {novel_id}")
+    if topic:
+        lines.append(f"主题: {topic}")
+    lines.append("")
+    lines.append("世界观设定")
+    tone = world.get("tone")
+    tech = world.get("technology_level")
+    if tone:
+        lines.append(f"基调: {tone}")
+    if tech:
+        lines.append(f"科技/文明水平: {tech}")
+    lines.append("世界规则:")
+    world_rules = world.get("world_rules") or []
+    if world_rules:
+        for rule in world_rules:
+            lines.append(f"- {rule}")
+    else:
+        lines.append("- （无）")
+
+    lines.append("")
+    lines.append("章节正文")
+    return lines
+
+
+def iter_novel_text(
+    novel_id: str,
+    topic: str | None,
+    world: dict,
+    chapters: Iterable[dict]
+) -> Iterator[str]:
+    """逐段产出导出文本，拼接结果与一次性 "\\n".join 的版本一致。"""
+    yield "\n".join(_header_lines(novel_id, topic, world))
+
+    empty = True
+    for ch in chapters:
+        empty = False
+        content = ch.get("content") or ""
+        yield f"\n第 {ch.get('chapter_number')} 章 · {ch.get('title')}\n{content}\n"
+    if empty:
+        yield "\n（暂无章节）"
+
+
+def iter_encoded(pieces: Iterable[str], gzip: bool = False) -> Iterator[bytes]:
+    """UTF-8 编码，可选边生成边 gzip 压缩。"""
+    if not gzip:
+        for piece in pieces:
+            yield piece.encode("utf-8")
+        return
+
+    # wbits=31：输出带 gzip 头尾的流。
+    compressor = zlib.compressobj(EXPORT_GZIP_LEVEL, zlib.DEFLATED, 31)
+    for piece in pieces:
+        data = compressor.compress(piece.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def iter_file(fp: BinaryIO, chunk_size: int = EXPORT_READ_CHUNK_SIZE) -> Iterator[bytes]:
+    """分块读取已打开的文件，读完（或生成器关闭）时关闭文件。"""
+    try:
+        while chunk := fp.read(chunk_size):
+            yield chunk
+    finally:
+        fp.close()
+
+
+# ---------- Markdown ----------
+
+def iter_novel_markdown(
+    novel_id: str,
+    topic: str | None,
+    world: dict,
+    chapters: Iterable[dict]
+) -> Iterator[str]:
+    """逐段产出 Markdown：世界观为列表，每章一个二级标题。"""
+    yield f"# {topic or novel_id}\n\n"
+    yield "## 世界观设定\n\n"
+    if world.get("tone"):
+        yield f"- 基调：{world['tone']}\n"
+    if world.get("technology_level"):
+        yield f"- 科技/文明水平：{world['technology_level']}\n"
+    world_rules = world.get("world_rules") or []
+    yield "- 世界规则：\n"
+    for rule in world_rules or ["（无）"]:
+        yield f"  - {rule}\n"
+
+    empty = True
+    for ch in chapters:
+        empty = False
+        content = ch.get("content") or ""
+        yield f"\n## 第 {ch.get('chapter_number')} 章 · {ch.get('title')}\n\n"
+        yield content.rstrip("\n") + "\n"
+    if empty:
+        yield "\n（暂无章节）\n"
+
+
+# ---------- 打包格式（写入文件对象） ----------
+
+def write_txt_zip(
+    fp: BinaryIO,
+    novel_id: str,
+    topic: str | None,
+    world: dict,
+    chapters: Iterable[dict]
+) -> None:
+    """TXT 压缩包：单个 txt 条目，逐章写入压缩流。"""
+    with zipfile.ZipFile(fp, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        with zf.open(f"novel_{novel_id}.txt", "w", force_zip64=True) as entry:
+            for piece in iter_novel_text(novel_id, topic, world, chapters):
+                entry.write(piece.encode("utf-8"))
+
+
+_EPUB_CONTAINER = """<?xml version="1.0" encoding="UTF-8"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles>
+    <rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>
+  </rootfiles>
+</container>
+"""
+
+
+def _xhtml_page(title: str, body: str) -> str:
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<!DOCTYPE html>\n'
+        '<html xmlns="http://www.w3.org/1999/xhtml" '
+        'xmlns:epub="http://www.idpf.org/2007/ops" lang="zh-CN">\n'
+        f"<head><meta charset=\"UTF-8\"/><title>{escape(title)}</title></head>\n"
+        f"<body>\n{body}</body>\n</html>\n"
+    )
+
+
+def _paragraphs(content: str) -> str:
+    return "".join(
+        f"<p>{escape(line.strip())}</p>\n"
+        for line in content.splitlines()
+        if line.strip()
+    )
+
+
+def write_epub(
+    fp: BinaryIO,
+    novel_id: str,
+    topic: str | None,
+    world: dict,
+    chapters: Iterable[dict]
+) -> None:
+    """EPUB 3：每章一个 XHTML 文件，目录与清单在章节写完后生成。"""
+    book_title = topic or novel_id
+    modified = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+    with zipfile.ZipFile(fp, "w") as zf:
+        # mimetype 必须是第一个且不压缩的条目。
+        zf.writestr("mimetype", "application/epub+zip", zipfile.ZIP_STORED)
+        zf.writestr(
+            "META-INF/container.xml", _EPUB_CONTAINER, zipfile.ZIP_DEFLATED
+        )
+
+        world_rules = world.get("world_rules") or ["（无）"]
+        world_body = "<h1>世界观设定</h1>\n"
+        if world.get("tone"):
+            world_body += f"<p>基调：{escape(world['tone'])}</p>\n"
+        if world.get("technology_level"):
+            world_body += (
+                f"<p>科技/文明水平：{escape(world['technology_level'])}</p>\n"
+            )
+        world_body += "<ul>\n" + "".join(
+            f"<li>{escape(str(rule))}</li>\n" for rule in world_rules
+        ) + "</ul>\n"
+        zf.writestr(
+            "OEBPS/world.xhtml",
+            _xhtml_page("世界观设定", world_body),
+            zipfile.ZIP_DEFLATED
+        )
+
+        # 只保留目录需要的章节号与标题。
+        toc: list[tuple[str, str]] = [("world.xhtml", "世界观设定")]
+        for ch in chapters:
+            number = ch.get("chapter_number")
+            heading = f"第 {number} 章 · {ch.get('title')}"
+            href = f"chapter_{number}.xhtml"
+            body = f"<h1>{escape(heading)}</h1>\n" + _paragraphs(
+                ch.get("content") or ""
+            )
+            zf.writestr(
+                f"OEBPS/{href}", _xhtml_page(heading, body), zipfile.ZIP_DEFLATED
+            )
+            toc.append((href, heading))
+
+        nav_items = "".join(
+            f'<li><a href="{href}">{escape(label)}</a></li>\n'
+            for href, label in toc
+        )
+        nav_body = (
+            '<nav epub:type="toc" id="toc"><h1>目录</h1>\n'
+            f"<ol>\n{nav_items}</ol></nav>\n"
+        )
+        zf.writestr(
+            "OEBPS/nav.xhtml", _xhtml_page("目录", nav_body), zipfile.ZIP_DEFLATED
+        )
+
+        manifest = "".join(
+            f'    <item id="item{i}" href="{href}" '
+            'media-type="application/xhtml+xml"/>\n'
+            for i, (href, _) in enumerate(toc)
+        )
+        spine = "".join(
+            f'    <itemref idref="item{i}"/>\n' for i in range(len(toc))
+        )
+        opf = (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<package xmlns="http://www.idpf.org/2007/opf" version="3.0" '
+            'unique-identifier="book-id">\n'
+            '  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/">\n'
+            f'    <dc:identifier id="book-id">urn:novel:{escape(novel_id)}</dc:identifier>\n'
+            f"    <dc:title>{escape(book_title)}</dc:title>\n"
+            "    <dc:language>zh-CN</dc:language>\n"
+            f'    <meta property="dcterms:modified">{modified}</meta>\n'
+            "  </metadata>\n"
+            "  <manifest>\n"
+            '    <item id="nav" href="nav.xhtml" '
+            'media-type="application/xhtml+xml" properties="nav"/>\n'
+            f"{manifest}"
+            "  </manifest>\n"
+            f"  <spine>\n{spine}  </spine>\n"
+            "</package>\n"
+        )
+        zf.writestr("OEBPS/content.opf", opf, zipfile.ZIP_DEFLATED)
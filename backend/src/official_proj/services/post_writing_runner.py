@@ -0,0 +1,121 @@
+"""写作完成后的并行任务：剧情分析与记忆更新。
+
+两者只依赖最终正文、互不依赖，但 crewai 的顺序流程会串行执行，且 crew 末尾最多
+只允许一个 async 任务。因此把它们各自构造成单任务 crew，在独立线程池中并发运行，
+全部完成后再合并进 task_outputs 交给落库流程。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import AsyncIterator, Iterator
+
+from official_proj.utils.task_outputs import extract_writing
+
+logger = logging.getLogger(__name__)
+
+# 独立于生成线程池，避免生成线程等待子任务时占满同一个池导致死锁。
+POST_WRITING_MAX_WORKERS = int(os.getenv("POST_WRITING_MAX_WORKERS", "16"))
+
+_executor = ThreadPoolExecutor(
+    max_workers=POST_WRITING_MAX_WORKERS,
+    thread_name_prefix="post-writing"
+)
+
+
+def post_writing_inputs(inputs: dict, task_outputs: dict) -> dict:
+    """在原始输入上补充最终标题与正文（重写优先），供单任务 crew 插值。"""
+    writing_pack = extract_writing(task_outputs)
+    return {
+        **inputs,
+        "chapter_title": writing_pack.final_title,
+        "chapter_content": writing_pack.final_content,
+    }
+
+
+def _kickoff(crew, inputs: dict):
+    crew.kickoff(inputs=inputs)
+    return crew.tasks[0].output
+
+
+def iter_post_writing(crews: dict, inputs: dict, task_outputs: dict) -> Iterator[dict]:
+    """并发运行写作后的任务，逐个产出 progress 事件；全部结束后输出并入 task_outputs。
+
+    任一任务失败时，等其余任务结束后抛出第一个异常。
+    """
+    run_inputs = post_writing_inputs(inputs, task_outputs)
+    started = time.perf_counter()
+    futures = {
+        _executor.submit(_kickoff, crew, run_inputs): name
+        for name, crew in crews.items()
+    }
+    for name in crews:
+        yield {"type": "progress", "task": name}
+
+    first_error: Exception | None = None
+    for future in as_completed(futures):
+        name = futures[future]
+        try:
+            task_outputs[name] = future.result()
+        except Exception as e:
+            logger.exception("%s failed", name)
+            if first_error is None:
+                first_error = e
+        else:
+            logger.info(
+                "%s finished in %.2fs", name, time.perf_counter() - started
+            )
+    if first_error is not None:
+        raise first_error
+
+
+async def aiter_post_writing(crews: dict, inputs: dict, task_outputs: dict) -> AsyncIterator[dict]:
+    """iter_post_writing 的异步版本：各 crew 以 akickoff 在事件循环上并发运行。"""
+    run_inputs = post_writing_inputs(inputs, task_outputs)
+    started = time.perf_counter()
+    tasks = {
+        asyncio.ensure_future(_akickoff(crew, run_inputs)): name
+        for name, crew in crews.items()
+    }
+    for name in crews:
+        yield {"type": "progress", "task": name}
+
+    first_error: Exception | None = None
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                name = tasks[task]
+                try:
+                    task_outputs[name] = task.result()
+                except Exception as e:
+                    logger.exception("%s failed", name)
+                    if first_error is None:
+                        first_error = e
+                else:
+                    logger.info(
+                        "%s finished in %.2fs", name, time.perf_counter() - started
+                    )
+    finally:
+        # 消费端中途退出时取消仍在运行的任务。
+        for task in pending:
+            task.cancel()
+    if first_error is not None:
+        raise first_error
+
+
+async def _akickoff(crew, inputs: dict):
+    await crew.akickoff(inputs=inputs)
+    return crew.tasks[0].output
+
+
+def run_post_writing(crews: dict, inputs: dict, task_outputs: dict) -> dict:
+    """非流式调用：运行并返回合并后的 task_outputs。"""
+    for _ in iter_post_writing(crews, inputs, task_outputs):
+        pass
+    return task_outputs
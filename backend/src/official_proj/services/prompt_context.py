@@ -0,0 +1,223 @@
+"""续写上下文组装：按任务的 token 预算裁剪世界观与历史剧情。
+
+世界观规则与上一章关键事件会插值进写作、评审、重写、重写评审四个任务的描述，
+篇幅随小说推进不断增长。这里先统计各段 token 数，超出预算时按固定顺序降级：
+低优先级条目先压缩为首个分句（摘要），仍超出则整条丢弃并注明条数，
+最高优先级条目放不下时按 token 截断。相同输入总是得到相同输出。
+
+优先级：世界观规则越靠前越重要（先立的设定是根基）；
+剧情事件越靠后越重要（离下一章最近）。
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import os
+import re
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+try:  # tiktoken 为可选依赖，缺失时使用字符估算。
+    import tiktoken
+except ImportError:  # pragma: no cover - 取决于运行环境
+    tiktoken = None
+
+# 写作/重写需要完整设定，评审只需核对要点，预算更小。
+CONTEXT_BUDGET_WRITING = int(os.getenv("CONTEXT_BUDGET_WRITING", "2000"))
+CONTEXT_BUDGET_REVIEW = int(os.getenv("CONTEXT_BUDGET_REVIEW", "800"))
+# 超出预算时世界观可占用的比例，剩余给历史剧情；一方用不完的额度让给另一方。
+CONTEXT_WORLD_SHARE = float(os.getenv("CONTEXT_WORLD_SHARE", "0.6"))
+# 截断后剩余不足该 token 数的条目直接丢弃。
+CONTEXT_TRUNCATE_MIN_TOKENS = int(os.getenv("CONTEXT_TRUNCATE_MIN_TOKENS", "24"))
+
+# 预算档位 → 占位符（与 ChapterCrew 任务描述一致）。
+CONTEXT_PROFILES = {
+    "writing": ("world", "last_plot"),
+    "review": ("review_world", "review_last_plot"),
+}
+
+# 任务 → 预算档位，用于统计每章节省的 prompt token。
+TASK_CONTEXT_PROFILES = {
+    "writing_task": "writing",
+    "chapter_review_task": "review",
+    "chapter_rewrite_task": "writing",
+    "chapter_rewrite_review_task": "review",
+}
+
+_EMPTY = "（无）"
+_CJK_RE = re.compile(r"[⺀-鿿豈-﫿＀-￯　-〿]")
+_CLAUSE_RE = re.compile(r"[，。；！？,.;!?]")
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """统计 token 数：有 tiktoken 时精确计数，否则中文按字、其余按 4 字符估算。"""
+    global _encoding
+    if not text:
+        return 0
+    if tiktoken is not None:
+        if _encoding is None:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        return len(_encoding.encode(text))
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def _truncate(text: str, budget: int) -> str:
+    """截断到不超过 budget 个 token（二分查找字符数），末尾加省略号。"""
+    if count_tokens(text) <= budget:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(text[:mid] + "…") <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo] + "…" if lo else ""
+
+
+def _condense(item: str) -> str:
+    """摘要：只保留第一个分句。"""
+    match = _CLAUSE_RE.search(item)
+    if match and match.start() > 0 and match.end() < len(item):
+        return item[:match.start()] + "…"
+    return item
+
+
+def _render(items: list[str], omitted: int, omitted_first: bool = False) -> str:
+    lines = [f"- {item}" for item in items]
+    if omitted:
+        note = f"（另有 {omitted} 条从略）"
+        if omitted_first:
+            lines.insert(0, note)
+        else:
+            lines.append(note)
+    return "\n".join(lines) if lines else _EMPTY
+
+
+@dataclass(frozen=True)
+class FittedSection:
+    """裁剪后的一段上下文。"""
+
+    text: str
+    tokens: int
+    condensed: int
+    dropped: int
+    truncated: bool
+
+
+def fit_section(items: list[str], budget: int, keep_tail: bool = False) -> FittedSection:
+    """把条目列表裁剪到 budget 以内。
+
+    keep_tail 为 True 时末尾条目优先级最高（剧情事件），否则开头最高（世界观规则）。
+    """
+    items = [str(item) for item in items if str(item).strip()]
+    # 统一按“优先级从高到低”处理，渲染时再恢复原顺序。
+    ranked = list(reversed(items)) if keep_tail else list(items)
+
+    def result(kept: list[str], condensed: int, truncated: bool) -> FittedSection:
+        omitted = len(ranked) - len(kept)
+        ordered = list(reversed(kept)) if keep_tail else kept
+        text = _render(ordered, omitted, omitted_first=keep_tail)
+        return FittedSection(text, count_tokens(text), condensed, omitted, truncated)
+
+    text = _render(items, 0)
+    if count_tokens(text) <= budget:
+        return result(ranked, 0, False)
+
+    # 1. 从最低优先级开始逐条压缩为首个分句。
+    kept = list(ranked)
+    condensed = 0
+    for index in range(len(kept) - 1, 0, -1):
+        short = _condense(kept[index])
+        if short != kept[index]:
+            kept[index] = short
+            condensed += 1
+            if result(kept, condensed, False).tokens <= budget:
+                return result(kept, condensed, False)
+
+    # 2. 从最低优先级开始整条丢弃。
+    while len(kept) > 1:
+        kept.pop()
+        condensed = sum(1 for a, b in zip(kept, ranked) if a != b)
+        fitted = result(kept, condensed, False)
+        if fitted.tokens <= budget:
+            return fitted
+
+    # 3. 最高优先级条目也放不下：按剩余预算截断。
+    if kept:
+        overhead = result([""], 0, False).tokens
+        room = budget - overhead
+        head = _truncate(kept[0], room) if room >= CONTEXT_TRUNCATE_MIN_TOKENS else ""
+        if head:
+            return result([head], 0, True)
+    return result([], 0, False)
+
+
+def _fit_pair(world: list[str], last_plot: list[str], budget: int):
+    """在一个预算内分配世界观与剧情的额度。"""
+    world_tokens = count_tokens(_render(world, 0))
+    plot_tokens = count_tokens(_render(last_plot, 0))
+    if world_tokens + plot_tokens <= budget:
+        return fit_section(world, world_tokens), fit_section(last_plot, plot_tokens, True)
+
+    world_quota = max(int(budget * CONTEXT_WORLD_SHARE), budget - plot_tokens)
+    world_fit = fit_section(world, world_quota)
+    plot_fit = fit_section(last_plot, budget - world_fit.tokens, keep_tail=True)
+    return world_fit, plot_fit
+
+
+def assemble_chapter_context(
+    world: list[str] | None,
+    last_plot: list[str] | None,
+    budgets: dict[str, int] | None = None
+) -> dict:
+    """组装续写任务的上下文输入。
+
+    返回可直接合并进 crew inputs 的字典：各档位的 world/last_plot 文本，
+    以及 context_stats（每章原始与实际 token、节省量、丢弃/压缩条数）。
+    """
+    world = list(world or [])
+    last_plot = list(last_plot or [])
+    budgets = budgets or {
+        "writing": CONTEXT_BUDGET_WRITING,
+        "review": CONTEXT_BUDGET_REVIEW,
+    }
+
+    # 旧实现直接插值 list 的 str() 结果，作为节省量的基准。
+    raw_tokens = count_tokens(str(world)) + count_tokens(str(last_plot))
+
+    inputs: dict = {}
+    profiles: dict = {}
+    for profile, (world_key, plot_key) in CONTEXT_PROFILES.items():
+        world_fit, plot_fit = _fit_pair(world, last_plot, budgets[profile])
+        inputs[world_key] = world_fit.text
+        inputs[plot_key] = plot_fit.text
+        profiles[profile] = {
+            "budget": budgets[profile],
+            "tokens": world_fit.tokens + plot_fit.tokens,
+            "world_dropped": world_fit.dropped,
+            "world_condensed": world_fit.condensed,
+            "plot_dropped": plot_fit.dropped,
+            "plot_condensed": plot_fit.condensed,
+            "truncated": world_fit.truncated or plot_fit.truncated,
+        }
+
+    original = raw_tokens * len(TASK_CONTEXT_PROFILES)
+    assembled = sum(
+        profiles[profile]["tokens"] for profile in TASK_CONTEXT_PROFILES.values()
+    )
+    inputs["context_stats"] = {
+        "original_tokens": original,
+        "assembled_tokens": assembled,
+        "saved_tokens": original - assembled,
+        "profiles": profiles,
+    }
+    logger.info(
+        "chapter context: %d -> %d prompt tokens across %d tasks",
+        original, assembled, len(TASK_CONTEXT_PROFILES)
+    )
+    return inputs
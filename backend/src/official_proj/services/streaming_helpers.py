@@ -1,145 +1,297 @@
+import asyncio
 import json
-from typing import Tuple
+import os
+from dataclasses import dataclass
+from typing import AsyncIterator, Tuple
 
 
 def ndjson_line(payload: dict) -> bytes:
     return (json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8")
 
 
+# JSON 字符串中的简单转义映射。
+_SIMPLE_ESCAPES = {
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+    "b": "\b",
+    "f": "\f",
+    '"': '"',
+    "\\": "\\",
+    "/": "/",
+}
+
+_HEX_DIGITS = frozenset("0123456789abcdefABCDEF")
+
+# 需要识别的键（含引号），按出现位置先后匹配。
+_KEYS = (
+    ('"chapter_title"', "chapter_title"),
+    ('"content"', "content"),
+)
+
+
 class ChapterJsonStreamParser:
+    """增量解析写作任务的 JSON 输出，提取标题与正文增量。
+
+    每个 chunk 只扫描一次：未转义的文本区间通过 ``str.find`` 定位后整段切片拷贝，
+    仅在转义符处做逐字符处理；跨 chunk 拆分的键、转义与 ``\\uXXXX`` 均可正确续接。
+    """
+
     def __init__(self) -> None:
-        self._buffer = ""
+        self._max_key_len = max(len(token) for token, _ in _KEYS)
+        self.reset()
+
+    def reset(self) -> None:
+        # search 状态下保留的未匹配尾部（可能是被拆分的键）。
+        self._tail = ""
         self._state = "search"
         self._pending_key: str | None = None
         self._current_key: str | None = None
         self._escape = False
         self._unicode_buffer: str | None = None
-        self._title = ""
-        self._title_emitted = False
-        self._max_key_len = max(len('"chapter_title"'), len('"content"'))
-
-    def reset(self) -> None:
-        self._buffer = ""
-        self._state = "search"
-        self._pending_key = None
-        self._current_key = None
-        self._escape = False
-        self._unicode_buffer = None
-        self._title = ""
+        self._high_surrogate: str | None = None
+        self._title_parts: list[str] = []
         self._title_emitted = False
 
     def feed(self, text: str) -> Tuple[str | None, str]:
-        self._buffer += text
+        # 快速路径：字段内部的纯文本 chunk（最常见情况）直接整段输出。
+        if (
+            self._state == "capture"
+            and not self._escape
+            and self._unicode_buffer is None
+            and self._high_surrogate is None
+            and '"' not in text
+            and "\\" not in text
+        ):
+            if self._current_key == "content":
+                return None, text
+            self._title_parts.append(text)
+            return None, ""
+
         title_out: str | None = None
-        content_delta = ""
-        i = 0
+        parts: list[str] = []
 
-        while i < len(self._buffer):
-            ch = self._buffer[i]
+        if self._state == "search" and self._tail:
+            buf = self._tail + text
+        else:
+            buf = text
+        self._tail = ""
+        n = len(buf)
+        i = 0
+        # 缓存下一个引号/反斜杠的位置，避免重复扫描。
+        next_quote = -2
+        next_backslash = -2
 
+        while i < n:
             if self._state == "capture":
-                if self._unicode_buffer is not None:
-                    if ch.lower() in "0123456789abcdef":
-                        self._unicode_buffer += ch
-                        if len(self._unicode_buffer) == 4:
-                            try:
-                                decoded = chr(int(self._unicode_buffer, 16))
-                            except ValueError:
-                                decoded = "\\u" + self._unicode_buffer
-                            content_delta, title_out = self._append_char(
-                                decoded, content_delta, title_out
-                            )
-                            self._unicode_buffer = None
-                        i += 1
-                        continue
-                    else:
-                        fallback = "\\u" + self._unicode_buffer + ch
-                        content_delta, title_out = self._append_char(
-                            fallback, content_delta, title_out
-                        )
-                        self._unicode_buffer = None
-                        i += 1
-                        continue
-
-                if self._escape:
-                    if ch == "u":
-                        self._unicode_buffer = ""
-                    else:
-                        decoded = {
-                            "n": "\n",
-                            "r": "\r",
-                            "t": "\t",
-                            "b": "\b",
-                            "f": "\f",
-                            '"': '"',
-                            "\\": "\\",
-                            "/": "/",
-                        }.get(ch, ch)
-                        content_delta, title_out = self._append_char(
-                            decoded, content_delta, title_out
-                        )
-                    self._escape = False
-                    i += 1
+                if self._unicode_buffer is not None or self._escape:
+                    i = self._consume_escape(buf, i, parts)
                     continue
 
-                if ch == "\\":
-                    self._escape = True
-                    i += 1
-                    continue
+                if next_quote != -1 and next_quote < i:
+                    next_quote = buf.find('"', i)
+                if next_backslash != -1 and next_backslash < i:
+                    next_backslash = buf.find("\\", i)
+
+                stop = n
+                if next_quote != -1:
+                    stop = next_quote
+                if next_backslash != -1 and next_backslash < stop:
+                    stop = next_backslash
 
-                if ch == '"':
-                    if self._current_key == "chapter_title" and not self._title_emitted:
-                        title_out = self._title
-                        self._title_emitted = True
-                    self._state = "search"
-                    self._current_key = None
-                    i += 1
+                if stop > i:
+                    self._append(buf[i:stop], parts)
+                if stop == n:
+                    break
+
+                if stop == next_backslash:
+                    self._escape = True
+                    i = stop + 1
                     continue
 
-                content_delta, title_out = self._append_char(
-                    ch, content_delta, title_out
-                )
-                i += 1
+                # 未转义的引号：当前字段结束。
+                self._flush_surrogate(parts)
+                if self._current_key == "chapter_title" and not self._title_emitted:
+                    title_out = "".join(self._title_parts)
+                    self._title_emitted = True
+                self._state = "search"
+                self._current_key = None
+                i = stop + 1
                 continue
 
             if self._state == "wait_value":
-                if ch == '"':
-                    self._state = "capture"
-                    self._current_key = self._pending_key
-                    self._pending_key = None
-                i += 1
+                quote = buf.find('"', i)
+                if quote == -1:
+                    break
+                self._state = "capture"
+                self._current_key = self._pending_key
+                self._pending_key = None
+                i = quote + 1
                 continue
 
-            if self._buffer.startswith('"chapter_title"', i):
-                self._pending_key = "chapter_title"
-                self._state = "wait_value"
-                i += len('"chapter_title"')
-                continue
+            # search：定位最早出现的目标键。
+            found_at = -1
+            found_key: str | None = None
+            found_len = 0
+            for token, key in _KEYS:
+                pos = buf.find(token, i)
+                if pos != -1 and (found_at == -1 or pos < found_at):
+                    found_at, found_key, found_len = pos, key, len(token)
+            if found_key is None:
+                # 仅保留可能构成键前缀的尾部。
+                keep = max(i, n - (self._max_key_len - 1))
+                self._tail = buf[keep:]
+                break
+            self._pending_key = found_key
+            self._state = "wait_value"
+            i = found_at + found_len
 
-            if self._buffer.startswith('"content"', i):
-                self._pending_key = "content"
-                self._state = "wait_value"
-                i += len('"content"')
-                continue
+        return title_out, "".join(parts)
 
-            i += 1
+    def _consume_escape(self, buf: str, i: int, parts: list[str]) -> int:
+        """处理转义序列（可能跨 chunk），返回新的扫描位置。"""
+        ch = buf[i]
+        if self._unicode_buffer is not None:
+            if ch in _HEX_DIGITS:
+                self._unicode_buffer += ch
+                if len(self._unicode_buffer) == 4:
+                    code = int(self._unicode_buffer, 16)
+                    self._unicode_buffer = None
+                    self._append_codepoint(code, parts)
+            else:
+                fallback = "\\u" + self._unicode_buffer + ch
+                self._unicode_buffer = None
+                self._append(fallback, parts)
+            return i + 1
 
-        if self._state == "search":
-            if len(self._buffer) > self._max_key_len:
-                self._buffer = self._buffer[-self._max_key_len :]
+        self._escape = False
+        if ch == "u":
+            self._unicode_buffer = ""
         else:
-            self._buffer = ""
+            self._append(_SIMPLE_ESCAPES.get(ch, ch), parts)
+        return i + 1
 
-        return title_out, content_delta
+    def _append_codepoint(self, code: int, parts: list[str]) -> None:
+        """写入 \\uXXXX 解码结果，代理对合并为单个字符。"""
+        if 0xD800 <= code <= 0xDBFF:
+            self._flush_surrogate(parts)
+            self._high_surrogate = chr(code)
+            return
+        if 0xDC00 <= code <= 0xDFFF and self._high_surrogate is not None:
+            high = ord(self._high_surrogate)
+            self._high_surrogate = None
+            combined = 0x10000 + ((high - 0xD800) << 10) + (code - 0xDC00)
+            self._append(chr(combined), parts)
+            return
+        self._append(chr(code), parts)
 
-    def _append_char(
-        self,
-        ch: str,
-        content_delta: str,
-        title_out: str | None
-    ) -> Tuple[str, str | None]:
+    def _flush_surrogate(self, parts: list[str]) -> None:
+        """孤立的高位代理无法配对时按原样输出。"""
+        if self._high_surrogate is not None:
+            pending = self._high_surrogate
+            self._high_surrogate = None
+            self._append_raw(pending, parts)
+
+    def _append(self, text: str, parts: list[str]) -> None:
+        if self._high_surrogate is not None:
+            self._flush_surrogate(parts)
+        self._append_raw(text, parts)
+
+    def _append_raw(self, text: str, parts: list[str]) -> None:
         if self._current_key == "chapter_title":
-            self._title += ch
+            self._title_parts.append(text)
         elif self._current_key == "content":
-            content_delta += ch
-        return content_delta, title_out
+            parts.append(text)
+
+
+# ---------- 事件合并（content_delta 批量发送） ----------
+
+# 合并窗口：累计字数或等待时长任一达到即发送。
+COALESCE_MAX_CHARS = int(os.getenv("STREAM_COALESCE_MAX_CHARS", "256"))
+COALESCE_MAX_DELAY = float(os.getenv("STREAM_COALESCE_MAX_DELAY_MS", "30")) / 1000
+
+
+@dataclass
+class CoalesceStats:
+    """合并统计：输入/输出事件数。"""
+
+    events_in: int = 0
+    events_out: int = 0
+
+    @property
+    def saved(self) -> int:
+        return self.events_in - self.events_out
+
+
+async def coalesce_events(
+    events: AsyncIterator[dict],
+    max_chars: int = COALESCE_MAX_CHARS,
+    max_delay: float = COALESCE_MAX_DELAY,
+    stats: CoalesceStats | None = None
+) -> AsyncIterator[dict]:
+    """合并相邻的 content_delta 事件，其他事件到达时立即先发送缓冲内容。"""
+    stats = stats if stats is not None else CoalesceStats()
+    loop = asyncio.get_running_loop()
+    iterator = events.__aiter__()
+    pending: list[str] = []
+    pending_chars = 0
+    deadline = 0.0
+    next_item: asyncio.Future | None = None
+
+    def flush() -> dict:
+        nonlocal pending, pending_chars
+        merged = {"type": "content_delta", "data": "".join(pending)}
+        pending = []
+        pending_chars = 0
+        stats.events_out += 1
+        return merged
+
+    try:
+        while True:
+            if next_item is None:
+                next_item = asyncio.ensure_future(iterator.__anext__())
+            if pending:
+                # 等待下一事件，但不超过窗口截止时间（不取消读取本身）。
+                timeout = max(deadline - loop.time(), 0)
+                done, _ = await asyncio.wait({next_item}, timeout=timeout)
+                if not done:
+                    yield flush()
+                    continue
+            else:
+                await asyncio.wait({next_item})
+
+            try:
+                event = next_item.result()
+            except StopAsyncIteration:
+                break
+            finally:
+                next_item = None
+            stats.events_in += 1
+
+            if event.get("type") == "content_delta":
+                delta = event.get("data") or ""
+                if not pending:
+                    deadline = loop.time() + max_delay
+                pending.append(delta)
+                pending_chars += len(delta)
+                if pending_chars >= max_chars:
+                    yield flush()
+                continue
+
+            # title / rewrite_start / final / error 等事件：先清空缓冲再透传。
+            if pending:
+                yield flush()
+            stats.events_out += 1
+            yield event
+
+        if pending:
+            yield flush()
+    finally:
+        # 消费方提前停止时同样关闭上游，让其释放连接与生成名额。
+        if next_item is not None:
+            next_item.cancel()
+            # 读取结束后才能关闭：正在运行的异步生成器不能 aclose。
+            await asyncio.gather(next_item, return_exceptions=True)
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
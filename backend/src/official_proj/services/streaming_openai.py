@@ -1,9 +1,10 @@
 from __future__ import annotations
 
+import inspect
 import json
 import logging
 import os
-from typing import Any
+from typing import Any, AsyncIterator, ClassVar, Iterator
 
 from openai import Stream
 from openai.types.chat import ChatCompletionChunk
@@ -17,9 +18,141 @@ from crewai.utilities.exceptions.context_window_exceeding_exception import (
     LLMContextLengthExceededError,
 )
 
+from official_proj.services.llm_cache import bypass_response_cache, reject_cached_response
+from official_proj.services.llm_usage import current_llm_call, track_llm_call
+from official_proj.services.structured_stream import (
+    STRUCTURED_STREAM_RETRIES,
+    StructuredStreamError,
+    StructuredStreamValidator,
+)
+
+
+class MeteredOpenAICompletion(OpenAICompletion):
+    """OpenAICompletion that meters every call and records it to llm_usage.
+
+    Tokens, time-to-first-token and duration are tagged with ``usage_tags``
+    (set per clone by llm_factory) plus the task name and agent role. llm_factory
+    builds every OpenAI-provider template on this class.
+    """
+
+    usage_tags: dict[str, Any] | None = None
+    # Stream chunks are observed when emitted; subclasses that read the raw
+    # stream themselves observe chunks on arrival instead.
+    observe_emitted_chunks: ClassVar[bool] = True
+
+    def _track_usage(
+        self,
+        params: dict[str, Any],
+        streamed: bool,
+        from_task: Any | None,
+        from_agent: Any | None,
+    ):
+        """Meter one LLM call; the record is written when the block exits."""
+        tags = dict(self.usage_tags or {})
+        task_name = getattr(from_task, "name", None)
+        if task_name:
+            tags["task_name"] = task_name
+        agent_role = getattr(from_agent, "role", None)
+        if agent_role:
+            tags["agent_role"] = agent_role
+        return track_llm_call(
+            model=self.model,
+            messages=params.get("messages") or [],
+            streamed=streamed,
+            tags=tags,
+        )
+
+    def _track_token_usage_internal(self, usage_data: dict[str, Any]) -> None:
+        super()._track_token_usage_internal(usage_data)
+        call = current_llm_call()
+        if call is not None and usage_data:
+            call.usage = usage_data
+
+    def _handle_completion(
+        self,
+        params: dict[str, Any],
+        available_functions: dict[str, Any] | None = None,
+        from_task: Any | None = None,
+        from_agent: Any | None = None,
+        response_model: type[BaseModel] | None = None,
+    ) -> str | Any:
+        with self._track_usage(params, False, from_task, from_agent):
+            return super()._handle_completion(
+                params,
+                available_functions=available_functions,
+                from_task=from_task,
+                from_agent=from_agent,
+                response_model=response_model,
+            )
 
-class DashScopeOpenAICompletion(OpenAICompletion):
-    """OpenAICompletion override that uses standard streaming for DashScope."""
+    async def _ahandle_completion(
+        self,
+        params: dict[str, Any],
+        available_functions: dict[str, Any] | None = None,
+        from_task: Any | None = None,
+        from_agent: Any | None = None,
+        response_model: type[BaseModel] | None = None,
+    ) -> str | Any:
+        with self._track_usage(params, False, from_task, from_agent):
+            return await super()._ahandle_completion(
+                params,
+                available_functions=available_functions,
+                from_task=from_task,
+                from_agent=from_agent,
+                response_model=response_model,
+            )
+
+    def _emit_stream_chunk_event(self, chunk: str, *args: Any, **kwargs: Any) -> None:
+        call = current_llm_call()
+        if self.observe_emitted_chunks and call is not None:
+            call.observe(chunk)
+        super()._emit_stream_chunk_event(chunk, *args, **kwargs)
+
+    def _handle_streaming_completion(
+        self,
+        params: dict[str, Any],
+        available_functions: dict[str, Any] | None = None,
+        from_task: Any | None = None,
+        from_agent: Any | None = None,
+        response_model: type[BaseModel] | None = None,
+    ) -> str:
+        with self._track_usage(params, True, from_task, from_agent) as call:
+            call.attempts += 1
+            return super()._handle_streaming_completion(
+                params,
+                available_functions=available_functions,
+                from_task=from_task,
+                from_agent=from_agent,
+                response_model=response_model,
+            )
+
+    async def _ahandle_streaming_completion(
+        self,
+        params: dict[str, Any],
+        available_functions: dict[str, Any] | None = None,
+        from_task: Any | None = None,
+        from_agent: Any | None = None,
+        response_model: type[BaseModel] | None = None,
+    ) -> str:
+        with self._track_usage(params, True, from_task, from_agent) as call:
+            call.attempts += 1
+            return await super()._ahandle_streaming_completion(
+                params,
+                available_functions=available_functions,
+                from_task=from_task,
+                from_agent=from_agent,
+                response_model=response_model,
+            )
+
+
+class DashScopeOpenAICompletion(MeteredOpenAICompletion):
+    """OpenAICompletion override that uses standard streaming for DashScope.
+
+    Streams are read directly (no usage chunk, validated structured output), so
+    chunks are observed for metering as they arrive rather than when emitted.
+    """
+
+    observe_emitted_chunks: ClassVar[bool] = False
 
     def _is_dashscope(self) -> bool:
         base = (
@@ -40,153 +173,393 @@ class DashScopeOpenAICompletion(OpenAICompletion):
             params.pop("response_format", None)
         return params
 
-    def _handle_streaming_completion(
+    @staticmethod
+    def _structured_output_model(
+        params: dict[str, Any],
+        from_task: Any | None,
+        response_model: type[BaseModel] | None,
+    ) -> type[BaseModel] | None:
+        """Model used to validate the stream: the explicit response_model or the task's output_pydantic."""
+        if params.get("tools"):
+            return None
+        model = response_model or getattr(from_task, "output_pydantic", None)
+        if isinstance(model, type) and issubclass(model, BaseModel):
+            return model
+        return None
+
+    def _consume_stream_chunk(
+        self,
+        completion_chunk: ChatCompletionChunk,
+        chunks: list[str],
+        tool_calls: dict[int, dict[str, Any]],
+        validator: StructuredStreamValidator | None,
+        held: list[str],
+        from_task: Any | None = None,
+        from_agent: Any | None = None,
+    ) -> dict[str, Any] | None:
+        """Apply one streamed chunk; returns usage data when the chunk carries it.
+
+        While the validator has not committed, content is held back in ``held``
+        instead of being emitted, so an attempt aborted with StructuredStreamError
+        never reaches listeners. Once it commits, the held text is emitted in one
+        chunk and later content is emitted as it arrives. Shared by the sync and
+        async streaming paths.
+        """
+        if hasattr(completion_chunk, "usage") and completion_chunk.usage:
+            return self._extract_openai_token_usage(completion_chunk)
+
+        if not completion_chunk.choices:
+            return None
+
+        choice = completion_chunk.choices[0]
+        chunk_delta: ChoiceDelta = choice.delta
+
+        call = current_llm_call()
+        if chunk_delta.content:
+            if call is not None:
+                call.observe(chunk_delta.content)
+            chunks.append(chunk_delta.content)
+            if validator is not None and not validator.committed:
+                validator.feed(chunk_delta.content)
+                held.append(chunk_delta.content)
+                if validator.committed:
+                    self._flush_held(held, from_task=from_task, from_agent=from_agent)
+            else:
+                self._emit_stream_chunk_event(
+                    chunk=chunk_delta.content,
+                    from_task=from_task,
+                    from_agent=from_agent,
+                )
+
+        if chunk_delta.tool_calls:
+            for tool_call in chunk_delta.tool_calls:
+                tool_index = tool_call.index if tool_call.index is not None else 0
+                if tool_index not in tool_calls:
+                    tool_calls[tool_index] = {
+                        "id": tool_call.id,
+                        "name": "",
+                        "arguments": "",
+                        "index": tool_index,
+                    }
+                elif tool_call.id and not tool_calls[tool_index]["id"]:
+                    tool_calls[tool_index]["id"] = tool_call.id
+
+                if tool_call.function and tool_call.function.name:
+                    tool_calls[tool_index]["name"] = tool_call.function.name
+                if tool_call.function and tool_call.function.arguments:
+                    tool_calls[tool_index]["arguments"] += (
+                        tool_call.function.arguments
+                    )
+                    if call is not None:
+                        call.observe(tool_call.function.arguments)
+
+                self._emit_stream_chunk_event(
+                    chunk=tool_call.function.arguments
+                    if tool_call.function and tool_call.function.arguments
+                    else "",
+                    from_task=from_task,
+                    from_agent=from_agent,
+                    tool_call={
+                        "id": tool_calls[tool_index]["id"],
+                        "function": {
+                            "name": tool_calls[tool_index]["name"],
+                            "arguments": tool_calls[tool_index]["arguments"],
+                        },
+                        "type": "function",
+                        "index": tool_calls[tool_index]["index"],
+                    },
+                    call_type=LLMCallType.TOOL_CALL,
+                )
+        return None
+
+    def _flush_held(
+        self,
+        held: list[str],
+        from_task: Any | None = None,
+        from_agent: Any | None = None,
+    ) -> None:
+        """Emit content held back while the validator had not committed."""
+        if held:
+            self._emit_stream_chunk_event(
+                chunk="".join(held), from_task=from_task, from_agent=from_agent
+            )
+            held.clear()
+
+    def _stream_attempt(
         self,
         params: dict[str, Any],
+        validator: StructuredStreamValidator | None,
+        from_task: Any | None = None,
+        from_agent: Any | None = None,
+    ) -> tuple[list[str], dict[int, dict[str, Any]], dict[str, Any]]:
+        """Run one streaming request, returning (content chunks, tool calls, usage).
+
+        On a structural error the stream is closed right away and
+        StructuredStreamError propagates; nothing of the attempt has been emitted.
+        Any other exception also closes the stream before propagating.
+        """
+        chunks: list[str] = []
+        held: list[str] = []
+        tool_calls: dict[int, dict[str, Any]] = {}
+        usage_data: dict[str, Any] = {"total_tokens": 0}
+
+        completion_stream: Stream[ChatCompletionChunk] = (
+            self.client.chat.completions.create(**params)
+        )
+
+        try:
+            for completion_chunk in completion_stream:
+                usage = self._consume_stream_chunk(
+                    completion_chunk, chunks, tool_calls, validator, held,
+                    from_task=from_task, from_agent=from_agent,
+                )
+                if usage is not None:
+                    usage_data = usage
+        except BaseException:
+            # Stop paying for a generation that can no longer validate, and release
+            # the connection (and any scheduler slot) on any other abort too.
+            close = getattr(completion_stream, "close", None)
+            if close is not None:
+                close()
+            raise
+
+        # The stream ended before the validator committed (e.g. a short output).
+        self._flush_held(held, from_task=from_task, from_agent=from_agent)
+        return chunks, tool_calls, usage_data
+
+    async def _astream_attempt(
+        self,
+        params: dict[str, Any],
+        validator: StructuredStreamValidator | None,
+        from_task: Any | None = None,
+        from_agent: Any | None = None,
+    ) -> tuple[list[str], dict[int, dict[str, Any]], dict[str, Any]]:
+        """Async counterpart of _stream_attempt on the AsyncOpenAI client."""
+        chunks: list[str] = []
+        held: list[str] = []
+        tool_calls: dict[int, dict[str, Any]] = {}
+        usage_data: dict[str, Any] = {"total_tokens": 0}
+
+        completion_stream: AsyncIterator[ChatCompletionChunk] = (
+            await self.async_client.chat.completions.create(**params)
+        )
+
+        try:
+            async for completion_chunk in completion_stream:
+                usage = self._consume_stream_chunk(
+                    completion_chunk, chunks, tool_calls, validator, held,
+                    from_task=from_task, from_agent=from_agent,
+                )
+                if usage is not None:
+                    usage_data = usage
+        except BaseException:
+            # Release the connection (and any scheduler slot) when aborted or cancelled.
+            close = getattr(completion_stream, "aclose", None) or getattr(
+                completion_stream, "close", None
+            )
+            if close is not None:
+                closing = close()
+                if inspect.isawaitable(closing):
+                    await closing
+            raise
+
+        self._flush_held(held, from_task=from_task, from_agent=from_agent)
+        return chunks, tool_calls, usage_data
+
+    def _stream_attempts(
+        self,
+        params: dict[str, Any],
+        from_task: Any | None,
+        response_model: type[BaseModel] | None,
+    ) -> Iterator[StructuredStreamValidator | None]:
+        """Yield the validator for each attempt; the final attempt runs unchecked."""
+        output_model = self._structured_output_model(params, from_task, response_model)
+        attempts = STRUCTURED_STREAM_RETRIES + 1 if output_model else 1
+        for attempt in range(1, attempts + 1):
+            yield (
+                StructuredStreamValidator(output_model)
+                if output_model and attempt < attempts
+                else None
+            )
+
+    @staticmethod
+    def _reject_stream_attempt(validator: StructuredStreamValidator, error: Exception) -> None:
+        # The attempt may have been a cache replay; drop it so it is not served again.
+        reject_cached_response()
+        logging.warning(
+            f"Structured stream aborted after {validator.consumed} chars, retrying: {error}"
+        )
+
+    def _finish_streaming_completion(
+        self,
+        params: dict[str, Any],
+        chunks: list[str],
+        tool_calls: dict[int, dict[str, Any]],
+        usage_data: dict[str, Any],
         available_functions: dict[str, Any] | None = None,
         from_task: Any | None = None,
         from_agent: Any | None = None,
         response_model: type[BaseModel] | None = None,
     ) -> str:
-        """Handle streaming chat completion with standard stream API."""
-        try:
-            full_response = ""
-            tool_calls: dict[int, dict[str, Any]] = {}
+        """Turn a finished stream into the call result (tool calls, stop words, structured output)."""
+        full_response = "".join(chunks)
 
-            completion_stream: Stream[ChatCompletionChunk] = (
-                self.client.chat.completions.create(**params)
-            )
+        self._track_token_usage_internal(usage_data)
 
-            usage_data = {"total_tokens": 0}
+        if tool_calls and available_functions:
+            for call_data in tool_calls.values():
+                function_name = call_data["name"]
+                arguments = call_data["arguments"]
 
-            for completion_chunk in completion_stream:
-                if hasattr(completion_chunk, "usage") and completion_chunk.usage:
-                    usage_data = self._extract_openai_token_usage(completion_chunk)
+                if not function_name or not arguments:
                     continue
 
-                if not completion_chunk.choices:
+                if function_name not in available_functions:
+                    logging.warning(
+                        f"Function '{function_name}' not found in available functions"
+                    )
                     continue
 
-                choice = completion_chunk.choices[0]
-                chunk_delta: ChoiceDelta = choice.delta
+                try:
+                    function_args = json.loads(arguments)
+                except json.JSONDecodeError as e:
+                    logging.error(f"Failed to parse streamed tool arguments: {e}")
+                    continue
 
-                if chunk_delta.content:
-                    full_response += chunk_delta.content
-                    self._emit_stream_chunk_event(
-                        chunk=chunk_delta.content,
-                        from_task=from_task,
-                        from_agent=from_agent,
-                    )
+                result = self._handle_tool_execution(
+                    function_name=function_name,
+                    function_args=function_args,
+                    available_functions=available_functions,
+                    from_task=from_task,
+                    from_agent=from_agent,
+                )
 
-                if chunk_delta.tool_calls:
-                    for tool_call in chunk_delta.tool_calls:
-                        tool_index = tool_call.index if tool_call.index is not None else 0
-                        if tool_index not in tool_calls:
-                            tool_calls[tool_index] = {
-                                "id": tool_call.id,
-                                "name": "",
-                                "arguments": "",
-                                "index": tool_index,
-                            }
-                        elif tool_call.id and not tool_calls[tool_index]["id"]:
-                            tool_calls[tool_index]["id"] = tool_call.id
-
-                        if tool_call.function and tool_call.function.name:
-                            tool_calls[tool_index]["name"] = tool_call.function.name
-                        if tool_call.function and tool_call.function.arguments:
-                            tool_calls[tool_index]["arguments"] += (
-                                tool_call.function.arguments
-                            )
+                if result is not None:
+                    return result
 
-                        self._emit_stream_chunk_event(
-                            chunk=tool_call.function.arguments
-                            if tool_call.function and tool_call.function.arguments
-                            else "",
-                            from_task=from_task,
-                            from_agent=from_agent,
-                            tool_call={
-                                "id": tool_calls[tool_index]["id"],
-                                "function": {
-                                    "name": tool_calls[tool_index]["name"],
-                                    "arguments": tool_calls[tool_index]["arguments"],
-                                },
-                                "type": "function",
-                                "index": tool_calls[tool_index]["index"],
-                            },
-                            call_type=LLMCallType.TOOL_CALL,
-                        )
-
-            self._track_token_usage_internal(usage_data)
-
-            if tool_calls and available_functions:
-                for call_data in tool_calls.values():
-                    function_name = call_data["name"]
-                    arguments = call_data["arguments"]
-
-                    if not function_name or not arguments:
-                        continue
-
-                    if function_name not in available_functions:
-                        logging.warning(
-                            f"Function '{function_name}' not found in available functions"
-                        )
-                        continue
+        full_response = self._apply_stop_words(full_response)
 
-                    try:
-                        function_args = json.loads(arguments)
-                    except json.JSONDecodeError as e:
-                        logging.error(f"Failed to parse streamed tool arguments: {e}")
-                        continue
-
-                    result = self._handle_tool_execution(
-                        function_name=function_name,
-                        function_args=function_args,
-                        available_functions=available_functions,
-                        from_task=from_task,
-                        from_agent=from_agent,
-                    )
+        if response_model:
+            try:
+                parsed_object = response_model.model_validate_json(full_response)
+                structured_json = parsed_object.model_dump_json()
+                self._emit_call_completed_event(
+                    response=structured_json,
+                    call_type=LLMCallType.LLM_CALL,
+                    from_task=from_task,
+                    from_agent=from_agent,
+                    messages=params["messages"],
+                )
+                return structured_json
+            except Exception as e:
+                reject_cached_response()
+                logging.error(
+                    f"Failed to parse structured output from stream: {e}"
+                )
 
-                    if result is not None:
-                        return result
+        self._emit_call_completed_event(
+            response=full_response,
+            call_type=LLMCallType.LLM_CALL,
+            from_task=from_task,
+            from_agent=from_agent,
+            messages=params["messages"],
+        )
 
-            full_response = self._apply_stop_words(full_response)
+        return self._invoke_after_llm_call_hooks(
+            params["messages"], full_response, from_agent
+        )
 
-            if response_model:
-                try:
-                    parsed_object = response_model.model_validate_json(full_response)
-                    structured_json = parsed_object.model_dump_json()
-                    self._emit_call_completed_event(
-                        response=structured_json,
-                        call_type=LLMCallType.LLM_CALL,
-                        from_task=from_task,
-                        from_agent=from_agent,
-                        messages=params["messages"],
-                    )
-                    return structured_json
-                except Exception as e:
-                    logging.error(
-                        f"Failed to parse structured output from stream: {e}"
-                    )
+    def _raise_streaming_error(
+        self, e: Exception, from_task: Any | None, from_agent: Any | None
+    ) -> None:
+        if is_context_length_exceeded(e):
+            logging.error(f"Context window exceeded: {e}")
+            raise LLMContextLengthExceededError(str(e)) from e
 
-            self._emit_call_completed_event(
-                response=full_response,
-                call_type=LLMCallType.LLM_CALL,
-                from_task=from_task,
-                from_agent=from_agent,
-                messages=params["messages"],
-            )
+        error_msg = f"OpenAI API call failed: {e!s}"
+        logging.error(error_msg)
+        self._emit_call_failed_event(
+            error=error_msg, from_task=from_task, from_agent=from_agent
+        )
+        raise e
 
-            return self._invoke_after_llm_call_hooks(
-                params["messages"], full_response, from_agent
-            )
+    def _handle_streaming_completion(
+        self,
+        params: dict[str, Any],
+        available_functions: dict[str, Any] | None = None,
+        from_task: Any | None = None,
+        from_agent: Any | None = None,
+        response_model: type[BaseModel] | None = None,
+    ) -> str:
+        """Handle streaming chat completion with standard stream API.
+
+        When the call produces a structured task output, the stream is validated
+        incrementally and retried immediately (up to STRUCTURED_STREAM_RETRIES times)
+        if its structure breaks before the validator commits. Content is held back
+        until then, so listeners only ever see the attempt that is kept. The final
+        attempt runs unchecked.
+        """
+        try:
+            with self._track_usage(params, True, from_task, from_agent) as call:
+                for attempt, validator in enumerate(
+                    self._stream_attempts(params, from_task, response_model)
+                ):
+                    call.attempts += 1
+                    try:
+                        # Retries must reach the provider, not replay a cached response.
+                        with bypass_response_cache(attempt > 0):
+                            chunks, tool_calls, usage_data = self._stream_attempt(
+                                params, validator, from_task=from_task, from_agent=from_agent
+                            )
+                        break
+                    except StructuredStreamError as e:
+                        self._reject_stream_attempt(validator, e)
+
+                return self._finish_streaming_completion(
+                    params, chunks, tool_calls, usage_data,
+                    available_functions=available_functions,
+                    from_task=from_task,
+                    from_agent=from_agent,
+                    response_model=response_model,
+                )
         except Exception as e:
-            if is_context_length_exceeded(e):
-                logging.error(f"Context window exceeded: {e}")
-                raise LLMContextLengthExceededError(str(e)) from e
-
-            error_msg = f"OpenAI API call failed: {e!s}"
-            logging.error(error_msg)
-            self._emit_call_failed_event(
-                error=error_msg, from_task=from_task, from_agent=from_agent
-            )
-            raise
+            self._raise_streaming_error(e, from_task, from_agent)
+
+    async def _ahandle_streaming_completion(
+        self,
+        params: dict[str, Any],
+        available_functions: dict[str, Any] | None = None,
+        from_task: Any | None = None,
+        from_agent: Any | None = None,
+        response_model: type[BaseModel] | None = None,
+    ) -> str:
+        """Handle streaming chat completion on the AsyncOpenAI client.
+
+        Same chunk events, tool-call aggregation and structured-output retries as
+        the sync path, but the stream is read on the event loop instead of
+        blocking a worker thread for its whole duration.
+        """
+        try:
+            with self._track_usage(params, True, from_task, from_agent) as call:
+                for attempt, validator in enumerate(
+                    self._stream_attempts(params, from_task, response_model)
+                ):
+                    call.attempts += 1
+                    try:
+                        with bypass_response_cache(attempt > 0):
+                            chunks, tool_calls, usage_data = await self._astream_attempt(
+                                params, validator, from_task=from_task, from_agent=from_agent
+                            )
+                        break
+                    except StructuredStreamError as e:
+                        self._reject_stream_attempt(validator, e)
+
+                return self._finish_streaming_completion(
+                    params, chunks, tool_calls, usage_data,
+                    available_functions=available_functions,
+                    from_task=from_task,
+                    from_agent=from_agent,
+                    response_model=response_model,
+                )
+        except Exception as e:
+            self._raise_streaming_error(e, from_task, from_agent)
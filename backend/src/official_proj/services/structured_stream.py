@@ -0,0 +1,177 @@
+"""流式结构化输出的增量校验。
+
+任务要求模型只输出一个 JSON 对象（见各任务的 expected_output）。模型偏离格式时，
+原先要等几千 token 全部生成完才在解析阶段发现。这里在 chunk 到达时就检查结构：
+
+- JSON 对象之前出现了多余文字（允许 crewai 的 ``Thought: … Final Answer:`` 前缀与 ```json 代码块）；
+- 最外层不是对象；
+- 出现输出模型中不存在的顶层字段。
+
+校验器确认结构可信之前（必填的顶层字段名都已出现、对象已结束，或已接收
+STRUCTURED_HOLD_MAX_CHARS 个字符），调用方暂存 chunk 不向外发送；期间发现问题即抛出
+StructuredStreamError，由调用方中断本次流式请求并立即重试，被丢弃的输出不会到达客户端。
+确认（committed）之后不再中断：已发出的文字无法撤回，剩余问题交给 crewai 的解析与转换兜底。
+"""
+
+import os
+import re
+
+from crewai.agents.constants import FINAL_ANSWER_ACTION
+from pydantic import BaseModel
+
+# JSON 开始之前允许的最大前缀长度（思考过程等）。
+STRUCTURED_PREAMBLE_MAX_CHARS = int(os.getenv("STRUCTURED_PREAMBLE_MAX_CHARS", "400"))
+# 结构损坏时立即重试的次数；最后一次不再中断，交给 crewai 的解析与转换兜底。
+STRUCTURED_STREAM_RETRIES = int(os.getenv("STRUCTURED_STREAM_RETRIES", "2"))
+# 确认前最多暂存的字符数：超过后即确认并开始发送，限制首字延迟。
+STRUCTURED_HOLD_MAX_CHARS = int(os.getenv("STRUCTURED_HOLD_MAX_CHARS", "1000"))
+
+_THOUGHT = "Thought:"
+# JSON 之前允许的空白与代码块开头。
+_LEADING = re.compile(r"\s*(?:```[A-Za-z]*[ \t]*\r?\n?)?\s*")
+# 思考过程后直接换行开始的 JSON（缺少 Final Answer 标记）。
+_LINE_JSON = re.compile(r"\n\s*(?:```[A-Za-z]*\s*)?\{")
+
+
+class StructuredStreamError(ValueError):
+    """流式输出的结构已不可能通过校验。"""
+
+
+class StructuredStreamValidator:
+    """逐 chunk 检查流式 JSON 输出是否符合输出模型的顶层结构。"""
+
+    def __init__(
+        self,
+        model: type[BaseModel],
+        preamble_limit: int = STRUCTURED_PREAMBLE_MAX_CHARS,
+        hold_limit: int = STRUCTURED_HOLD_MAX_CHARS
+    ):
+        self.model = model
+        self.preamble_limit = preamble_limit
+        self.hold_limit = hold_limit
+        self.fields: set[str] = set()
+        self.required: set[str] = set()
+        for name, field in model.model_fields.items():
+            key = field.alias or name
+            self.fields.update({name, key})
+            if field.is_required():
+                self.required.add(key)
+        self.seen: set[str] = set()
+        self.consumed = 0
+        # 确认后不再检查，也不再抛出错误。
+        self.committed = False
+        self._head = ""
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._expect_key = False
+        self._key_parts: list[str] | None = None
+
+    def feed(self, text: str) -> None:
+        """检查一个 chunk；确认前结构已损坏时抛出 StructuredStreamError。"""
+        self.consumed += len(text)
+        if self.committed:
+            return
+        if not self._started:
+            self._head += text
+            start = self._json_start()
+            if start is not None:
+                self._started = True
+                text, self._head = self._head[start:], ""
+                self._scan(text)
+        else:
+            self._scan(text)
+        if not self.committed and self.consumed > self.hold_limit:
+            self.committed = True
+
+    def _json_start(self) -> int | None:
+        """JSON 对象在已接收前缀中的起始位置；前缀还不完整时返回 None。"""
+        head = self._head
+        marker = head.rfind(FINAL_ANSWER_ACTION)
+        offset = marker + len(FINAL_ANSWER_ACTION) if marker != -1 else 0
+        rest = head[offset:]
+        pos = _LEADING.match(rest).end()
+
+        if pos < len(rest):
+            char = rest[pos]
+            if char == "{":
+                return offset + pos
+            if char == "[":
+                raise StructuredStreamError("最外层必须是 JSON 对象，模型输出了数组")
+            if marker == -1:
+                stripped = head.lstrip()
+                if stripped.startswith(_THOUGHT):
+                    # 思考过程中可以出现任意文字，等待 Final Answer 或 JSON 开始。
+                    line_start = _LINE_JSON.search(head)
+                    if line_start is not None:
+                        return line_start.end() - 1
+                    return self._wait_for_more(head)
+                if _is_prefix(stripped, (_THOUGHT, FINAL_ANSWER_ACTION)):
+                    return None
+            if _is_prefix(rest[pos:], ("```",)):
+                return None
+            raise StructuredStreamError(
+                f"JSON 对象之前出现多余文字：{rest[pos:pos + 20]!r}"
+            )
+        return self._wait_for_more(head)
+
+    def _wait_for_more(self, head: str) -> None:
+        if len(head) > self.preamble_limit:
+            raise StructuredStreamError(
+                f"输出前 {len(head)} 个字符内没有出现 JSON 对象"
+            )
+        return None
+
+    def _scan(self, text: str) -> None:
+        # 只跟踪最外层：字符串、嵌套深度，以及处于“键”位置的字符串。
+        for char in text:
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                    continue
+                elif char == '"':
+                    self._in_string = False
+                    if self._key_parts is not None:
+                        self._check_key("".join(self._key_parts))
+                        self._key_parts = None
+                        if self.committed:
+                            return
+                    continue
+                if self._key_parts is not None:
+                    self._key_parts.append(char)
+                continue
+
+            if char == '"':
+                self._in_string = True
+                if self._depth == 1 and self._expect_key:
+                    self._key_parts = []
+                    self._expect_key = False
+            elif char in "{[":
+                self._depth += 1
+                if self._depth == 1:
+                    self._expect_key = True
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    # 缺少必填字段时整段已生成完毕，重试不再省 token，交给解析兜底。
+                    self.committed = True
+                    return
+            elif char == "," and self._depth == 1:
+                self._expect_key = True
+
+    def _check_key(self, key: str) -> None:
+        if key not in self.fields:
+            raise StructuredStreamError(
+                f"{self.model.__name__} 中没有顶层字段 {key!r}"
+            )
+        self.seen.add(key)
+        if self.required <= self.seen:
+            self.committed = True
+
+
+def _is_prefix(text: str, candidates: tuple[str, ...]) -> bool:
+    # text 可能是某个允许前缀的开头（被 chunk 截断）。
+    return any(text.startswith(c) or c.startswith(text) for c in candidates)
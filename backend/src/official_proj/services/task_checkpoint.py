@@ -0,0 +1,124 @@
+"""任务级断点：每个 crewai 任务完成后立即把输出写入 agent_task_outputs。
+
+同一章节的重试（落库失败、记忆更新失败、后台任务中断重跑）使用相同的 run id，
+恢复时读出已完成任务的输出，只重新执行失败及之后的任务。
+run id 由小说、章节号与上下文输入的哈希组成，输入变化时不会误用旧断点。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Callable
+
+from crewai.tasks.output_format import OutputFormat
+from crewai.tasks.task_output import TaskOutput
+from pydantic import BaseModel
+
+from official_proj.db.mongo_db.dao.agent_task_output_dao import AgentTaskOutputDAO
+
+logger = logging.getLogger(__name__)
+
+# 断点有效期，过期的不再用于恢复。
+CHECKPOINT_TTL_SECONDS = int(os.getenv("CHECKPOINT_TTL_SECONDS", str(24 * 3600)))
+
+# 只用于统计、不影响任务输出的输入字段。
+_RUN_ID_EXCLUDED_INPUTS = frozenset({"context_stats"})
+
+
+def chapter_run_id(inputs: dict) -> str:
+    """续写一章的 run id：小说 + 章节号 + 其余输入的哈希。"""
+    keyed = {
+        key: value for key, value in inputs.items()
+        if key not in _RUN_ID_EXCLUDED_INPUTS
+    }
+    digest = hashlib.sha1(
+        json.dumps(keyed, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+    ).hexdigest()[:16]
+    return f"{inputs['novel_id']}:chapter:{inputs['chapter_number']}:{digest}"
+
+
+class TaskCheckpointStore:
+    """按 run id 保存与恢复任务输出。"""
+
+    def __init__(self, mongo):
+        self.dao = AgentTaskOutputDAO(mongo)
+
+    def callback(self, run_id: str, novel_id: str) -> Callable[[TaskOutput], None]:
+        """返回 crew 的 task_callback：任务完成即写断点（失败只记录日志）。"""
+        def save(output: TaskOutput) -> None:
+            if not output.name:
+                return
+            try:
+                self.save(run_id, novel_id, output)
+            except Exception:
+                logger.exception("checkpoint %s/%s failed", run_id, output.name)
+        return save
+
+    def attach(self, crews, run_id: str, novel_id: str) -> None:
+        """给一个或多个 crew 挂上断点回调。"""
+        for crew in crews:
+            crew.task_callback = self.callback(run_id, novel_id)
+
+    def save(self, run_id: str, novel_id: str, output: TaskOutput) -> None:
+        json_output = (
+            output.pydantic.model_dump(mode="json")
+            if output.pydantic is not None
+            else output.json_dict
+        )
+        self.dao.save_checkpoint(
+            run_id=run_id,
+            novel_id=novel_id,
+            task_name=output.name,
+            output_type=output.output_format.value,
+            raw_output=output.raw,
+            json_output=json_output
+        )
+
+    def load(
+        self,
+        run_id: str,
+        output_models: dict[str, type[BaseModel] | None]
+    ) -> dict[str, TaskOutput]:
+        """读取未过期的断点并还原为 TaskOutput；无法还原的条目视为未完成。"""
+        since = datetime.utcnow() - timedelta(seconds=CHECKPOINT_TTL_SECONDS)
+        restored: dict[str, TaskOutput] = {}
+        for doc in self.dao.list_by_run(run_id, since=since):
+            name = doc["task_name"]
+            if name not in output_models:
+                continue
+            try:
+                restored[name] = _restore(doc, output_models[name])
+            except Exception:
+                logger.warning("checkpoint %s/%s unreadable, rerunning", run_id, name)
+        if restored:
+            logger.info("resuming %s with %s", run_id, sorted(restored))
+        return restored
+
+    def clear(self, run_id: str) -> None:
+        """整章落库成功后删除断点。"""
+        try:
+            self.dao.delete_by_run(run_id)
+        except Exception:
+            logger.exception("clear checkpoints %s failed", run_id)
+
+
+def _restore(doc: dict, model: type[BaseModel] | None) -> TaskOutput:
+    json_output = doc.get("json_output")
+    pydantic = (
+        model.model_validate(json_output)
+        if model is not None and json_output is not None
+        else None
+    )
+    return TaskOutput(
+        name=doc["task_name"],
+        description="",
+        agent="",
+        raw=doc.get("raw_output") or "",
+        pydantic=pydantic,
+        json_dict=json_output if pydantic is None and isinstance(json_output, dict) else None,
+        output_format=OutputFormat(doc.get("output_type") or OutputFormat.RAW.value),
+    )
@@ -0,0 +1,164 @@
+"""按依赖图调度 crew：互不依赖的节点并发执行。
+
+每个节点是一个 crew（单任务，或必须按顺序执行的任务链，例如写作 → 评审 → 条件重写），
+通过 depends_on 声明依赖；依赖的输出由节点内任务的 ``Task.context`` 显式引用。
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Iterator
+
+logger = logging.getLogger(__name__)
+
+TASK_GRAPH_MAX_WORKERS = int(os.getenv("TASK_GRAPH_MAX_WORKERS", "16"))
+
+_executor = ThreadPoolExecutor(
+    max_workers=TASK_GRAPH_MAX_WORKERS,
+    thread_name_prefix="task-graph"
+)
+
+# 流式节点的执行函数：(crew, inputs) → 事件迭代器；任务输出结束后从 crew.tasks 读取。
+StreamRunner = Callable[[object, dict], Iterator[dict]]
+
+
+@dataclass
+class GraphNode:
+    """依赖图中的一个节点。"""
+
+    name: str
+    crew: object
+    depends_on: tuple[str, ...] = ()
+    # 是否以流式方式执行（正文增量通过事件透传）。
+    stream: bool = False
+
+
+def _validate(nodes: list[GraphNode]) -> None:
+    names = {node.name for node in nodes}
+    for node in nodes:
+        missing = set(node.depends_on) - names
+        if missing:
+            raise ValueError(f"node {node.name} depends on unknown {sorted(missing)}")
+    # 按依赖逐层剥离，剩余节点即存在环。
+    remaining = {node.name: set(node.depends_on) for node in nodes}
+    while remaining:
+        ready = [name for name, deps in remaining.items() if not deps]
+        if not ready:
+            raise ValueError(f"dependency cycle among {sorted(remaining)}")
+        for name in ready:
+            del remaining[name]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+
+
+def _crew_task_outputs(crew) -> dict:
+    return {
+        task.name: task.output
+        for task in crew.tasks
+        if task.name and task.output is not None
+    }
+
+
+def _timing_events(crew) -> Iterator[dict]:
+    for task in crew.tasks:
+        seconds = task.execution_duration
+        if seconds is not None:
+            yield {"type": "task_timing", "task": task.name, "seconds": round(seconds, 3)}
+
+
+def iter_task_graph(
+    nodes: list[GraphNode],
+    inputs: dict,
+    task_outputs: dict,
+    stream_runner: StreamRunner | None = None
+) -> Iterator[dict]:
+    """执行依赖图，产出 progress / task_timing 以及流式节点透传的事件。
+
+    所有节点的任务输出写入 task_outputs。任一节点失败时不再启动新节点，
+    等已启动的节点结束后抛出该异常。
+    """
+    _validate(nodes)
+    pending = {node.name: node for node in nodes}
+    done: set[str] = set()
+    running: set[str] = set()
+    messages: queue.Queue = queue.Queue()
+    stopped = threading.Event()
+    error: BaseException | None = None
+    graph_started = time.perf_counter()
+
+    def run(node: GraphNode) -> None:
+        started = time.perf_counter()
+        try:
+            if node.stream and stream_runner is not None:
+                for event in stream_runner(node.crew, inputs):
+                    if not stopped.is_set():
+                        messages.put(("event", node.name, event))
+            else:
+                node.crew.kickoff(inputs=inputs)
+            outputs = _crew_task_outputs(node.crew)
+        except BaseException as e:
+            messages.put(("error", node.name, e))
+            return
+        messages.put(("done", node.name, (outputs, time.perf_counter() - started)))
+
+    def start_ready() -> list[str]:
+        ready = [
+            name for name, node in pending.items()
+            if set(node.depends_on) <= done
+        ]
+        for name in ready:
+            node = pending.pop(name)
+            running.add(name)
+            _executor.submit(run, node)
+        return ready
+
+    try:
+        for name in start_ready():
+            yield {"type": "progress", "task": name}
+
+        while running:
+            kind, name, payload = messages.get()
+            if kind == "event":
+                yield payload
+                continue
+
+            running.discard(name)
+            if kind == "error":
+                logger.error("task graph node %s failed: %s", name, payload)
+                if error is None:
+                    error = payload
+                continue
+
+            outputs, seconds = payload
+            task_outputs.update(outputs)
+            done.add(name)
+            logger.info("task graph node %s finished in %.2fs", name, seconds)
+            crew = next(node for node in nodes if node.name == name).crew
+            yield from _timing_events(crew)
+
+            if error is None:
+                for ready in start_ready():
+                    yield {"type": "progress", "task": ready}
+    finally:
+        stopped.set()
+
+    if error is not None:
+        raise error
+    logger.info(
+        "task graph finished %d nodes in %.2fs",
+        len(nodes), time.perf_counter() - graph_started
+    )
+
+
+def run_task_graph(nodes: list[GraphNode], inputs: dict) -> dict:
+    """非流式调用：执行依赖图并返回全部任务输出。"""
+    task_outputs: dict = {}
+    for _ in iter_task_graph(nodes, inputs, task_outputs):
+        pass
+    return task_outputs
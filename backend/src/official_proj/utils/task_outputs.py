@@ -43,7 +43,14 @@ def extract_writing(task_outputs: dict) -> WritingExtraction:
     )
     # 记录重写原因，便于在 API 响应中展示。
     rewrite_info = (
-        {"reasons": rewrite_output.fail_reasons, "applied": True}
+        {
+            "reasons": rewrite_output.fail_reasons,
+            "applied": True,
+            "spans": [
+                {"start": span.start, "end": span.end, "issue": span.issue}
+                for span in getattr(rewrite_output, "spans", None) or []
+            ]
+        }
         if rewrite_output
         else None
     )
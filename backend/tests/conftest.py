@@ -0,0 +1,19 @@
+"""测试共用的 fixture。"""
+
+import mongomock
+import pytest
+
+
+class _Mongo:
+    """代替 MongoDB 连接对象：collection(name) 返回 mongomock 集合。"""
+
+    def __init__(self):
+        self.db = mongomock.MongoClient().db
+
+    def collection(self, name: str):
+        return self.db[name]
+
+
+@pytest.fixture
+def mongo():
+    return _Mongo()
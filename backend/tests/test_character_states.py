@@ -0,0 +1,43 @@
+"""build_character_states：批量解析角色名，自动建档按规范化名去重。"""
+
+import pytest
+
+from official_proj.services import character_state_persist_service as service
+
+
+@pytest.fixture
+def mongo(mongo):
+    mongo.collection("characters").insert_many([
+        {"_id": "c1", "novel_id": "n1", "name": "沈知微"},
+        {"_id": "c2", "novel_id": "n1", "name": "林照"},
+    ])
+    return mongo
+
+
+def _states(*names):
+    return [{"character_name": name, "emotion": "平静"} for name in names]
+
+
+def test_exact_and_fuzzy_names_resolve(mongo):
+    batch = service.build_character_states(
+        mongo, "n1", "ch1", _states("林照", "林照（主角）", "知微")
+    )
+    assert [state["character_id"] for state in batch.states] == ["c2", "c2", "c1"]
+    assert batch.characters == [] and batch.skipped == []
+
+
+def test_unknown_names_are_skipped_by_default(mongo, monkeypatch):
+    monkeypatch.setattr(service, "CHARACTER_AUTO_CREATE", False)
+    batch = service.build_character_states(mongo, "n1", "ch1", _states("阿福", "林照"))
+    assert batch.skipped == ["阿福"]
+    assert [state["character_name"] for state in batch.states] == ["林照"]
+
+
+def test_auto_created_characters_are_keyed_by_normalized_name(mongo, monkeypatch):
+    monkeypatch.setattr(service, "CHARACTER_AUTO_CREATE", True)
+    batch = service.build_character_states(
+        mongo, "n1", "ch1", _states("阿福", "阿福（仆人）", "阿 福")
+    )
+    assert [character["name"] for character in batch.characters] == ["阿福"]
+    character_id = batch.characters[0]["_id"]
+    assert [state["character_id"] for state in batch.states] == [character_id] * 3
@@ -0,0 +1,62 @@
+"""NovelExportCache：按版本比对 ETag 不渲染，已打开的导出文件不受并发失效影响。"""
+
+import os
+import time
+
+import pytest
+
+from official_proj.services import export_cache
+from official_proj.services.export_cache import NovelExportCache
+
+
+@pytest.fixture
+def cache(mongo, tmp_path):
+    mongo.collection("chapters").insert_many([
+        {"novel_id": "n1", "chapter_number": i, "title": f"第{i}章", "content": "正文" * 2000}
+        for i in (1, 2)
+    ])
+    return NovelExportCache(mongo, cache_dir=tmp_path)
+
+
+def test_describe_does_not_render(cache, tmp_path):
+    artifact = cache.describe("n1", "txt")
+    assert artifact.etag == cache.describe("n1", "txt").etag
+    assert list(tmp_path.iterdir()) == []
+
+    cache.invalidate("n1")
+    assert cache.describe("n1", "txt").etag != artifact.etag
+
+
+def test_open_file_survives_invalidate(cache):
+    artifact = cache.describe("n1", "txt")
+    with cache.open(artifact, "主题") as fp:
+        expected = fp.read()
+    assert "第2章" in expected.decode("utf-8")
+
+    fp = cache.open(artifact, "主题")
+    cache.invalidate("n1")
+    assert not artifact.path.exists()
+    with fp:
+        assert fp.read() == expected
+
+
+def test_first_render_returns_open_file(cache):
+    artifact = cache.describe("n1", "md")
+    fp = cache.open(artifact, "主题")
+    artifact.path.unlink()
+    with fp:
+        assert fp.read().startswith("# 主题".encode("utf-8"))
+
+
+def test_orphaned_parts_are_removed_by_age(cache, tmp_path, monkeypatch):
+    monkeypatch.setattr(export_cache, "EXPORT_PART_MAX_AGE_SECONDS", 60)
+    old = tmp_path / "tmpold.part"
+    fresh = tmp_path / "tmpfresh.part"
+    old.write_bytes(b"x")
+    fresh.write_bytes(b"x")
+    past = time.time() - 120
+    os.utime(old, (past, past))
+
+    cache.invalidate("n1")
+    assert not old.exists()
+    assert fresh.exists()
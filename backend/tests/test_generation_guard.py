@@ -0,0 +1,45 @@
+"""事件流包装：中途出错时同样释放租约、归还章节号。"""
+
+import asyncio
+
+import pytest
+
+from official_proj.services.generation_guard import NovelGenerationGuard
+
+
+def _failing_events():
+    yield {"type": "progress"}
+    raise RuntimeError("boom")
+
+
+async def _afailing_events():
+    yield {"type": "progress"}
+    raise RuntimeError("boom")
+
+
+@pytest.fixture
+def guard(mongo):
+    guard = NovelGenerationGuard(mongo)
+    guard.acquire("n1", "g1", "next_chapter")
+    return guard
+
+
+def test_sync_error_releases_lease_and_chapter(guard):
+    number = guard.allocate_chapter_number("n1")
+    with pytest.raises(RuntimeError):
+        list(guard.guarded_events("n1", "g1", _failing_events, number))
+    assert guard.active_holder("n1") is None
+    assert guard.allocate_chapter_number("n1") == number
+
+
+def test_async_error_releases_lease_and_chapter(guard):
+    number = guard.allocate_chapter_number("n1")
+
+    async def main():
+        async for _ in guard.aguarded_events("n1", "g1", _afailing_events, number):
+            pass
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(main())
+    assert guard.active_holder("n1") is None
+    assert guard.allocate_chapter_number("n1") == number
@@ -0,0 +1,77 @@
+"""后台任务：事件单独存放、按 seq 分页读取，重试续写不冲突；同类任务不重复提交。"""
+
+from official_proj.db.mongo_db.dao.generation_job_dao import JOB_SUCCEEDED, GenerationJobDAO
+from official_proj.db.mongo_db.dao.generation_job_event_dao import GenerationJobEventDAO
+from official_proj.services.generation_job_service import GenerationJobService, _JobEventWriter
+
+
+def _setup(mongo):
+    job_dao = GenerationJobDAO(mongo)
+    event_dao = GenerationJobEventDAO(mongo)
+    job = job_dao.create("n1", 1, "next_chapter", {})
+    return job_dao, event_dao, job["_id"]
+
+
+def test_events_are_stored_outside_the_job_document(mongo):
+    job_dao, event_dao, job_id = _setup(mongo)
+    writer = _JobEventWriter(job_dao, event_dao, job_id, 0)
+    for i in range(1200):
+        writer.add({"type": "progress", "step": i})
+    writer.add({"type": "content_delta", "data": "甲"})
+    writer.add({"type": "content_delta", "data": "乙"})
+    writer.add({"type": "final", "data": {}})
+
+    job = job_dao.get(job_id)
+    assert "events" not in job
+    assert job["last_seq"] == 1202
+
+    events, cursor = [], 0
+    while page := event_dao.list_after(job_id, cursor):
+        events.extend(page)
+        cursor = page[-1]["seq"]
+    assert [event["seq"] for event in events] == list(range(1, 1203))
+    assert events[1200] == {"seq": 1201, "type": "content_delta", "data": "甲乙"}
+
+    # 其他任务的事件互不可见。
+    other = job_dao.create("n2", 1, "next_chapter", {})["_id"]
+    assert event_dao.list_after(other) == []
+
+
+def test_retry_renumbers_from_recorded_seq(mongo):
+    job_dao, event_dao, job_id = _setup(mongo)
+    event_dao.append(job_id, [{"seq": 1, "type": "start"}, {"seq": 2, "type": "stale"}])
+    job_dao.set_last_seq(job_id, 1)
+
+    # 上次写入事件后、更新 last_seq 前中断：重试丢弃多出的事件，从 last_seq 续写。
+    last_seq = job_dao.get(job_id)["last_seq"]
+    event_dao.delete_after(job_id, last_seq)
+    writer = _JobEventWriter(job_dao, event_dao, job_id, last_seq)
+    writer.add({"type": "retry", "attempt": 2})
+    writer.flush()
+    assert event_dao.list_after(job_id) == [
+        {"seq": 1, "type": "start"},
+        {"seq": 2, "type": "retry", "attempt": 2},
+    ]
+
+
+def test_concurrent_submit_returns_existing_job(mongo, monkeypatch):
+    service = GenerationJobService(mongo)
+    service.job_dao.ensure_indexes()
+    scheduled = []
+    monkeypatch.setattr(service, "_schedule", scheduled.append)
+    first = service.submit("next_chapter", "n1", 1, {})
+
+    # 另一请求的检查发生在 first 写入之前：写入时由唯一索引拦下。
+    find_active = service.job_dao.find_active
+    misses = [None]
+    monkeypatch.setattr(
+        service.job_dao, "find_active",
+        lambda *args: misses.pop() if misses else find_active(*args)
+    )
+    assert service.submit("next_chapter", "n1", 1, {})["_id"] == first["_id"]
+    assert scheduled == [first["_id"]]
+    assert mongo.collection("generation_jobs").count_documents({}) == 1
+
+    # 任务结束后可以再次提交。
+    service.job_dao.finish(first["_id"], JOB_SUCCEEDED)
+    assert service.submit("next_chapter", "n1", 1, {})["_id"] != first["_id"]
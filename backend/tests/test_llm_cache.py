@@ -0,0 +1,110 @@
+"""LLM 响应缓存：被下游拒绝的响应被删除，重试不回放缓存。"""
+
+import types
+
+import pytest
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+from official_proj.schema.json_tasks import WritingTaskOutput
+from official_proj.services.llm_cache import (
+    CachedChatCompletions,
+    LLMResponseCache,
+    bypass_response_cache,
+    reject_cached_response,
+)
+from official_proj.services.streaming_openai import DashScopeOpenAICompletion
+
+GOOD = 'Final Answer: {"chapter_title": "第二稿", "content": "第二稿正文"}'
+BAD = 'Final Answer: {"title": "第一稿", "content": "第一稿正文"}'
+
+
+class _Provider:
+    """按顺序返回预设输出的 chat.completions。"""
+
+    def __init__(self, *texts: str):
+        self.texts = list(texts)
+        self.requests = 0
+
+    def create(self, **params):
+        self.requests += 1
+        text = self.texts.pop(0)
+        if params.get("stream"):
+            return iter(_chunks(text))
+        return ChatCompletion(
+            id="c", object="chat.completion", created=0, model="m",
+            choices=[{
+                "index": 0, "finish_reason": "stop",
+                "message": {"role": "assistant", "content": text},
+            }],
+        )
+
+
+def _chunks(text: str, size: int = 5) -> list[ChatCompletionChunk]:
+    return [
+        ChatCompletionChunk(
+            id="c", object="chat.completion.chunk", created=0, model="m",
+            choices=[{"index": 0, "delta": {"content": text[i:i + size]}, "finish_reason": None}],
+        )
+        for i in range(0, len(text), size)
+    ]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return LLMResponseCache(tmp_path / "llm_cache.sqlite3")
+
+
+PARAMS = {"model": "m", "messages": [{"role": "user", "content": "写"}]}
+
+
+def _content(response) -> str:
+    return response.choices[0].message.content
+
+
+def test_rejected_response_is_not_served_again(cache):
+    provider = _Provider("第一稿", "第二稿")
+    completions = CachedChatCompletions(provider, cache)
+    assert _content(completions.create(**PARAMS)) == "第一稿"
+    assert _content(completions.create(**PARAMS)) == "第一稿"
+    assert provider.requests == 1
+
+    reject_cached_response()
+    assert _content(completions.create(**PARAMS)) == "第二稿"
+    assert provider.requests == 2
+    assert cache.stats()["rejections"] == 1
+
+
+def test_bypass_skips_lookup_but_stores(cache):
+    provider = _Provider("第一稿", "第二稿")
+    completions = CachedChatCompletions(provider, cache)
+    completions.create(**PARAMS)
+    with bypass_response_cache():
+        assert _content(completions.create(**PARAMS)) == "第二稿"
+    assert _content(completions.create(**PARAMS)) == "第二稿"
+    assert provider.requests == 2
+
+
+def test_structured_retry_does_not_replay_rejected_stream(cache):
+    params = {**PARAMS, "stream": True}
+    # 上一次运行缓存了一个结构错误的流式响应。
+    provider = _Provider(BAD, GOOD)
+    completions = CachedChatCompletions(provider, cache)
+    list(completions.create(**params))
+    assert provider.requests == 1
+
+    llm = DashScopeOpenAICompletion(
+        model="m", api_key="k", base_url="http://127.0.0.1/dashscope.aliyuncs.com/v1"
+    )
+    llm.client = types.SimpleNamespace(chat=types.SimpleNamespace(completions=completions))
+    emitted: list[str] = []
+    llm._emit_stream_chunk_event = lambda chunk, **kwargs: emitted.append(chunk)
+    task = types.SimpleNamespace(output_pydantic=WritingTaskOutput, name="writing_task", id="t")
+
+    llm._handle_streaming_completion(dict(params), from_task=task)
+    assert "".join(emitted) == GOOD
+    assert provider.requests == 2
+    # 缓存中的是新的响应。
+    replay = "".join(
+        chunk.choices[0].delta.content for chunk in completions.create(**params)
+    )
+    assert replay == GOOD
@@ -0,0 +1,91 @@
+"""LLMScheduler.acquire_async：在事件循环上排队，取消或超时时离开队列且不占名额。"""
+
+import asyncio
+import threading
+
+import pytest
+
+from official_proj.services.llm_scheduler import LLMQueueTimeout, LLMScheduler
+
+
+def test_waits_on_the_loop_and_is_admitted_on_release():
+    async def main():
+        scheduler = LLMScheduler(max_concurrency=1, tokens_per_minute=0, queue_timeout=5)
+        held = await scheduler.acquire_async("a", 1)
+        threads = threading.active_count()
+        waiting = [asyncio.create_task(scheduler.acquire_async("b", 1)) for _ in range(20)]
+        await asyncio.sleep(0.05)
+        # 排队不占用线程。
+        assert threading.active_count() == threads
+        assert scheduler.stats()["queue_depth"] == 20
+
+        # 从其他线程交回名额，也能唤醒事件循环上的等待者。
+        threading.Thread(target=scheduler.release, args=(held,)).start()
+        for task in waiting:
+            ticket = await asyncio.wait_for(task, 1)
+            scheduler.release(ticket)
+        assert scheduler.stats()["in_flight"] == 0
+
+    asyncio.run(main())
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def main():
+        scheduler = LLMScheduler(max_concurrency=1, tokens_per_minute=0, queue_timeout=5)
+        held = await scheduler.acquire_async("a", 1)
+        cancelled = asyncio.create_task(scheduler.acquire_async("a", 1))
+        waiting = asyncio.create_task(scheduler.acquire_async("b", 1))
+        await asyncio.sleep(0.01)
+
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        assert scheduler.stats()["queue_by_tenant"] == {"b": 1}
+
+        scheduler.release(held)
+        ticket = await asyncio.wait_for(waiting, 1)
+        assert ticket.tenant == "b"
+        scheduler.release(ticket)
+        assert scheduler.stats()["in_flight"] == 0
+
+    asyncio.run(main())
+
+
+def test_queue_timeout():
+    async def main():
+        scheduler = LLMScheduler(max_concurrency=1, tokens_per_minute=0, queue_timeout=0.05)
+        await scheduler.acquire_async("a", 1)
+        with pytest.raises(LLMQueueTimeout):
+            await scheduler.acquire_async("b", 1)
+        stats = scheduler.stats()
+        assert stats["queue_depth"] == 0 and stats["timeouts"] == 1
+
+    asyncio.run(main())
+
+
+def test_sync_and_async_waiters_share_the_queue():
+    scheduler = LLMScheduler(max_concurrency=1, tokens_per_minute=0, queue_timeout=5)
+    held = scheduler.acquire("a", 1)
+    admitted = []
+
+    def sync_caller():
+        ticket = scheduler.acquire("sync", 1)
+        admitted.append(ticket.tenant)
+        scheduler.release(ticket)
+
+    async def main():
+        waiting = asyncio.create_task(scheduler.acquire_async("async", 1))
+        await asyncio.sleep(0.01)
+        thread = threading.Thread(target=sync_caller)
+        thread.start()
+        await asyncio.sleep(0.05)
+        scheduler.release(held)
+        ticket = await asyncio.wait_for(waiting, 1)
+        admitted.append(ticket.tenant)
+        scheduler.release(ticket)
+        await asyncio.to_thread(thread.join, 1)
+
+    asyncio.run(main())
+    # 先排队的异步请求先放行，之后轮到同步请求。
+    assert admitted == ["async", "sync"]
+    assert scheduler.stats()["in_flight"] == 0
@@ -0,0 +1,77 @@
+"""用量记录：DashScope 与其他 OpenAI 兼容接口的 profile 都应写入 llm_profile 等标签。"""
+
+import types
+
+import pytest
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+from official_proj.services import llm_factory, llm_usage
+from official_proj.services.streaming_openai import (
+    DashScopeOpenAICompletion,
+    MeteredOpenAICompletion,
+)
+
+USAGE = {"prompt_tokens": 7, "completion_tokens": 3, "total_tokens": 10}
+
+
+def _completion(**params):
+    if params.get("stream"):
+        return iter([
+            ChatCompletionChunk(
+                id="c", object="chat.completion.chunk", created=0, model=params["model"],
+                choices=[{"index": 0, "delta": {"content": "一句话"}, "finish_reason": None}],
+            ),
+            ChatCompletionChunk(
+                id="c", object="chat.completion.chunk", created=0, model=params["model"],
+                choices=[], usage=USAGE,
+            ),
+        ])
+    return ChatCompletion(
+        id="c", object="chat.completion", created=0, model=params["model"],
+        choices=[{
+            "index": 0, "finish_reason": "stop",
+            "message": {"role": "assistant", "content": "一句话"},
+        }],
+        usage=USAGE,
+    )
+
+
+@pytest.fixture
+def records(monkeypatch):
+    docs: list[dict] = []
+    monkeypatch.setattr(llm_usage, "LLM_USAGE_ENABLED", True)
+    monkeypatch.setattr(
+        llm_usage, "get_usage_recorder", lambda: types.SimpleNamespace(record=docs.append)
+    )
+    monkeypatch.setattr(llm_factory, "_templates", {})
+    monkeypatch.setenv("MODEL", "qwen-plus")
+    monkeypatch.setenv("OPENAI_API_KEY", "k")
+    monkeypatch.setenv("OPENAI_API_BASE", "http://127.0.0.1/dashscope.aliyuncs.com/compatible-mode/v1")
+    monkeypatch.setattr(llm_factory, "LLM_PROFILES", {
+        "fast": {"model": "gpt-4o-mini", "base_url": "http://127.0.0.1/v1"},
+    })
+    return docs
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_profile_is_recorded_for_both_providers(records, stream):
+    llms = llm_factory.TaskLLMs(usage_tags={"novel_id": "n1", "chapter_number": 3})
+    default = llms.for_task("writing_task")
+    fast = llms.for_task("chapter_review_task")
+    assert type(default) is DashScopeOpenAICompletion
+    assert type(fast) is MeteredOpenAICompletion
+
+    for llm in (default, fast):
+        llm.client = types.SimpleNamespace(chat=types.SimpleNamespace(
+            completions=types.SimpleNamespace(create=_completion)
+        ))
+        llm.stream = stream
+        assert llm.call("写一句话") == "一句话"
+
+    assert [(doc["llm_profile"], doc["model"]) for doc in records] == [
+        ("default", "qwen-plus"), ("fast", "gpt-4o-mini"),
+    ]
+    for doc in records:
+        assert doc["novel_id"] == "n1"
+        assert doc["streamed"] is stream
+        assert doc["prompt_tokens"] == 7 and doc["completion_tokens"] == 3
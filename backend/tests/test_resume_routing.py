@@ -0,0 +1,42 @@
+"""续传请求落到没有该会话的 worker：区分进行中的生成与无可续传的生成。"""
+
+from official_proj.api.routers import novel
+from official_proj.services.generation_guard import NovelGenerationGuard
+from official_proj.services.generation_job_service import GenerationJobService
+
+
+def _setup(mongo, monkeypatch):
+    guard = NovelGenerationGuard(mongo)
+    jobs = GenerationJobService(mongo)
+    monkeypatch.setattr(novel, "generation_guard", guard)
+    monkeypatch.setattr(novel, "job_service", jobs)
+    return guard, jobs
+
+
+def test_no_lease_is_not_found(mongo, monkeypatch):
+    _setup(mongo, monkeypatch)
+    assert novel._resume_unavailable("n1", 1).status_code == 404
+
+
+def test_job_holder_points_at_job_events(mongo, monkeypatch):
+    guard, jobs = _setup(mongo, monkeypatch)
+    job = jobs.job_dao.create("n1", 1, "next_chapter", {})
+    guard.acquire("n1", job["_id"], "next_chapter")
+
+    error = novel._resume_unavailable("n1", 1)
+    assert error.status_code == 409
+    assert error.headers == {"Location": f"/jobs/{job['_id']}/events"}
+    # 其他用户看不到任务 id。
+    assert "Location" not in (novel._resume_unavailable("n1", 2).headers or {})
+
+
+def test_stream_on_another_worker_is_conflict(mongo, monkeypatch):
+    guard, _ = _setup(mongo, monkeypatch)
+    guard.acquire("n1", "generation-on-worker-b", "next_chapter")
+
+    error = novel._resume_unavailable("n1", 1)
+    assert error.status_code == 409
+    assert "worker" in error.detail
+
+    guard.release("n1", "generation-on-worker-b")
+    assert novel._resume_unavailable("n1", 1).status_code == 404
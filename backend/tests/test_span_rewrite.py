@@ -0,0 +1,70 @@
+"""apply_paragraph_edits：只替换改动的段落区间，其余文字逐字节保持原样。"""
+
+import pytest
+
+from official_proj.crews.span_rewrite import apply_paragraph_edits, split_paragraphs
+from official_proj.schema.json_tasks import ParagraphEdit
+
+CHAPTER = (
+    "　　夜色漫过旧城码头。\n"
+    "\n"
+    "　　他没有回头。  \n"
+    "　　“你早就知道了？”\n"
+    "\n"
+    "\n"
+    "　　钟声远去。\n"
+)
+
+
+def _edit(start: int, end: int, content: str) -> ParagraphEdit:
+    return ParagraphEdit(start=start, end=end, issue="节奏拖沓", content=content)
+
+
+def test_untouched_text_is_preserved():
+    content, spans = apply_paragraph_edits(CHAPTER, [_edit(2, 2, "他回头看了一眼。")])
+    assert content == CHAPTER.replace("　　他没有回头。", "　　他回头看了一眼。")
+    assert spans[0].original == "　　他没有回头。"
+    assert spans[0].rewritten == "　　他回头看了一眼。"
+
+
+def test_multi_paragraph_span_keeps_layout_and_original_slice():
+    content, spans = apply_paragraph_edits(CHAPTER, [_edit(2, 3, "第一段。\n\n　　第二段。\n第三段。")])
+    assert spans[0].original == "　　他没有回头。  \n　　“你早就知道了？”"
+    # 区间内的段间分隔沿用原文（单换行，去掉行尾空白），缩进沿用首段。
+    assert content == (
+        "　　夜色漫过旧城码头。\n"
+        "\n"
+        "　　第一段。\n　　第二段。\n　　第三段。\n"
+        "\n"
+        "\n"
+        "　　钟声远去。\n"
+    )
+
+
+def test_several_edits_and_last_paragraph():
+    content, spans = apply_paragraph_edits(
+        CHAPTER, [_edit(4, 4, "钟声停了。"), _edit(1, 1, "雨落在码头。")]
+    )
+    assert [span.start for span in spans] == [1, 4]
+    assert content == (
+        CHAPTER.replace("夜色漫过旧城码头。", "雨落在码头。").replace("钟声远去。", "钟声停了。")
+    )
+    assert split_paragraphs(content)[1:3] == split_paragraphs(CHAPTER)[1:3]
+
+
+def test_crlf_and_unindented_text():
+    chapter = "第一段。\r\n\r\n第二段。\r\n\r\n第三段。"
+    content, _ = apply_paragraph_edits(chapter, [_edit(2, 2, "新的第二段。\n再补一段。")])
+    assert content == "第一段。\r\n\r\n新的第二段。\r\n\r\n再补一段。\r\n\r\n第三段。"
+
+
+@pytest.mark.parametrize("edits", [
+    [],
+    [_edit(0, 1, "x")],
+    [_edit(3, 5, "x")],
+    [_edit(2, 1, "x")],
+    [_edit(1, 2, "x"), _edit(2, 3, "y")],
+])
+def test_invalid_edits_raise(edits):
+    with pytest.raises(ValueError):
+        apply_paragraph_edits(CHAPTER, edits)
@@ -0,0 +1,149 @@
+"""ChapterJsonStreamParser：任意切分 chunk 的解析结果应与 json.loads 一致；coalesce_events 的合并与关闭。"""
+
+import asyncio
+import json
+import random
+
+import pytest
+
+from official_proj.services.streaming_helpers import ChapterJsonStreamParser, coalesce_events
+
+SAMPLES = [
+    {"chapter_title": "第1章 血夜萤火", "content": "夜色像潮水一样漫过旧城码头。\n\n他没有回头。"},
+    # 各类转义：引号、反斜杠、斜杠、控制字符。
+    {"chapter_title": "“引号”与\"转义\"", "content": 'a\\b/c\td\re\bf\fg "h" \\\\n 末尾\\'},
+    # 代理对（ensure_ascii 时为 😀 形式）与 BMP 外的汉字。
+    {"chapter_title": "星辰😀", "content": "🌙月光𠀀照在🗡️上， 行分隔符"},
+    {"chapter_title": "", "content": ""},
+    # 正文中出现与键同名的文字。
+    {"chapter_title": "content", "content": '他写下 "chapter_title": 与 "content" 两个词。'},
+]
+
+
+def _split(text: str, rng: random.Random) -> list[str]:
+    """随机切分为 1~8 个字符的片段。"""
+    chunks, i = [], 0
+    while i < len(text):
+        size = rng.randint(1, 8)
+        chunks.append(text[i:i + size])
+        i += size
+    return chunks
+
+
+def _parse(chunks: list[str]) -> tuple[str | None, str]:
+    parser = ChapterJsonStreamParser()
+    title, deltas = None, []
+    for chunk in chunks:
+        chunk_title, delta = parser.feed(chunk)
+        if chunk_title is not None:
+            assert title is None, "标题只应输出一次"
+            title = chunk_title
+        deltas.append(delta)
+    return title, "".join(deltas)
+
+
+def _documents(sample: dict):
+    for ensure_ascii in (False, True):
+        body = json.dumps(sample, ensure_ascii=ensure_ascii)
+        yield body
+        yield "Thought: 我已掌握足够信息。\nFinal Answer: " + body
+        yield "```json\n" + json.dumps(sample, ensure_ascii=ensure_ascii, indent=2) + "\n```"
+
+
+@pytest.mark.parametrize("sample", SAMPLES)
+def test_matches_json_loads_on_random_splits(sample):
+    rng = random.Random(1234)
+    for document in _documents(sample):
+        expected = json.loads(document[document.index("{"):document.rindex("}") + 1])
+        for _ in range(200):
+            title, content = _parse(_split(document, rng))
+            assert title == expected["chapter_title"]
+            assert content == expected["content"]
+
+
+@pytest.mark.parametrize("sample", SAMPLES)
+def test_single_character_chunks(sample):
+    document = json.dumps(sample, ensure_ascii=True)
+    title, content = _parse(list(document))
+    assert (title, content) == (sample["chapter_title"], sample["content"])
+
+
+def test_key_split_across_chunks():
+    document = json.dumps({"chapter_title": "标题", "content": "正文"}, ensure_ascii=False)
+    for cut in range(1, len(document)):
+        assert _parse([document[:cut], document[cut:]]) == ("标题", "正文")
+
+
+def test_unicode_escape_split_inside_surrogate_pair():
+    document = json.dumps({"chapter_title": "t", "content": "x😀y"}, ensure_ascii=True)
+    start = document.index("\\ud83d")
+    for cut in range(start, start + 12):
+        assert _parse([document[:cut], document[cut:]]) == ("t", "x😀y")
+
+
+def test_reset_discards_partial_state():
+    parser = ChapterJsonStreamParser()
+    parser.feed('{"chapter_title": "第一稿", "content": "半截\\u4e')
+    parser.reset()
+    assert parser.feed('{"chapter_title": "第二稿", "content": "完整"}') == ("第二稿", "完整")
+
+
+# ---------- coalesce_events ----------
+
+def _upstream(closed: list, events: list[dict], hang: bool = False):
+    async def gen():
+        try:
+            for event in events:
+                yield event
+            if hang:
+                await asyncio.Event().wait()
+        finally:
+            closed.append(True)
+    return gen()
+
+
+def test_coalesce_merges_deltas_and_flushes_on_other_events():
+    events = [
+        {"type": "title", "data": "标题"},
+        {"type": "content_delta", "data": "夜"},
+        {"type": "content_delta", "data": "色"},
+        {"type": "final", "data": {}},
+    ]
+
+    async def main():
+        closed: list = []
+        out = [e async for e in coalesce_events(_upstream(closed, events), max_delay=10)]
+        return out, list(closed)
+
+    out, closed = asyncio.run(main())
+    assert out == [events[0], {"type": "content_delta", "data": "夜色"}, events[3]]
+    assert closed == [True]
+
+
+def test_coalesce_closes_upstream_when_consumer_stops_early():
+    async def main():
+        closed: list = []
+        coalesced = coalesce_events(_upstream(closed, [{"type": "title", "data": "t"}] * 3))
+        assert (await coalesced.__anext__())["type"] == "title"
+        await coalesced.aclose()
+        # 复制一份：asyncio.run 退出前会回收未关闭的异步生成器。
+        return list(closed)
+
+    assert asyncio.run(main()) == [True]
+
+
+def test_coalesce_closes_upstream_with_read_in_flight():
+    async def main():
+        closed: list = []
+        upstream = _upstream(closed, [{"type": "content_delta", "data": "半"}], hang=True)
+        coalesced = coalesce_events(upstream, max_delay=0.01)
+        # 缓冲超时后发送，此时对上游的读取仍在等待。
+        assert await coalesced.__anext__() == {"type": "content_delta", "data": "半"}
+        consumer = asyncio.ensure_future(coalesced.__anext__())
+        await asyncio.sleep(0.01)
+        consumer.cancel()
+        await asyncio.gather(consumer, return_exceptions=True)
+        await coalesced.aclose()
+        return list(closed)
+
+    assert asyncio.run(main()) == [True]
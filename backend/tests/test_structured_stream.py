@@ -0,0 +1,121 @@
+"""流式结构化输出：确认前暂存、确认前出错才重试，被中断的尝试不向外发送。"""
+
+import types
+
+import pytest
+from openai.types.chat import ChatCompletionChunk
+
+from official_proj.schema.json_tasks import WritingTaskOutput
+from official_proj.services.streaming_openai import DashScopeOpenAICompletion
+from official_proj.services.structured_stream import (
+    StructuredStreamError,
+    StructuredStreamValidator,
+)
+
+GOOD = 'Final Answer: {"chapter_title": "第二稿", "content": "第二稿正文"}'
+
+
+def _feed(validator: StructuredStreamValidator, text: str, size: int = 3) -> None:
+    for i in range(0, len(text), size):
+        validator.feed(text[i:i + size])
+
+
+def test_unknown_key_before_commit_raises():
+    validator = StructuredStreamValidator(WritingTaskOutput)
+    with pytest.raises(StructuredStreamError):
+        _feed(validator, '{"title": "第一稿"')
+    assert not validator.committed
+
+
+def test_commits_once_required_keys_seen():
+    validator = StructuredStreamValidator(WritingTaskOutput)
+    _feed(validator, 'Thought: 想一想\nFinal Answer: {"chapter_title": "稿", "content"')
+    assert validator.committed
+    # 确认后不再中断。
+    _feed(validator, ': "正文", "bogus": 1}')
+
+
+def test_missing_required_after_close_does_not_raise():
+    validator = StructuredStreamValidator(WritingTaskOutput)
+    _feed(validator, '{"chapter_title": "稿"}')
+    assert validator.committed
+
+
+def test_commits_after_hold_limit():
+    validator = StructuredStreamValidator(WritingTaskOutput, hold_limit=20)
+    _feed(validator, '{"content": "' + "很长的正文" * 10)
+    assert validator.committed
+
+
+def _chunks(text: str, size: int = 5):
+    for i in range(0, len(text), size):
+        yield ChatCompletionChunk(
+            id="c", object="chat.completion.chunk", created=0, model="m",
+            choices=[{"index": 0, "delta": {"content": text[i:i + size]}, "finish_reason": None}],
+        )
+
+
+def _stream(texts: list[str]) -> tuple[str, int]:
+    """依次以 texts 作为各次尝试的输出，返回发送给监听者的全部文字与请求次数。"""
+    llm = DashScopeOpenAICompletion(
+        model="m", api_key="k", base_url="http://127.0.0.1/dashscope.aliyuncs.com/v1"
+    )
+    pending = list(texts)
+    requests = []
+
+    def create(**params):
+        requests.append(params)
+        return _chunks(pending.pop(0))
+
+    llm.client = types.SimpleNamespace(chat=types.SimpleNamespace(
+        completions=types.SimpleNamespace(create=create)
+    ))
+    emitted: list[str] = []
+    llm._emit_stream_chunk_event = lambda chunk, **kwargs: emitted.append(chunk)
+    task = types.SimpleNamespace(output_pydantic=WritingTaskOutput, name="writing_task", id="t")
+    llm._handle_streaming_completion(
+        {"messages": [{"role": "user", "content": "写"}], "stream": True}, from_task=task
+    )
+    return "".join(emitted), len(requests)
+
+
+def test_aborted_attempt_is_never_emitted():
+    emitted, requests = _stream(['Final Answer: {"title": "第一稿", "content": "第一稿正文"}', GOOD])
+    assert requests == 2
+    assert emitted == GOOD
+
+
+def test_late_structure_error_keeps_streaming():
+    late = 'Final Answer: {"chapter_title": "稿", "content": "正文", "bogus": 1}'
+    emitted, requests = _stream([late, GOOD])
+    assert requests == 1
+    assert emitted == late
+
+
+def test_handler_error_closes_stream():
+    llm = DashScopeOpenAICompletion(
+        model="m", api_key="k", base_url="http://127.0.0.1/dashscope.aliyuncs.com/v1"
+    )
+    closed = []
+
+    class _Stream:
+        def __iter__(self):
+            return _chunks(GOOD)
+
+        def close(self):
+            closed.append(True)
+
+    llm.client = types.SimpleNamespace(chat=types.SimpleNamespace(
+        completions=types.SimpleNamespace(create=lambda **params: _Stream())
+    ))
+
+    def emit(chunk, **kwargs):
+        raise RuntimeError("listener failed")
+
+    llm._emit_stream_chunk_event = emit
+    task = types.SimpleNamespace(output_pydantic=WritingTaskOutput, name="writing_task", id="t")
+    with pytest.raises(RuntimeError):
+        llm._handle_streaming_completion(
+            {"messages": [{"role": "user", "content": "写"}], "stream": True}, from_task=task
+        )
+    assert closed == [True]
@@ -0,0 +1,104 @@
+"""任务级断点：完成的任务输出可还原，重试只执行剩余任务。"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from crewai.tasks.output_format import OutputFormat
+from crewai.tasks.task_output import TaskOutput
+
+from official_proj.crews.chapter_crew import ChapterCrew
+from official_proj.schema.json_tasks import ChapterReviewOutput, WritingTaskOutput
+from official_proj.services.task_checkpoint import TaskCheckpointStore, chapter_run_id
+
+INPUTS = {"novel_id": "n1", "chapter_number": 3, "world": "废土", "context_stats": {"tokens": 1}}
+
+
+def _output(name: str, model) -> TaskOutput:
+    return TaskOutput(
+        name=name, description="", agent="", raw=model.model_dump_json(),
+        pydantic=model, output_format=OutputFormat.PYDANTIC,
+    )
+
+
+DRAFT = WritingTaskOutput(chapter_title="第三章 归途", content="正文")
+
+
+def _review(score: int) -> ChapterReviewOutput:
+    return ChapterReviewOutput(
+        overall_score=score, world_consistency_score=9, off_topic=False, issues=[], summary="评语"
+    )
+
+
+@pytest.fixture
+def store(mongo):
+    return TaskCheckpointStore(mongo)
+
+
+@pytest.fixture
+def crew_factory(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "k")
+    return ChapterCrew("t", {})
+
+
+def test_run_id_ignores_stats_but_tracks_inputs():
+    run_id = chapter_run_id(INPUTS)
+    assert run_id.startswith("n1:chapter:3:")
+    assert chapter_run_id({**INPUTS, "context_stats": {"tokens": 2}}) == run_id
+    assert chapter_run_id({**INPUTS, "world": "仙侠"}) != run_id
+
+
+def test_saved_outputs_are_restored(store, crew_factory):
+    save = store.callback("r1", "n1")
+    save(_output("writing_task", DRAFT))
+    save(_output("writing_task", DRAFT.model_copy(update={"content": "改过的正文"})))
+    save(_output("unknown_task", DRAFT))
+
+    restored = store.load("r1", crew_factory.output_models())
+    assert list(restored) == ["writing_task"]
+    assert restored["writing_task"].pydantic.content == "改过的正文"
+    assert store.load("r2", crew_factory.output_models()) == {}
+
+    store.clear("r1")
+    assert store.load("r1", crew_factory.output_models()) == {}
+
+
+def test_expired_and_unreadable_checkpoints_rerun(store, crew_factory):
+    save = store.callback("r1", "n1")
+    save(_output("writing_task", DRAFT))
+    save(_output("chapter_review_task", _review(9)))
+    store.dao.col.update_one(
+        {"task_name": "writing_task"},
+        {"$set": {"created_at": datetime.utcnow() - timedelta(days=2)}}
+    )
+    store.dao.col.update_one(
+        {"task_name": "chapter_review_task"}, {"$set": {"json_output": {"summary": 1}}}
+    )
+    assert store.load("r1", crew_factory.output_models()) == {}
+
+
+def test_resume_runs_only_remaining_tasks(crew_factory):
+    # 评审通过：重写与重写评审被跳过，写作阶段已全部完成。
+    completed = {
+        "writing_task": _output("writing_task", DRAFT),
+        "chapter_review_task": _output("chapter_review_task", _review(9)),
+    }
+    assert crew_factory.crew(completed) is None
+
+    # 评审不达标：从重写开始，重写任务不再是条件任务。
+    completed["chapter_review_task"] = _output("chapter_review_task", _review(4))
+    crew = crew_factory.crew(completed)
+    assert [task.name for task in crew.tasks] == ["chapter_rewrite_task", "chapter_rewrite_review_task"]
+    assert not type(crew.tasks[0]).__name__.startswith("Conditional")
+    assert set(completed) == {"writing_task", "chapter_review_task"}
+
+
+def test_stale_checkpoints_after_pending_task_are_dropped(crew_factory):
+    completed = {
+        "chapter_review_task": _output("chapter_review_task", _review(9)),
+        "plot_analysis_task": _output("writing_task", DRAFT),
+    }
+    crew = crew_factory.crew(completed)
+    assert crew.tasks[0].name == "writing_task"
+    # 写作要重跑，之后的评审断点已失效。
+    assert "chapter_review_task" not in completed
+    assert list(crew_factory.post_writing_crews(completed)) == ["memory_update_task"]